@@ -1,14 +1,16 @@
 # common/base_bot.py
-import os, logging
+import asyncio, os, logging
 from discord.ext import commands
-from common.auth import is_premium
 from common.ratelimit import RateLimiter
 from common.feature_flag import FeatureFlagManager
 from common.services.whisper import WhisperService
 from common.services.twitter import TwitterService
 from common.guild_config import FileGuildConfig
 from common.services.openai_api import OpenAIService
+from common.services.http import OPENAI_BASE_URL, warm_up, close_session
 from common.services.auth import PaymentService, PaymentServiceV2
+from common.entitlement import EntitlementResolver
+from common.llm_cache import ResponseCache
 
 class BaseBot(commands.Bot):
     def __init__(self, **kwargs):
@@ -17,34 +19,40 @@ class BaseBot(commands.Bot):
         self.rate_limiter = RateLimiter(db_path="rate.db")
         self.guild_config = FileGuildConfig()
         self.payment_v2 = PaymentServiceV2()
+        self.entitlements = EntitlementResolver(self.guild_config, self.payment_v2, self.cfg, self.rate_limiter)
         # self.add_listener(self.on_ready) # on_readyは自動的に呼ばれるため不要
         # ▼サービスをひとまとめにして子ボットへ渡す
         self.services = {
             "whisper": WhisperService(),
             "twitter": TwitterService(),
-            "openai": OpenAIService(),
+            "openai": OpenAIService(cache=ResponseCache.from_env()),
             "payment": self.payment_v2,
         }
 
+    async def setup_hook(self):
+        # OpenAI への接続を先に張っておき、最初のリクエストでハンドシェイク待ちが発生しないようにする
+        self._warm_up_task = asyncio.create_task(warm_up(OPENAI_BASE_URL))
+
     async def on_ready(self):
         print(f"✅ Logged in as {self.user}")
+        # 参加中ギルドのプランを先読みし、has_access をメモリだけで判定できるようにする
+        await self.entitlements.apreload(guild.id for guild in self.guilds)
+
+    async def close(self):
+        # レート制限の状態を rate.db に書き戻し、ファイル監視・HTTPセッションを止めてから終了
+        await self.rate_limiter.close()
+        self.payment_v2.close()
+        await close_session()
+        await super().close()
 
     # --- 共通ユーティリティ ------------------------
     async def has_access(self, member, feature: str) -> bool:
-        guild_id = getattr(member.guild, "id", None)
-        plan = self.guild_config.get_plan(guild_id) if guild_id else "free"
-        # 例: pro限定機能はfreeならFalse
-        if feature in ["twitter_post", "transcribe"]:
-            if self.payment_v2.is_paid(member.id):
-                return True
-            if plan == "pro":
-                return True
-            return False
-        if not self.cfg.is_enabled(feature):
-            return False
-        if self.cfg.is_premium_only(feature) and not is_premium(member):
-            return False
-        return await self.rate_limiter.check(member.id, feature)
+        # 例: pro限定機能はfreeならFalse（判定ロジックは EntitlementResolver._decide）
+        return await self.entitlements.has_access(member, feature)
+
+    def has_access_many(self, members, feature: str) -> dict:
+        """管理ツール向け: 複数メンバーの利用可否を一括判定（レート制限は消費しない）"""
+        return self.entitlements.check_many(members, feature)
 
     # 子クラス側に「コマンド登録」だけさせる
     def register(self):
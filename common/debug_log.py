@@ -0,0 +1,135 @@
+# common/debug_log.py
+"""
+キュー経由でバックグラウンドスレッドが書き込むデバッグ用ファイルロガー
+
+- 呼び出し側のコストはキューへの投入1回のみ（ファイルは開いたまま、まとめて書き込み）
+- サイズ・経過時間でローテーション
+- キューが混んできたら DEBUG を間引き、さらに混んだら WARNING 未満を破棄
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+_STOP = object()
+
+
+class BufferedFileLogger:
+    def __init__(
+        self,
+        path: str = "debug_insert.log",
+        max_bytes: int = 10 * 1024 * 1024,
+        max_age: float = 86400,
+        backup_count: int = 5,
+        queue_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        debug_sample_rate: int = 10,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.debug_sample_rate = debug_sample_rate
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._soft_limit = queue_size // 2      # ここを超えたら DEBUG を間引く
+        self._hard_limit = queue_size * 9 // 10  # ここを超えたら WARNING 未満を破棄
+        self._debug_seq = 0
+        self.dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # --- 呼び出し側 -------------------------------------
+    def log(self, message: str, level: int = logging.DEBUG):
+        if self._thread is None:
+            self._start()
+        pending = self._queue.qsize()
+        if pending >= self._soft_limit and level < logging.WARNING:
+            if pending >= self._hard_limit:
+                self.dropped += 1
+                return
+            if level <= logging.DEBUG:
+                self._debug_seq += 1
+                if self._debug_seq % self.debug_sample_rate:
+                    self.dropped += 1
+                    return
+        try:
+            self._queue.put_nowait((time.time(), level, message))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # --- 書き込みスレッド ---------------------------------
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="debug-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    def _run(self):
+        self._open()
+        stop = False
+        while not stop:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                while True:
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+        self._file.close()
+
+    def _write(self, batch):
+        lines = []
+        for created, level, message in batch:
+            timestamp = datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+            prefix = "" if level <= logging.DEBUG else f"{logging.getLevelName(level)} "
+            lines.append(f"[{timestamp}] {prefix}{message}\n")
+        if self.dropped:
+            lines.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] DEBUG_LOG: dropped {self.dropped} messages under load\n")
+            self.dropped = 0
+        data = "".join(lines)
+        try:
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data.encode("utf-8"))
+            if self._size >= self.max_bytes or (self._size and time.time() - self._opened_at >= self.max_age):
+                self._rotate()
+        except Exception as e:
+            print(f"Debug log error: {e}")
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+        self._open()
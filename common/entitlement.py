@@ -0,0 +1,88 @@
+# common/entitlement.py
+"""
+BaseBot.has_access 用の権限リゾルバ
+
+ギルドのプランを起動時にまとめて読み込み、(プラン, 有料, プレミアム, 機能) ごとの
+判定結果をテーブルにメモ化する。プラン変更は FileGuildConfig.set_plan から通知され、
+有料状態は PaymentServiceV2 のキャッシュ（set_paid/set_free で更新）から取得する。
+"""
+import asyncio
+import logging
+from typing import Iterable
+
+from common.auth import is_premium
+
+logger = logging.getLogger(__name__)
+
+# 有料ユーザー または proプランのギルドでのみ使える機能
+PAID_FEATURES = ("twitter_post", "transcribe")
+
+
+class EntitlementResolver:
+    def __init__(self, guild_config, payment, flags, rate_limiter):
+        self.guild_config = guild_config
+        self.payment = payment
+        self.flags = flags
+        self.rate_limiter = rate_limiter
+        self._plans = {}   # guild_id -> plan
+        self._table = {}   # (plan, paid, premium, feature) -> bool
+        guild_config.add_listener(self.on_plan_changed)
+
+    # --- プラン -----------------------------------------
+    def preload(self, guild_ids: Iterable[int]):
+        for guild_id in guild_ids:
+            self._plans[guild_id] = self.guild_config.get_plan(guild_id)
+        logger.info(f"EntitlementResolver: preloaded plans for {len(self._plans)} guilds")
+
+    async def apreload(self, guild_ids: Iterable[int]):
+        await asyncio.to_thread(self.preload, list(guild_ids))
+
+    def plan_for(self, guild_id) -> str:
+        if guild_id is None:
+            return "free"
+        plan = self._plans.get(guild_id)
+        if plan is None:
+            plan = self._plans[guild_id] = self.guild_config.get_plan(guild_id)
+        return plan
+
+    def on_plan_changed(self, guild_id, plan: str):
+        self._plans[guild_id] = plan
+
+    def clear(self):
+        """機能フラグの設定変更時などに判定テーブルを作り直す"""
+        self._table.clear()
+
+    # --- 判定 -------------------------------------------
+    def _decide(self, plan: str, paid: bool, premium: bool, feature: str) -> bool:
+        if feature in PAID_FEATURES:
+            return paid or plan == "pro"
+        if not self.flags.is_enabled(feature):
+            return False
+        if self.flags.is_premium_only(feature) and not premium:
+            return False
+        return True
+
+    def allowed(self, member, feature: str) -> bool:
+        """レート制限を除いた判定（メモリのみ）"""
+        plan = self.plan_for(getattr(getattr(member, "guild", None), "id", None))
+        paid = self.payment.is_paid(member.id)
+        premium = is_premium(member)
+        key = (plan, paid, premium, feature)
+        decision = self._table.get(key)
+        if decision is None:
+            decision = self._table[key] = self._decide(plan, paid, premium, feature)
+        return decision
+
+    async def has_access(self, member, feature: str) -> bool:
+        if not self.allowed(member, feature):
+            return False
+        if feature in PAID_FEATURES:
+            return True
+        return await self.rate_limiter.check(member.id, feature)
+
+    def check_many(self, members: Iterable, feature: str) -> dict:
+        """
+        複数メンバーの利用可否をまとめて判定（管理ツール向け）
+        レート制限は消費しない
+        """
+        return {member.id: self.allowed(member, feature) for member in members}
@@ -0,0 +1,57 @@
+# common/expiry.py
+"""
+キーごとの有効期限を min-heap で管理するインデックス
+
+期限切れの取り出しは期限の近い順に必要な分だけ行うため、
+マップ全体を走査せずに O(k log n) で掃除できる。
+"""
+import heapq
+import time
+from typing import Hashable, List, Optional
+
+
+class ExpiryIndex:
+    def __init__(self):
+        self._heap = []        # (expires_at, key) ※再設定・削除済みの古いエントリを含む
+        self._deadlines = {}   # key -> 最新の expires_at
+        self.evicted = 0       # これまでに期限切れで取り出したキー数
+
+    def set(self, key: Hashable, expires_at: float):
+        if self._deadlines.get(key) == expires_at:
+            return  # 日次カウンタのように同じ期限で何度も更新されるキーは積み直さない
+        self._deadlines[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+        self._maybe_rebuild()
+
+    def discard(self, key: Hashable):
+        self._deadlines.pop(key, None)
+        self._maybe_rebuild()
+
+    def pop_expired(self, now: Optional[float] = None) -> List[Hashable]:
+        """期限切れのキーをインデックスから取り除いて返す"""
+        now = time.time() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) != expires_at:
+                continue  # 再設定・削除済み
+            del self._deadlines[key]
+            expired.append(key)
+        self.evicted += len(expired)
+        return expired
+
+    def _maybe_rebuild(self):
+        # 古いエントリが溜まりすぎたらヒープを作り直してメモリを抑える
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(t, k) for k, t in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._deadlines),
+            "heap_size": len(self._heap),
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,234 @@
+# common/extraction_cache.py
+"""
+添付ファイルの抽出結果キャッシュ（文字起こし・PDF テキスト）
+
+- キーは添付ファイルのバイト列の SHA-256 と種類（"transcript" / "pdf"）
+- Discord の添付ID → SHA-256 の対応も覚えておき、同じ添付ならダウンロード前に結果を返せる
+- 本文は gzip 圧縮して1件1ファイルで保存し、メモリには索引（キー・サイズ・LRU順）だけを持つ
+- ディスク上の合計が max_bytes を超えたら、最後に使われてから長いものから 90% まで削除
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, directory="cache/extract", max_bytes: int = 200 * 1024 * 1024, metrics=None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # (digest, kind) -> 圧縮後サイズ（先頭が最も古い）
+        self._aliases = {}           # (attachment_id, kind) -> digest
+        self._bytes = 0
+        self.id_hits = 0
+        self.hash_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls, metrics=None):
+        """EXTRACTION_CACHE=0 で無効（None）"""
+        if os.getenv("EXTRACTION_CACHE", "1").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            directory=os.getenv("EXTRACTION_CACHE_DIR", "cache/extract"),
+            max_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024))),
+            metrics=metrics,
+        )
+
+    def _path(self, digest: str, kind: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.{kind}.gz"
+
+    @property
+    def _alias_path(self) -> Path:
+        return self.directory / "aliases.tsv"
+
+    # --- 起動時の索引構築 ---------------------------------
+    def _load(self):
+        entries = []
+        for path in self.directory.glob("*/*.gz"):
+            digest, kind = path.name[:-3].split(".", 1)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, digest, kind, stat.st_size))
+        for _, digest, kind, size in sorted(entries):
+            self._index[(digest, kind)] = size
+            self._bytes += size
+
+        # 添付IDの対応表は追記型。読み込み時に既に無いエントリへの対応を除いて書き直す
+        try:
+            lines = self._alias_path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            parts = line.split("\t")
+            if len(parts) == 3 and (parts[1], parts[2]) in self._index:
+                self._aliases[(parts[0], parts[2])] = parts[1]
+        if len(self._aliases) != len(lines):
+            self._write_aliases()
+
+    def _write_aliases(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for (attachment_id, kind), digest in self._aliases.items():
+                f.write(f"{attachment_id}\t{digest}\t{kind}\n")
+        os.replace(tmp, self._alias_path)
+
+    # --- 同期API（ディスクI/Oあり） ------------------------
+    def digest_for(self, attachment_id, kind: str) -> Optional[str]:
+        with self._lock:
+            return self._aliases.get((str(attachment_id), kind))
+
+    def get_by_id(self, attachment_id, kind: str) -> Optional[str]:
+        """添付IDで引く（ダウンロード前の事前チェック）。無ければ記録せずに None"""
+        digest = self.digest_for(attachment_id, kind)
+        if digest is None:
+            return None
+        text = self._read(digest, kind)
+        if text is not None:
+            self._record("id_hit")
+        return text
+
+    def get(self, digest: str, kind: str, attachment_id=None) -> Optional[str]:
+        text = self._read(digest, kind)
+        if text is None:
+            self._record("miss")
+            return None
+        self._record("hash_hit")
+        if attachment_id is not None:
+            self._link(attachment_id, digest, kind)
+        return text
+
+    def put(self, digest: str, kind: str, text: str, attachment_id=None):
+        path = self._path(digest, kind)
+        data = gzip.compress(text.encode("utf-8"), compresslevel=6)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"ExtractionCache: failed to write {path}: {e}")
+            return
+        with self._lock:
+            self._bytes += len(data) - self._index.pop((digest, kind), 0)
+            self._index[(digest, kind)] = len(data)
+            over = self._bytes > self.max_bytes
+        if attachment_id is not None:
+            self._link(attachment_id, digest, kind)
+        if over:
+            self._evict()
+
+    # --- 非同期API（ディスクI/Oはスレッドで実行） ------------
+    async def aget_by_id(self, attachment_id, kind: str) -> Optional[str]:
+        if self.digest_for(attachment_id, kind) is None:
+            return None
+        return await asyncio.to_thread(self.get_by_id, attachment_id, kind)
+
+    async def aget(self, digest: str, kind: str, attachment_id=None) -> Optional[str]:
+        with self._lock:
+            known = (digest, kind) in self._index
+        if not known:
+            self._record("miss")
+            return None
+        return await asyncio.to_thread(self.get, digest, kind, attachment_id)
+
+    async def aput(self, digest: str, kind: str, text: str, attachment_id=None):
+        await asyncio.to_thread(self.put, digest, kind, text, attachment_id)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._index),
+            "disk_bytes": self._bytes,
+            "id_hits": self.id_hits,
+            "hash_hits": self.hash_hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+    # --- 内部 -------------------------------------------
+    def _read(self, digest, kind) -> Optional[str]:
+        path = self._path(digest, kind)
+        try:
+            text = gzip.decompress(path.read_bytes()).decode("utf-8")
+            os.utime(path)  # 再起動後も LRU 順を保つ
+        except FileNotFoundError:
+            self._forget(digest, kind)
+            return None
+        except (OSError, EOFError, gzip.BadGzipFile) as e:
+            logger.warning(f"ExtractionCache: failed to read {path}: {e}")
+            return None
+        with self._lock:
+            if (digest, kind) in self._index:
+                self._index.move_to_end((digest, kind))
+        return text
+
+    def _link(self, attachment_id, digest, kind):
+        key = (str(attachment_id), kind)
+        # 追記も _evict の書き直し（_write_aliases）と同じロックの中で行い、順序が入れ替わらないようにする
+        with self._lock:
+            if self._aliases.get(key) == digest or (digest, kind) not in self._index:
+                return
+            self._aliases[key] = digest
+            try:
+                with open(self._alias_path, "a", encoding="utf-8") as f:
+                    f.write(f"{key[0]}\t{digest}\t{kind}\n")
+            except OSError as e:
+                logger.warning(f"ExtractionCache: failed to record alias: {e}")
+
+    def _forget(self, digest, kind):
+        with self._lock:
+            self._bytes -= self._index.pop((digest, kind), 0)
+            for key in [k for k, d in self._aliases.items() if d == digest and k[1] == kind]:
+                del self._aliases[key]
+
+    def _evict(self):
+        """上限の 90% まで、最後に使われてから長いものから削除"""
+        target = self.max_bytes * 9 // 10
+        removed = []
+        with self._lock:
+            while self._bytes > target and self._index:
+                (digest, kind), size = self._index.popitem(last=False)
+                self._bytes -= size
+                removed.append((digest, kind))
+            dropped = set(removed)
+            for key in [k for k, d in self._aliases.items() if (d, k[1]) in dropped]:
+                del self._aliases[key]
+            self.evicted += len(removed)
+            self._write_aliases()
+        for digest, kind in removed:
+            try:
+                self._path(digest, kind).unlink()
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"ExtractionCache: evicted {len(removed)} entries ({self._bytes} bytes on disk)")
+
+    def _record(self, result: str):
+        if result == "id_hit":
+            self.id_hits += 1
+        elif result == "hash_hit":
+            self.hash_hits += 1
+        else:
+            self.misses += 1
+        if self.metrics is not None:
+            self.metrics.inc("tdd_extraction_cache_requests_total", result=result)
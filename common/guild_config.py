@@ -3,13 +3,25 @@ import json
 from typing import Optional
 
 class GuildConfigBase:
+    def __init__(self):
+        self._listeners = []
+
     def get_plan(self, guild_id: int) -> str:
         raise NotImplementedError
     def set_plan(self, guild_id: int, plan: str):
         raise NotImplementedError
 
+    # set_plan 時に callback(guild_id, plan) を呼ぶ（権限キャッシュの無効化用）
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, guild_id: int, plan: str):
+        for callback in self._listeners:
+            callback(guild_id, plan)
+
 class FileGuildConfig(GuildConfigBase):
     def __init__(self, config_dir: str = ".guild_config"):
+        super().__init__()
         self.config_dir = config_dir
         os.makedirs(self.config_dir, exist_ok=True)
 
@@ -28,4 +40,5 @@ class FileGuildConfig(GuildConfigBase):
         path = self._get_path(guild_id)
         data = {"PLAN": plan}
         with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2) 
\ No newline at end of file
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._notify(guild_id, plan) 
\ No newline at end of file
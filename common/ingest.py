@@ -0,0 +1,188 @@
+# common/ingest.py
+"""
+添付ファイルのストリーミング取り込み
+
+- 添付をチャンク単位でダウンロードし、spool_bytes まではメモリ、超えたら一時ファイルへ書き出す
+- 受信しながら SHA-256 を計算し、先頭 HEAD_BYTES から形式を判定する（拡張子に頼らない）
+- open_sink を渡すと、先頭を受け取った時点でシンク（ffmpeg など）を開き、以降のチャンクを
+  ダウンロードと並行して流し込む
+
+tempfile.SpooledTemporaryFile は書き出し先が名前なしファイルになり ffmpeg や PDF ワーカーに
+パスを渡せないため、書き出し先を名前付き一時ファイルにした SpooledUpload を使う。
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+HEAD_BYTES = 64 * 1024
+CHUNK_BYTES = 256 * 1024
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """先頭バイトから形式を判定（"pdf" / "mp4" / "webm" / "ogg" / "wav" / "flac" / "mp3"、不明なら None）"""
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head[4:8] == b"ftyp":
+        return "mp4"   # MP4 / MOV / M4A（ISO BMFF）
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"  # WebM / Matroska
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"   # ID3 タグ or MPEG フレーム同期
+    return None
+
+
+class SpooledUpload:
+    """受信したバイト列（小さければメモリ、大きければ名前付き一時ファイル）と SHA-256・先頭バイト"""
+
+    def __init__(self, suffix: str = "", spool_bytes: int = 8 * 1024 * 1024, directory=None):
+        self.suffix = suffix
+        self.spool_bytes = spool_bytes
+        self.directory = directory
+        self.size = 0
+        self.head = b""
+        self.path: Optional[str] = None
+        self._buffer = bytearray()
+        self._file = None
+        self._hash = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if len(self.head) < HEAD_BYTES:
+            self.head += chunk[:HEAD_BYTES - len(self.head)]
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+        self._buffer += chunk
+        if self.size > self.spool_bytes:
+            self._file = tempfile.NamedTemporaryFile(suffix=self.suffix, dir=self.directory, delete=False)
+            self.path = self._file.name
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+
+    def finish(self):
+        """受信完了（一時ファイルを閉じて他プロセスから読めるようにする）"""
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def format(self) -> Optional[str]:
+        return sniff_format(self.head)
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def getvalue(self) -> bytes:
+        if self.path is None:
+            return bytes(self._buffer)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    @contextmanager
+    def as_path(self):
+        """ファイルパスとして使う（メモリ上なら一時ファイルに書き出し、抜けるときに削除）"""
+        if self.path is not None:
+            yield self.path
+            return
+        with as_path(bytes(self._buffer), self.suffix) as path:
+            yield path
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self._file = None
+            self.path = None
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def as_path(content: Union[bytes, SpooledUpload], suffix: str = ""):
+    """bytes / SpooledUpload をファイルパスとして渡す（bytes は一時ファイルに書き出して抜けるときに削除）"""
+    if isinstance(content, SpooledUpload):
+        with content.as_path() as path:
+            yield path
+        return
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(content)
+    try:
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+
+async def iter_chunks(attachment, session=None, chunk_size: int = CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """添付をチャンク単位で取得（session か URL が無ければ attachment.read() の一括取得）"""
+    url = getattr(attachment, "url", None)
+    if session is None or not url:
+        yield await attachment.read()
+        return
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            yield chunk
+
+
+async def ingest(chunks: AsyncIterator[bytes], suffix: str = "", spool_bytes: int = 8 * 1024 * 1024,
+                 directory=None, open_sink: Optional[Callable[[SpooledUpload], Awaitable]] = None):
+    """
+    チャンクを SpooledUpload に取り込む
+
+    Args:
+        open_sink: 先頭 HEAD_BYTES（またはファイル全体）を受け取った時点で呼ばれ、feed(chunk) / abort()
+                   を持つシンクを返すと残りのチャンクも流し込む（None を返せば流さない）
+    Returns:
+        (SpooledUpload, シンク or None)。シンクの後始末（finish / abort）は呼び出し側で行う
+    """
+    upload = SpooledUpload(suffix=suffix, spool_bytes=spool_bytes, directory=directory)
+    sink, pending = None, open_sink is not None
+    try:
+        async for chunk in chunks:
+            upload.write(chunk)
+            if pending and len(upload.head) >= HEAD_BYTES:
+                pending = False
+                sink = await open_sink(upload)
+                if sink is not None:
+                    await sink.feed(upload.getvalue())  # ここまでに受け取った分
+            elif sink is not None:
+                await sink.feed(chunk)
+        if pending:
+            sink = await open_sink(upload)
+            if sink is not None:
+                await sink.feed(upload.getvalue())
+        upload.finish()
+    except BaseException:
+        if sink is not None:
+            await sink.abort()
+        upload.close()
+        raise
+    logger.info(
+        f"Ingest: {upload.size} bytes ({'memory' if upload.in_memory else 'disk'}), "
+        f"format={upload.format}, streamed={sink is not None}"
+    )
+    return upload, sink
@@ -0,0 +1,179 @@
+# common/llm_cache.py
+"""
+LLM 応答キャッシュ（オプトイン: LLM_CACHE=1）
+
+(モデル, メッセージ, temperature, max_tokens, プロンプト設定のバージョン) の SHA-256 をキーに、
+メモリ上の LRU とディスク（1応答1ファイル）の2段で保持する。
+ディスクは合計サイズが上限を超えたら更新時刻の古い順に削除する（読み込み時に更新時刻を更新）。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        directory="cache/llm",
+        memory_entries: int = 256,
+        max_bytes: int = 100 * 1024 * 1024,
+        version: str = "",
+        metrics=None,
+    ):
+        self.directory = Path(directory)
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.version = str(version)
+        self.metrics = metrics
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._disk_bytes = sum(path.stat().st_size for path in self.directory.glob("*/*.txt"))
+
+    @classmethod
+    def from_env(cls, version: str = "", metrics=None):
+        """LLM_CACHE が有効なときだけ生成する（無効なら None）"""
+        if os.getenv("LLM_CACHE", "0").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            directory=os.getenv("LLM_CACHE_DIR", "cache/llm"),
+            memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256")),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024))),
+            version=version,
+            metrics=metrics,
+        )
+
+    def key(self, model: str, messages: list[dict], temperature=None, max_tokens=None) -> str:
+        payload = json.dumps(
+            [self.version, model, messages, temperature, max_tokens],
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.txt"
+
+    # --- 同期API（ディスクI/Oあり） ------------------------
+    def get(self, key: str):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._record("memory_hit")
+                return value
+        path = self._path(key)
+        try:
+            value = path.read_text(encoding="utf-8")
+            os.utime(path)  # ディスク側の LRU 順を更新
+        except FileNotFoundError:
+            self._record("miss")
+            return None
+        except OSError as e:
+            logger.warning(f"ResponseCache: failed to read {path}: {e}")
+            self._record("miss")
+            return None
+        with self._lock:
+            self._remember(key, value)
+            self._record("disk_hit")
+        return value
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._remember(key, value)
+        path = self._path(key)
+        data = value.encode("utf-8")
+        try:
+            path.parent.mkdir(exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"ResponseCache: failed to write {path}: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - previous
+            over = self._disk_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    # --- 非同期API（ディスクI/Oはスレッドで実行） ------------
+    async def aget(self, key: str):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._record("memory_hit")
+                return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, value: str):
+        await asyncio.to_thread(self.put, key, value)
+
+    def stats(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+    # --- 内部 -------------------------------------------
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _record(self, result: str):
+        if result == "memory_hit":
+            self.memory_hits += 1
+        elif result == "disk_hit":
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+        if self.metrics is not None:
+            self.metrics.inc("tdd_llm_cache_requests_total", result=result)
+
+    def _evict(self):
+        """上限の 90% まで古い順に削除"""
+        files = []
+        for path in self.directory.glob("*/*.txt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 9 // 10
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.evicted += removed
+        if removed:
+            logger.info(f"ResponseCache: evicted {removed} entries ({total} bytes on disk)")
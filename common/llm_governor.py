@@ -0,0 +1,204 @@
+# common/llm_governor.py
+"""
+OpenAI の RPM / TPM クォータ管理
+
+- 送信前にリクエストのトークン数を見積もり（入力トークン数 + max_tokens）、
+  リクエスト数・トークン数の2つのバケットから予約する。足りなければ補充まで待つ
+- 待ち時間が LLM_MAX_QUOTA_WAIT 秒を超える場合は送らずに QuotaExceeded（エラーの連鎖を避ける）
+- 応答ヘッダ（x-ratelimit-remaining-* / x-ratelimit-reset-*）で残量を補正し、
+  実際の使用トークン数（usage.total_tokens）との差分を返却する
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+from common.tokens import DEFAULT_MODEL, count_message_tokens, estimate_tokens  # noqa: F401 (estimate_tokens は互換用)
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """クォータ回復までの待ち時間が上限を超えたため送信を見送った"""
+
+
+def estimate_request_tokens(messages: list[dict], max_tokens: int, model: str = DEFAULT_MODEL) -> int:
+    """入力トークン数（tiktoken があれば正確な値）+ 出力上限"""
+    return count_message_tokens(messages, model) + (max_tokens or 0)
+
+
+_DURATION = re.compile(r"([\d.]+)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value) -> Optional[float]:
+    """'1s' / '6m0s' / '20ms' 形式のリセットまでの時間を秒に変換"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(str(value))
+    if not parts:
+        return None
+    return sum(float(n) * _UNIT_SECONDS[unit] for n, unit in parts)
+
+
+class _Bucket:
+    """予約型トークンバケット。残量はマイナスまで予約でき、その分だけ後続が待つ"""
+    def __init__(self, per_minute: float, clock):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def observe(self, limit, remaining, reset):
+        self._refill()
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60.0
+        if remaining is not None:
+            # 残量0ならリセットまで補充されない状態として扱う
+            floor = remaining if remaining > 0 or not reset else -reset * self.rate
+            self.level = min(self.level, floor)
+
+    def utilization(self) -> float:
+        self._refill()
+        return max(0.0, 1.0 - self.level / self.capacity)
+
+
+class QuotaGovernor:
+    def __init__(self, name: str, rpm: float, tpm: Optional[float] = None,
+                 max_wait: float = 30.0, metrics=None, clock=time.monotonic):
+        self.name = name
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self._clock = clock
+        self.requests = _Bucket(rpm, clock)
+        self.tokens = _Bucket(tpm, clock) if tpm else None
+        self.waiting = 0
+        self.shed = 0
+
+    async def acquire(self, tokens: int = 0) -> int:
+        """
+        1リクエスト + tokens 分を予約し、必要なら補充まで待つ
+        Returns: 予約したトークン数（settle() に渡す）
+        """
+        wait = self.requests.wait_for(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_for(tokens))
+        if wait > self.max_wait:
+            self.shed += 1
+            if self.metrics is not None:
+                self.metrics.inc("tdd_llm_quota_shed_total", api=self.name)
+            raise QuotaExceeded(
+                f"OpenAI の利用枠が混み合っています（{self.name}: 約{wait:.0f}秒待ち）。しばらくしてから再試行してください。"
+            )
+        self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        if wait > 0:
+            self.waiting += 1
+        self._publish()
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+                self._publish()
+        return tokens
+
+    def settle(self, reserved: int, used: Optional[int]):
+        """見積もりと実使用量の差を返却（used が不明なら何もしない）"""
+        if self.tokens is not None and used is not None and used < reserved:
+            self.tokens.give_back(reserved - used)
+            self._publish()
+
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+
+        def number(key):
+            value = headers.get(key)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.observe(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_reset(headers.get("x-ratelimit-reset-requests")),
+        )
+        if self.tokens is not None:
+            self.tokens.observe(
+                number("x-ratelimit-limit-tokens"),
+                number("x-ratelimit-remaining-tokens"),
+                parse_reset(headers.get("x-ratelimit-reset-tokens")),
+            )
+        self._publish()
+
+    def penalize(self, retry_after: Optional[float]):
+        """429 を受けたら retry_after 秒（不明なら1秒）は送らない"""
+        self.requests.observe(None, 0, retry_after or 1.0)
+        self._publish()
+
+    def utilization(self) -> dict:
+        stats = {"requests": self.requests.utilization(), "waiting": self.waiting, "shed": self.shed}
+        if self.tokens is not None:
+            stats["tokens"] = self.tokens.utilization()
+        return stats
+
+    def _publish(self):
+        if self.metrics is None:
+            return
+        self.metrics.set("tdd_llm_quota_utilization", self.requests.utilization(), api=self.name, quota="requests")
+        if self.tokens is not None:
+            self.metrics.set("tdd_llm_quota_utilization", self.tokens.utilization(), api=self.name, quota="tokens")
+        self.metrics.set("tdd_llm_quota_waiting", self.waiting, api=self.name)
+
+
+_governors = {}
+
+
+def get_governor(name: str) -> QuotaGovernor:
+    """
+    プロセス共通のガバナ
+    chat: LLM_RPM / LLM_TPM、whisper: WHISPER_RPM（Whisper はリクエスト数のみ）
+    """
+    governor = _governors.get(name)
+    if governor is None:
+        max_wait = float(os.getenv("LLM_MAX_QUOTA_WAIT", "30"))
+        if name == "whisper":
+            governor = QuotaGovernor(name, rpm=float(os.getenv("WHISPER_RPM", "50")), max_wait=max_wait)
+        else:
+            governor = QuotaGovernor(
+                name,
+                rpm=float(os.getenv("LLM_RPM", "500")),
+                tpm=float(os.getenv("LLM_TPM", "200000")),
+                max_wait=max_wait,
+            )
+        _governors[name] = governor
+    return governor
@@ -0,0 +1,207 @@
+# common/llm_scheduler.py
+"""
+LLM 呼び出しの全体スケジューラ
+
+- 同時実行数の上限（LLM_MAX_CONCURRENCY）を超えた呼び出しは待ち行列へ
+- 待ち行列は優先度レーン順: プレミアム対話 > 無料対話 > プレミアム裏処理 > 無料裏処理
+- 同じレーン内はギルドごとのラウンドロビンで、1ギルドの連投が他ギルドを待たせない
+- 待ち順位は on_position コールバックで通知（1 = 次に実行、0 = 実行開始）
+
+呼び出し元の区分（プレミアムか、ギルド、順位通知先）は llm_request() で contextvar に設定し、
+LLMClient / OpenAIService がそれを読んでスロットを取得する。
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 優先度の高い順
+LANES = (
+    ("premium", "interactive"),
+    ("free", "interactive"),
+    ("premium", "background"),
+    ("free", "background"),
+)
+
+
+@dataclass
+class LLMRequestContext:
+    premium: bool = False
+    interactive: bool = True
+    guild_id: Optional[int] = None
+    on_position: Optional[Callable[[int], None]] = None
+
+    @property
+    def lane(self):
+        return ("premium" if self.premium else "free", "interactive" if self.interactive else "background")
+
+
+_request_context = contextvars.ContextVar("llm_request", default=LLMRequestContext())
+
+
+def current_llm_request() -> LLMRequestContext:
+    """現在の呼び出し区分（llm_request() の外では既定値）"""
+    return _request_context.get()
+
+
+@contextmanager
+def llm_request(premium: bool = False, interactive: bool = True, guild_id=None, on_position=None):
+    """with ブロック内（そこから作ったタスクを含む）の LLM 呼び出しの区分を設定"""
+    token = _request_context.set(LLMRequestContext(premium, interactive, guild_id, on_position))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("future", "on_position", "position", "enqueued")
+
+    def __init__(self, future, on_position):
+        self.future = future
+        self.on_position = on_position
+        self.position = None
+        self.enqueued = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = 8, metrics=None):
+        self.max_concurrency = max_concurrency
+        self.metrics = metrics
+        self.active = 0
+        # lane -> OrderedDict(guild_id -> deque[_Waiter])。先頭のギルドが次の番
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for guilds in self._lanes.values() for q in guilds.values())
+
+    @asynccontextmanager
+    async def slot(self, context: Optional[LLMRequestContext] = None):
+        context = context or _request_context.get()
+        await self.acquire(context)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, context: LLMRequestContext):
+        lane = context.lane
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            self._observe_wait(lane, 0.0)
+            self._notify(context.on_position, 0)
+            return
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), context.on_position)
+        self._lanes[lane].setdefault(context.guild_id, deque()).append(waiter)
+        self._report_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # スロットを受け取った直後にキャンセルされた
+            else:
+                self._remove(lane, context.guild_id, waiter)
+                self._report_positions()
+            raise
+        self._observe_wait(lane, time.monotonic() - waiter.enqueued)
+        self._notify(waiter.on_position, 0)
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    # --- 内部 -------------------------------------------
+    def _dispatch(self):
+        dispatched = False
+        while self.active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            if waiter.future.done():
+                continue
+            self.active += 1
+            waiter.future.set_result(None)
+            dispatched = True
+        if dispatched:
+            self._report_positions()
+
+    def _next_waiter(self):
+        for lane in LANES:
+            guilds = self._lanes[lane]
+            if not guilds:
+                continue
+            guild_id, queue = next(iter(guilds.items()))
+            waiter = queue.popleft()
+            # 取り出したギルドは末尾へ回す（空なら削除）
+            del guilds[guild_id]
+            if queue:
+                guilds[guild_id] = queue
+            return waiter
+        return None
+
+    def _remove(self, lane, guild_id, waiter):
+        queue = self._lanes[lane].get(guild_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._lanes[lane][guild_id]
+
+    def _report_positions(self):
+        """
+        各待機者の順位を計算し、変わったものだけ通知する
+        レーン内はラウンドロビンなので、ギルド内で i 番目の待機者より前に実行されるのは
+        各ギルドの先頭 i 件と、ローテーションで前にいるギルドの i 番目
+        """
+        ahead = 0
+        for lane in LANES:
+            guilds = self._lanes[lane]
+            if not guilds:
+                continue
+            lengths = [len(q) for q in guilds.values()]
+            for g, queue in enumerate(guilds.values()):
+                for i, waiter in enumerate(queue):
+                    if waiter.on_position is None:
+                        continue
+                    before = sum(min(n, i) for n in lengths) + sum(1 for n in lengths[:g] if n > i)
+                    position = ahead + before + 1
+                    if position != waiter.position:
+                        waiter.position = position
+                        self._notify(waiter.on_position, position)
+            ahead += sum(lengths)
+
+    @staticmethod
+    def _notify(callback, position):
+        if callback is None:
+            return
+        try:
+            callback(position)
+        except Exception as e:
+            logger.warning(f"LLMScheduler: position callback failed: {e}")
+
+    def _observe_wait(self, lane, seconds):
+        if self.metrics is not None:
+            self.metrics.observe("tdd_llm_queue_wait_seconds", seconds, lane="_".join(lane))
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """プロセス共通のスケジューラ（LLM_MAX_CONCURRENCY で同時実行数を設定）"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    return _scheduler
@@ -0,0 +1,183 @@
+# common/log_dict.py
+"""
+追記型ログで永続化する dict（SyncDictJSON と同じマッピングAPI）
+
+- 変更ごとに1行のコンパクトなレコードを `<path>.log` に追記する
+- 起動時はスナップショット `<path>`（従来と同じJSON形式）+ ログを再生して復元
+- ログが閾値を超えたらバックグラウンドスレッドでスナップショットへ圧縮
+- group_commit_ms > 0 の場合、fsync をその時間窓でまとめて実行する
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_SET = "s"
+_DEL = "d"
+
+
+def _replay_into(data: dict, log_path):
+    """ログを data に再生する（LogStructuredDict 自身にも使うため dict のメソッドを直接呼ぶ）"""
+    if not Path(log_path).exists():
+        return
+    with open(log_path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # クラッシュ時の書きかけ行は読み飛ばす
+                logger.warning(f"LogStructuredDict: skipped torn record {log_path}:{lineno}")
+                continue
+            if record[0] == _SET:
+                dict.__setitem__(data, record[1], record[2])
+            elif record[0] == _DEL:
+                dict.pop(data, record[1], None)
+
+
+def read_log_dict(path) -> dict:
+    """スナップショット + ログを再生した内容を読み取り専用で返す（ログを開かない・圧縮しない）"""
+    data = {}
+    if Path(path).exists():
+        data.update(json.loads(Path(path).read_text(encoding="utf-8") or "{}"))
+    _replay_into(data, f"{path}.log.old")
+    _replay_into(data, f"{path}.log")
+    return data
+
+
+class LogStructuredDict(dict):
+    _locks = {}
+    _instances = {}
+
+    @classmethod
+    def create(cls, path, compact_threshold: int = 1024 * 1024, group_commit_ms: int = 0):
+        lock = cls._locks.setdefault(path, threading.Lock())
+        if path not in cls._instances:
+            instance = cls(path, lock, compact_threshold, group_commit_ms)
+            atexit.register(instance.close)
+            cls._instances[path] = instance
+        return cls._instances[path]
+
+    def __init__(self, path, lock, compact_threshold: int = 1024 * 1024, group_commit_ms: int = 0):
+        super().__init__()
+        self.path = path
+        self.lock = lock
+        self.log_path = f"{path}.log"
+        self.old_log_path = f"{path}.log.old"
+        self.compact_threshold = compact_threshold
+        self.group_commit = group_commit_ms / 1000.0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        # スナップショット → 圧縮途中のログ → 現行ログ の順に再生
+        if Path(path).exists():
+            super().update(json.loads(Path(path).read_text(encoding="utf-8") or "{}"))
+        self._replay(self.old_log_path)
+        self._replay(self.log_path)
+        if Path(self.old_log_path).exists():
+            # 前回の圧縮が途中で止まっている場合は、ここで確定させておく
+            self._write_snapshot(dict(self))
+            os.unlink(self.old_log_path)
+
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._log_bytes = self._log.tell()
+        self._compacting = False
+        self._closed = False
+
+        # group commit 用: 未fsyncの書き込みがあるときだけフラッシャーが起きる
+        self._dirty = threading.Event()
+        self._flusher = None
+        if self.group_commit > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"logdict-fsync:{path}", daemon=True)
+            self._flusher.start()
+
+    # --- マッピングAPI ---------------------------------
+    def __setitem__(self, key, value):
+        with self.lock:
+            super().__setitem__(key, value)
+            self._append([_SET, key, value])
+
+    def __delitem__(self, key):
+        with self.lock:
+            super().__delitem__(key)
+            self._append([_DEL, key])
+
+    def delete_many(self, keys) -> int:
+        """存在するキーをまとめて削除し、削除件数を返す（追記と fsync は1回）"""
+        with self.lock:
+            removed = []
+            for key in keys:
+                if key in self:
+                    super().__delitem__(key)
+                    removed.append([_DEL, key])
+            if removed:
+                self._append(*removed)
+        return len(removed)
+
+    # --- ログ書き込み -----------------------------------
+    def _append(self, *records):
+        lines = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+        self._log.write(lines)
+        self._log.flush()
+        self._log_bytes += len(lines.encode("utf-8"))
+        if self.group_commit > 0:
+            self._dirty.set()
+        else:
+            os.fsync(self._log.fileno())
+        if self._log_bytes >= self.compact_threshold and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact, name=f"logdict-compact:{self.path}", daemon=True).start()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            # 時間窓の間に来た書き込みを1回の fsync にまとめる
+            time.sleep(self.group_commit)
+            with self.lock:
+                self._dirty.clear()
+                if not self._log.closed:
+                    os.fsync(self._log.fileno())
+
+    def _replay(self, log_path):
+        _replay_into(self, log_path)
+
+    # --- 圧縮 ------------------------------------------
+    def _compact(self):
+        try:
+            with self.lock:
+                # ログを退避して新しいログに切り替え、その時点の状態を確定させる
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                self._log.close()
+                os.replace(self.log_path, self.old_log_path)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                self._log_bytes = 0
+                snapshot = dict(self)
+
+            self._write_snapshot(snapshot)
+            os.unlink(self.old_log_path)
+            logger.info(f"LogStructuredDict: compacted {self.path} ({len(snapshot)} keys)")
+        except Exception as e:
+            logger.error(f"LogStructuredDict: compaction failed for {self.path}: {e}")
+        finally:
+            self._compacting = False
+
+    def _write_snapshot(self, data):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush(); os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        with self.lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log.close()
+        self._dirty.set()
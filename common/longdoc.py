@@ -0,0 +1,152 @@
+# common/longdoc.py
+"""
+長文コンテンツの分割要約（map-reduce）
+
+- 見出し・空行（段落）・文末の順に構造的な区切りで limit 以下のチャンクに分割
+  （長さは measure で測る。既定は文字数、トークン数で測るなら common.tokens.count_tokens 等を渡す）
+- 各チャンクの要点抽出（map）を同時実行数 concurrency までの並行で実行
+- 要点をつなげてもまだ長ければ、要点に対して同じ処理を繰り返す（reduce）
+最終的な記事・TLDR の生成は呼び出し側が既存のテンプレート（build_prompt 等）で行う。
+"""
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 区切りの優先順（前ほど大きな構造）
+_HEADING = re.compile(r"\n(?=#{1,6} )")
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[。！？!?．])|(?<=\. )")
+_SPLITTERS = (_HEADING, _PARAGRAPH, re.compile(r"\n"), _SENTENCE)
+
+NOTE_SEPARATOR = "\n\n"
+
+
+def split_into_chunks(text: str, limit: int, measure: Callable[[str], int] = len) -> list[str]:
+    """
+    text を measure で測って limit 以下のチャンクに分割
+    大きな区切りで分けられない部分だけ、より細かい区切り（最後は文字位置）で分ける
+    """
+    text = text.strip()
+    if not text:
+        return []
+    if measure(text) <= limit:
+        return [text]
+    return [chunk for chunk in _split(text, limit, measure, 0) if chunk.strip()]
+
+
+def _split(text: str, limit: int, measure, level: int) -> list[str]:
+    if measure(text) <= limit:
+        return [text]
+    if level >= len(_SPLITTERS):
+        return _hard_split(text, limit, measure)
+
+    pieces = [p for p in _SPLITTERS[level].split(text) if p.strip()]
+    if len(pieces) <= 1:
+        return _split(text, limit, measure, level + 1)
+
+    # 隣り合う小片は limit に収まる限り1チャンクにまとめる
+    # （長さは小片ごとの和で見積もる。文字数・トークン数とも連結後の実測以上になるので安全側）
+    joiner = "\n\n" if level <= 1 else ("\n" if level == 2 else "")
+    joiner_size = measure(joiner)
+    chunks, current, current_size = [], "", 0
+    for piece in pieces:
+        size = measure(piece)
+        if size > limit:
+            if current:
+                chunks.append(current)
+                current, current_size = "", 0
+            chunks.extend(_split(piece, limit, measure, level + 1))
+            continue
+        if current and current_size + joiner_size + size <= limit:
+            current = f"{current}{joiner}{piece}"
+            current_size += joiner_size + size
+        else:
+            if current:
+                chunks.append(current)
+            current, current_size = piece, size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# 1トークンあたりの文字数の上限の目安。二分探索の範囲を先頭 limit * これ 文字に絞る
+_MAX_CHARS_PER_UNIT = 8
+
+
+def _head_length(text: str, limit: int, measure) -> int:
+    """limit に収まる最長の先頭部分の長さ（二分探索。範囲を絞り、文書全体を毎回数え直さない）"""
+    low, high = 1, min(len(text), max(limit, 1) * _MAX_CHARS_PER_UNIT)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if measure(text[:mid]) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _hard_split(text: str, limit: int, measure) -> list[str]:
+    """区切りが無い部分は limit に収まる最長の先頭部分ずつ切り出す"""
+    chunks = []
+    while text:
+        length = _head_length(text, limit, measure)
+        chunks.append(text[:length])
+        text = text[length:]
+    return chunks
+
+
+async def map_reduce(
+    text: str,
+    summarize: Callable[[str, int, int], Awaitable[str]],
+    limit: int = 8000,
+    measure: Callable[[str], int] = len,
+    concurrency: int = 8,
+    max_rounds: int = 3,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> str:
+    """
+    text が limit を超える間、分割して要点抽出を繰り返し limit 以下に縮める
+
+    Args:
+        summarize: (チャンク, 番号, 総数) を受け取り要点を返す async 関数
+        concurrency: 1文書あたりの同時要点抽出数
+        measure: 長さの測り方（既定は文字数）
+        max_rounds: reduce の最大段数（超えた場合は末尾を切り詰める）
+        on_progress: (完了数, 総数) で呼ばれる進捗通知
+
+    Returns:
+        limit 以下のテキスト（元から収まっていればそのまま）
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    for round_no in range(max_rounds):
+        if measure(text) <= limit:
+            return text
+        chunks = split_into_chunks(text, limit, measure)
+        total = len(chunks)
+        done = 0
+        if on_progress:
+            on_progress(0, total)
+
+        async def run(index, chunk):
+            nonlocal done
+            async with semaphore:
+                note = await summarize(chunk, index, total)
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+            return (note or "").strip()
+
+        notes = await asyncio.gather(*(run(i, c) for i, c in enumerate(chunks)))
+        condensed = NOTE_SEPARATOR.join(note for note in notes if note)
+        logger.info(f"map_reduce: round {round_no + 1}, {measure(text)} -> {measure(condensed)} ({total} chunks)")
+        if measure(condensed) >= measure(text):
+            break  # 縮まらない場合は打ち切り
+        text = condensed
+
+    if measure(text) > limit:
+        logger.warning(f"map_reduce: still {measure(text)} after {max_rounds} rounds, truncating")
+        text = text[:_head_length(text, limit, measure)]
+    return text
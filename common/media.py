@@ -0,0 +1,180 @@
+# common/media.py
+"""
+ffmpeg によるパイプ経由の音声抽出
+
+動画のバイト列を stdin から ffmpeg に渡し、16kHz モノラルの低ビットレート Opus（Ogg）
+または MP3 を stdout からメモリに受け取る。一時ファイルへの動画の書き出しと、
+非圧縮 WAV（約2MB/分）の書き出し・読み戻しが不要になる。
+
+MP4 / MOV 系で moov（索引）が末尾にあるファイルはシークが必要でパイプ入力できないため、
+その場合だけ入力を一時ファイルに書き出す（出力は常にパイプ）。
+
+AudioPipe はダウンロード中のチャンクをそのまま ffmpeg の stdin に流し込み、
+取り込みと音声抽出を並行させる。
+"""
+import asyncio
+import logging
+import os
+import struct
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 出力形式: (ffmpeg のエンコーダ, コンテナ, 拡張子)
+AUDIO_FORMATS = {
+    "opus": ("libopus", "ogg", ".ogg"),
+    "mp3": ("libmp3lame", "mp3", ".mp3"),
+}
+
+# ISO BMFF（MP4/MOV/M4A/3GP）は moov の位置次第でシークが必要
+_ISO_BMFF_SUFFIXES = {".mp4", ".m4a", ".m4v", ".mov", ".3gp", ".3g2"}
+
+
+class ExtractionError(Exception):
+    """ffmpeg による音声抽出に失敗した"""
+
+
+def _top_level_boxes(data: bytes, limit: int = 64):
+    """ISO BMFF のトップレベルボックス名を先頭から順に返す（データ末尾・不正なサイズで打ち切り）"""
+    offset = 0
+    for _ in range(limit):
+        if offset + 8 > len(data):
+            return
+        size, name = struct.unpack(">I4s", data[offset:offset + 8])
+        if size == 1:
+            if offset + 16 > len(data):
+                return
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+        elif size == 0:
+            size = len(data) - offset
+        if size < 8:
+            return
+        yield name
+        offset += size
+
+
+def needs_seek(data: bytes, suffix: str) -> bool:
+    """パイプでは読めない（シークが必要な）入力か"""
+    if suffix.lower() not in _ISO_BMFF_SUFFIXES:
+        return False
+    for name in _top_level_boxes(data):
+        if name == b"moov":
+            return False  # faststart 済み: 先頭に索引がある
+        if name == b"mdat":
+            return True   # 索引より先にメディアデータ
+    return True
+
+
+def _output_args(audio_format: str, bitrate: str) -> list[str]:
+    codec, container, _ = AUDIO_FORMATS[audio_format]
+    return ["-vn", "-ac", "1", "-ar", "16000", "-c:a", codec, "-b:a", bitrate, "-f", container, "pipe:1"]
+
+
+async def _start_ffmpeg(input_args: list[str], audio_format: str, bitrate: str, stdin_pipe: bool):
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", *input_args,
+           *_output_args(audio_format, bitrate)]
+    try:
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_pipe else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError as e:
+        raise ExtractionError("ffmpeg is not installed") from e
+
+
+def _check_output(returncode, stdout: bytes, stderr: bytes) -> bytes:
+    if returncode != 0 or not stdout:
+        raise ExtractionError(f"ffmpeg failed: {stderr.decode('utf-8', errors='ignore')[-300:]}")
+    return stdout
+
+
+async def extract_audio_bytes(data: bytes, suffix: str, audio_format: str = "opus",
+                              bitrate: str = "24k", stats: Optional[dict] = None) -> bytes:
+    """
+    動画（または音声）のバイト列から圧縮音声を抽出して返す
+
+    Args:
+        suffix: 元ファイルの拡張子（シークが必要な形式の判定に使う）
+        audio_format: "opus" or "mp3"
+        stats: 渡すと {"mode": "pipe"|"tempfile", "disk_bytes": 一時ファイルに書いたバイト数} を記録
+    Raises:
+        ExtractionError: ffmpeg が失敗した
+    """
+    seek = needs_seek(data, suffix)
+    if seek:
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            tmp.write(data)
+        try:
+            stdout = await extract_audio_path(tmp.name, audio_format, bitrate)
+        finally:
+            os.unlink(tmp.name)
+    else:
+        process = await _start_ffmpeg(["-i", "pipe:0"], audio_format, bitrate, stdin_pipe=True)
+        # stdin への書き込みと stdout の読み出しを並行して行う（パイプ詰まりを防ぐ）
+        stdout, stderr = await process.communicate(input=data)
+        _check_output(process.returncode, stdout, stderr)
+    if stats is not None:
+        stats["mode"] = "tempfile" if seek else "pipe"
+        stats["disk_bytes"] = len(data) if seek else 0
+    logger.info(f"Audio extraction ({'tempfile' if seek else 'pipe'}): {len(data)} -> {len(stdout)} bytes {audio_format}")
+    return stdout
+
+
+async def extract_audio_path(path: str, audio_format: str = "opus", bitrate: str = "24k") -> bytes:
+    """ファイル（シーク可能）から圧縮音声を抽出して返す"""
+    process = await _start_ffmpeg(["-i", path], audio_format, bitrate, stdin_pipe=False)
+    stdout, stderr = await process.communicate()
+    return _check_output(process.returncode, stdout, stderr)
+
+
+class AudioPipe:
+    """受信中のチャンクを ffmpeg の stdin に流し込み、圧縮音声を stdout から受け取る"""
+
+    def __init__(self, audio_format: str = "opus", bitrate: str = "24k"):
+        self.audio_format = audio_format
+        self.bitrate = bitrate
+        self.bytes_in = 0
+        self._process = None
+        self._readers = None
+        self._closed = False
+
+    async def start(self):
+        self._process = await _start_ffmpeg(["-i", "pipe:0"], self.audio_format, self.bitrate, stdin_pipe=True)
+        # 出力は並行して読み続ける（stdout が詰まると ffmpeg が止まり feed も進まない）
+        self._readers = asyncio.gather(self._process.stdout.read(), self._process.stderr.read())
+        return self
+
+    async def feed(self, chunk: bytes):
+        if self._closed:
+            return
+        try:
+            self._process.stdin.write(chunk)
+            await self._process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            self._closed = True  # ffmpeg が先に終了した（エラー内容は finish で返す）
+        self.bytes_in += len(chunk)
+
+    async def finish(self) -> bytes:
+        """入力を閉じて抽出結果を返す"""
+        if not self._closed:
+            self._closed = True
+            self._process.stdin.close()
+            try:
+                await self._process.stdin.wait_closed()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        stdout, stderr = await self._readers
+        await self._process.wait()
+        audio = _check_output(self._process.returncode, stdout, stderr)
+        logger.info(f"Audio extraction (stream): {self.bytes_in} -> {len(audio)} bytes {self.audio_format}")
+        return audio
+
+    async def abort(self):
+        self._closed = True
+        if self._process.returncode is None:
+            self._process.kill()
+        await asyncio.gather(self._readers, return_exceptions=True)
+        await self._process.wait()
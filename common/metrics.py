@@ -0,0 +1,207 @@
+# common/metrics.py
+"""
+軽量メトリクスレジストリ（カウンタ + ゲージ + HDR風ヒストグラム）
+
+- ヒストグラムは 2 のべき乗ごとに SUB_BUCKETS 分割した対数線形バケットで、
+  マイクロ秒単位の値を相対誤差 約3% で固定メモリに記録する
+- Prometheus テキスト形式で出力（ヒストグラムは quantile 付きの summary として出す）
+- METRICS_PORT を指定した場合のみ aiohttp でローカルに /metrics を公開
+"""
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from aiohttp import web
+except ImportError:  # aiohttp が無い環境では HTTP 公開なし（/metrics コマンドのみ）
+    web = None
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class Histogram:
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self, unit: float = 1e-6, max_value: float = 3600.0):
+        self.unit = unit
+        self._max_units = int(max_value / unit)
+        self._counts = [0] * (self._index(self._max_units) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, units: int) -> int:
+        # 2*SUB_BUCKETS 未満はそのまま（誤差なし）、以降は上位 SUB_BUCKET_BITS+1 ビットで分割
+        if units < 2 * self.SUB_BUCKETS:
+            return units
+        shift = units.bit_length() - self.SUB_BUCKET_BITS - 1
+        return shift * self.SUB_BUCKETS + (units >> shift)
+
+    def _bounds(self, index: int) -> tuple[int, int]:
+        if index < 2 * self.SUB_BUCKETS:
+            return index, index + 1
+        shift = index // self.SUB_BUCKETS - 1
+        sub = index - shift * self.SUB_BUCKETS
+        return sub << shift, (sub + 1) << shift
+
+    def observe(self, value: float):
+        units = min(max(int(value / self.unit), 0), self._max_units)
+        self._counts[self._index(units)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank:
+                if index == len(self._counts) - 1:
+                    return self.max  # max_value を超えて丸めた値を含むバケット
+                low, high = self._bounds(index)
+                return min((low + high) / 2 * self.unit, self.max)
+        return self.max
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters = {}    # name -> {labels: value}
+        self._gauges = {}      # name -> {labels: value}
+        self._histograms = {}  # name -> {labels: Histogram}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    # --- 記録 -------------------------------------------
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        """ゲージ（現在値）を設定"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """with ブロックの所要時間を秒で記録。例外時は <name>_errors_total も加算"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{name.removesuffix('_seconds')}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # --- 参照 -------------------------------------------
+    def histogram(self, name: str, **labels):
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def counter(self, name: str, **labels) -> float:
+        return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def gauge(self, name: str, **labels):
+        return self._gauges.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def histogram_summaries(self):
+        """[(name, labels, count, p50, p95, p99)] （/metrics コマンド用）"""
+        with self._lock:
+            return [
+                (name, dict(labels), h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                for name, series in sorted(self._histograms.items())
+                for labels, h in sorted(series.items())
+            ]
+
+    def counter_values(self):
+        with self._lock:
+            return [
+                (name, dict(labels), value)
+                for name, series in sorted(self._counters.items())
+                for labels, value in sorted(series.items())
+            ]
+
+    def gauge_values(self):
+        with self._lock:
+            return [
+                (name, dict(labels), value)
+                for name, series in sorted(self._gauges.items())
+                for labels, value in sorted(series.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_label_text(labels)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_label_text(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} summary")
+                for labels, h in sorted(series.items()):
+                    for q in QUANTILES:
+                        lines.append(f"{name}{_label_text(labels + (('quantile', q),))} {h.quantile(q):.6f}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {h.sum:.6f}")
+                    lines.append(f"{name}_count{_label_text(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+    """/metrics を公開する。aiohttp が無ければ None（呼び出し側で cleanup() する）"""
+    if web is None:
+        logger.warning("aiohttp is not installed; metrics HTTP endpoint disabled")
+        return None
+
+    async def handle(request):
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
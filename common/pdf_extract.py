@@ -0,0 +1,248 @@
+# common/pdf_extract.py
+"""
+PDF テキスト抽出のワーカープロセス
+
+- pdfminer の解析は CPU を占有するため、イベントループではなく別プロセスで実行する
+- ページを pages_per_job ページずつのジョブに分け、1ジョブ = 1プロセス
+  （`python -m common.pdf_extract`）で並列に抽出。同時に動くプロセスは全体で workers 個まで
+- 各ワーカーは起動直後に CPU 時間（RLIMIT_CPU）とメモリ（RLIMIT_AS）の上限を自分に設定する。
+  上限超過・応答なしのワーカーはそのプロセスだけが終了させられ、他の文書のジョブには影響しない
+- 先頭から順に結果を集め、呼び出し側の予算（limit）に達したら残りのページは処理しない
+
+ProcessPoolExecutor を使わないのは、fork はスレッドを持つ Bot プロセスではデッドロックの恐れがあり、
+spawn / forkserver は起動スクリプト（tdd_bot.py）を __mp_main__ として再実行して
+状態ストアやログスレッドまで初期化してしまうため。ffmpeg と同じく新しいインタプリタを起動する。
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows では上限なし
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_ROOT = str(Path(__file__).resolve().parents[1])
+
+# ワーカーの終了コード
+_EXIT_ERROR = 1
+_EXIT_MISSING = 2
+_EXIT_MEMORY = 3
+
+
+class PDFExtractionError(Exception):
+    """PDF の抽出に失敗した（上限超過・破損など）"""
+
+
+@dataclass
+class PDFText:
+    text: str
+    pages_read: int
+    total_pages: int
+
+    @property
+    def complete(self) -> bool:
+        return self.pages_read >= self.total_pages
+
+
+# --- ワーカー側 -----------------------------------------
+def _apply_limits(cpu_seconds: float, memory_bytes: int):
+    """このプロセスの CPU 時間（超えると SIGXCPU で終了）と仮想メモリに上限を設定"""
+    if resource is None:
+        return
+    for name, value in ((resource.RLIMIT_CPU, int(cpu_seconds + 0.999)), (resource.RLIMIT_AS, memory_bytes)):
+        if not value:
+            continue
+        _, hard = resource.getrlimit(name)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(name, (value, hard))
+
+
+def count_pages(path: str) -> int:
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    with open(path, "rb") as fp:
+        document = PDFDocument(PDFParser(fp))
+        try:
+            return int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
+        except Exception:
+            return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def extract_pages(path: str, first: int, last: int) -> list[str]:
+    """first 〜 last-1 ページ目のテキストをページごとに返す"""
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    texts = []
+    with open(path, "rb") as fp:
+        manager = PDFResourceManager()
+        for page in PDFPage.get_pages(fp, pagenos=set(range(first, last)), maxpages=last):
+            out = io.StringIO()
+            device = TextConverter(manager, out, laparams=LAParams())
+            try:
+                PDFPageInterpreter(manager, device).process_page(page)
+            finally:
+                device.close()
+            texts.append(out.getvalue())
+    return texts
+
+
+def _worker_main(argv: list[str]) -> int:
+    """python -m common.pdf_extract <cpu_seconds> <memory_bytes> count <path> | pages <path> <first> <last>"""
+    cpu_seconds, memory_bytes, command, path, *rest = argv
+    _apply_limits(float(cpu_seconds), int(memory_bytes))
+    try:
+        if command == "count":
+            result = count_pages(path)
+        else:
+            result = extract_pages(path, int(rest[0]), int(rest[1]))
+    except ImportError as e:
+        print(f"pdfminer.six is not installed: {e}", file=sys.stderr)
+        return _EXIT_MISSING
+    except MemoryError:
+        return _EXIT_MEMORY
+    except Exception as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        return _EXIT_ERROR
+    sys.stdout.write(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+# --- 呼び出し側 -----------------------------------------
+class PDFExtractor:
+    def __init__(self, workers: int = 2, pages_per_job: int = 8, cpu_seconds: float = 30,
+                 memory_bytes: int = 1024 * 1024 * 1024, timeout: Optional[float] = None):
+        """
+        Args:
+            workers: 同時に動かすワーカープロセス数（全文書で共有）
+            pages_per_job: 1ジョブで処理するページ数
+            cpu_seconds: 1ジョブの CPU 時間の上限（秒）
+            memory_bytes: 1ジョブの仮想メモリの上限
+            timeout: 1ジョブの経過時間の上限（秒、省略時は cpu_seconds * 3 + 5）
+        """
+        self.workers = workers
+        self.pages_per_job = pages_per_job
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.timeout = timeout if timeout is not None else cpu_seconds * 3 + 5
+        self._slots = asyncio.Semaphore(workers)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            pages_per_job=int(os.getenv("PDF_PAGES_PER_JOB", "8")),
+            cpu_seconds=float(os.getenv("PDF_JOB_CPU_SECONDS", "30")),
+            memory_bytes=int(os.getenv("PDF_WORKER_MEMORY_MB", "1024")) * 1024 * 1024,
+        )
+
+    def _command(self, *args) -> list[str]:
+        return [sys.executable, "-m", "common.pdf_extract",
+                str(self.cpu_seconds), str(self.memory_bytes), *map(str, args)]
+
+    async def _run(self, *args):
+        """ワーカープロセスを1つ起動して結果（JSON）を返す。時間切れ・キャンセル時はそのプロセスだけ終了させる"""
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_ROOT, os.getenv("PYTHONPATH")])))
+        async with self._slots:
+            process = await asyncio.create_subprocess_exec(
+                *self._command(*args),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise PDFExtractionError("PDF の解析が処理時間の上限を超えました")
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        if process.returncode == 0:
+            return json.loads(stdout)
+        if process.returncode == _EXIT_MISSING:
+            raise ImportError(stderr.decode("utf-8", errors="ignore").strip())
+        if process.returncode == _EXIT_MEMORY:
+            raise PDFExtractionError("PDF の解析がメモリの上限を超えました")
+        if process.returncode < 0:
+            # SIGXCPU（CPU 時間の上限）や SIGKILL / SIGSEGV（メモリ不足など）
+            raise PDFExtractionError(f"PDF の解析が処理時間またはメモリの上限を超えました（signal {-process.returncode}）")
+        raise PDFExtractionError(stderr.decode("utf-8", errors="ignore").strip()[-300:] or "PDF の解析に失敗しました")
+
+    async def extract(self, data: bytes, limit: Optional[int] = None,
+                      measure: Callable[[str], int] = len) -> PDFText:
+        """PDF のバイト列からテキストを抽出する（一時ファイルに書き出して extract_file）"""
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp.write(data)
+        try:
+            return await self.extract_file(tmp.name, limit=limit, measure=measure)
+        finally:
+            os.unlink(tmp.name)
+
+    async def extract_file(self, path: str, limit: Optional[int] = None,
+                           measure: Callable[[str], int] = len) -> PDFText:
+        """
+        PDF ファイルのテキストを先頭から抽出する
+
+        Args:
+            limit: measure で測った合計がこれに達したら以降のページを読まない（None なら全ページ）
+        """
+        total = await self._run("count", path)
+        jobs = [(first, min(first + self.pages_per_job, total)) for first in range(0, total, self.pages_per_job)]
+        texts, collected, pages_read = [], 0, 0
+        pending = []
+        next_job = 0
+        try:
+            while next_job < len(jobs) or pending:
+                # ワーカー数だけ先行して投入し、結果はページ順に受け取る
+                while next_job < len(jobs) and len(pending) < self.workers:
+                    first, last = jobs[next_job]
+                    pending.append(asyncio.ensure_future(self._run("pages", path, first, last)))
+                    next_job += 1
+                page_texts = await pending.pop(0)
+                texts.extend(page_texts)
+                pages_read += len(page_texts)
+                collected += sum(measure(t) for t in page_texts)
+                if limit is not None and collected >= limit:
+                    break
+        finally:
+            # 打ち切り・失敗時は残りのジョブのプロセスを終了させる
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if pages_read < total:
+            logger.info(f"PDFExtractor: stopped after {pages_read}/{total} pages (budget reached)")
+        return PDFText("".join(texts), pages_read, total)
+
+
+_extractor: Optional[PDFExtractor] = None
+
+
+def get_pdf_extractor() -> PDFExtractor:
+    """プロセス共通の抽出器（PDF_WORKERS / PDF_PAGES_PER_JOB / PDF_JOB_CPU_SECONDS / PDF_WORKER_MEMORY_MB）"""
+    global _extractor
+    if _extractor is None:
+        _extractor = PDFExtractor.from_env()
+    return _extractor
+
+
+if __name__ == "__main__":
+    sys.exit(_worker_main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+# common/progress.py
+"""
+Discord メッセージ編集の間引き
+
+update() は最新の値を覚えるだけで、実際の編集は min_interval 秒に1回まで。
+その間に来た更新はまとめて最後の値だけを反映する（メッセージ編集のレート制限対策）。
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+def preview_tail(text: str, limit: int) -> str:
+    """長い途中経過は末尾 limit 文字だけを表示"""
+    if len(text) <= limit:
+        return text
+    return "…" + text[-(limit - 1):]
+
+
+class ThrottledEditor:
+    def __init__(self, edit, min_interval: float = 1.5, clock=time.monotonic):
+        """
+        Args:
+            edit: 値を受け取って実際に編集する async 関数
+            min_interval: 編集の最小間隔（秒）
+        """
+        self._edit = edit
+        self.min_interval = min_interval
+        self._clock = clock
+        self._latest = _UNSET
+        self._last_edit = float("-inf")
+        self._task = None
+        self.edits = 0
+
+    def update(self, value):
+        self._latest = value
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._latest is not _UNSET:
+            delay = self._last_edit + self.min_interval - self._clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            value, self._latest = self._latest, _UNSET
+            await self._apply(value)
+
+    async def _apply(self, value):
+        self._last_edit = self._clock()
+        try:
+            await self._edit(value)
+            self.edits += 1
+        except Exception as e:
+            logger.warning(f"Progress edit failed: {e}")
+
+    async def aclose(self, final=_UNSET):
+        """保留中の編集を止め、final が指定されていればそれを1回だけ反映"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._latest = _UNSET
+        if final is not _UNSET:
+            await self._apply(final)
@@ -1,8 +1,184 @@
-# ダミー実装: すべて許可
+# common/ratelimit.py
+"""
+機能ごとのレート制限エンジン
+
+- バースト: トークンバケット
+- 日次上限: スライディングウィンドウ（前後2窓の加重カウントで O(1) 近似）
+判定はメモリ上のみで行い、状態は一定間隔で rate.db（SQLite）へ非同期に書き戻す。
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+import weakref
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+# burst: バケット容量 / refill_per_sec: 1秒あたりの補充量 / daily: 24時間あたりの上限
+DEFAULT_POLICIES = {
+    "default":      {"burst": 5, "refill_per_sec": 1 / 6,  "daily": 200},
+    "write":        {"burst": 3, "refill_per_sec": 1 / 20, "daily": 50},
+    "clean":        {"burst": 3, "refill_per_sec": 1 / 10, "daily": 100},
+    "transcribe":   {"burst": 2, "refill_per_sec": 1 / 30, "daily": 20},
+    "twitter_post": {"burst": 2, "refill_per_sec": 1 / 60, "daily": 30},
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_state (
+    member_id    TEXT NOT NULL,
+    feature      TEXT NOT NULL,
+    tokens       REAL NOT NULL,
+    updated      REAL NOT NULL,
+    window_start REAL NOT NULL,
+    prev_count   INTEGER NOT NULL,
+    curr_count   INTEGER NOT NULL,
+    PRIMARY KEY (member_id, feature)
+)
+"""
+
 
 class RateLimiter:
-    def __init__(self, db_path=None):
-        pass
+    def __init__(self, db_path=None, policies: dict = None, flush_interval: float = 5.0, clock=time.time):
+        self.db_path = db_path
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.flush_interval = flush_interval
+        self._clock = clock
+        # (member_id, feature) -> [tokens, updated, window_start, prev_count, curr_count]
+        self._state = {}
+        self._dirty = set()
+        self._flush_task = None
+        if self.db_path:
+            self._load()
+
+    async def check(self, member_id, feature) -> bool:
+        """許可なら True を返し、バケットと日次カウンタを1消費する"""
+        policy = self.policies.get(feature, self.policies["default"])
+        now = self._clock()
+        key = (str(member_id), feature)
+        state = self._state.get(key)
+        if state is None:
+            state = [float(policy["burst"]), now, now - now % DAY_SECONDS, 0, 0]
+            self._state[key] = state
+
+        # トークン補充
+        state[0] = min(policy["burst"], state[0] + (now - state[1]) * policy["refill_per_sec"])
+        state[1] = now
+
+        # 日次ウィンドウの繰り上げ
+        elapsed = now - state[2]
+        if elapsed >= DAY_SECONDS:
+            windows = int(elapsed // DAY_SECONDS)
+            state[3] = state[4] if windows == 1 else 0
+            state[4] = 0
+            state[2] += windows * DAY_SECONDS
+            elapsed = now - state[2]
+        estimated = state[3] * (1 - elapsed / DAY_SECONDS) + state[4]
+
+        allowed = state[0] >= 1 and estimated + 1 <= policy["daily"]
+        if allowed:
+            state[0] -= 1
+            state[4] += 1
+        self._dirty.add(key)
+        self._ensure_flusher()
+        return allowed
+
+    # --- write-behind ----------------------------------
+    def _ensure_flusher(self):
+        if not self.db_path or (self._flush_task and not self._flush_task.done()):
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            pass  # イベントループ外（テスト等）では close()/flush() 時にまとめて書く
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"RateLimiter: failed to persist state: {e}")
+
+    async def flush(self):
+        if not self.db_path or not self._dirty:
+            return
+        rows = [(k[0], k[1], *self._state[k]) for k in self._dirty]
+        self._dirty.clear()
+        await asyncio.to_thread(self._write_rows, rows)
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def _connect(self):
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(_SCHEMA)
+        return conn
+
+    def _write_rows(self, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_state"
+                    "(member_id, feature, tokens, updated, window_start, prev_count, curr_count) "
+                    "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            conn.close()
+
+    def _load(self):
+        try:
+            conn = self._connect()
+            try:
+                for member_id, feature, *state in conn.execute("SELECT * FROM rate_state"):
+                    self._state[(member_id, feature)] = list(state)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"RateLimiter: failed to load {self.db_path}: {e}")
+
+# --- Redis 日次カウンタ（チェックと加算を1往復でアトミックに実行） ---
+# 上限到達なら -1、そうでなければ加算後の値を返す。EXPIRE は初回加算時のみ設定
+DAILY_LIMIT_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[1]) then
+    return -1
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return current
+"""
+
+_daily_limit_scripts = weakref.WeakKeyDictionary()
+
+def _daily_limit_script(redis_client):
+    # EVALSHA 用にクライアントごとにスクリプトを登録（NOSCRIPT 時は redis-py が自動で EVAL）
+    script = _daily_limit_scripts.get(redis_client)
+    if script is None:
+        script = redis_client.register_script(DAILY_LIMIT_LUA)
+        _daily_limit_scripts[redis_client] = script
+    return script
 
-    async def check(self, member_id, feature):
-        return True 
\ No newline at end of file
+async def redis_incr_if_below(redis_client, key: str, limit: int, ttl: int = 86400) -> tuple[bool, int]:
+    """
+    Redis上のカウンタが limit 未満なら +1 する
+    redis.asyncio クライアントはそのまま await、同期クライアントはスレッドで実行する
+    Returns: (許可されたか, 加算後のカウント。拒否時は -1)
+    """
+    script = _daily_limit_script(redis_client)
+    if asyncio.iscoroutinefunction(redis_client.execute_command):
+        result = await script(keys=[key], args=[limit, ttl])
+    else:
+        result = await asyncio.to_thread(script, keys=[key], args=[limit, ttl])
+    result = int(result)
+    return result >= 0, result
@@ -5,18 +5,122 @@ class AuthService:
 
 import os
 import json
+import logging
+import threading
+from collections import OrderedDict
 from typing import Optional
 
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog が無い環境ではファイル変更通知なし（set_paid/set_free 経由の更新のみ反映）
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class EntitlementCache:
+    """
+    ユーザーIDごとの課金情報を保持する上限付きLRUキャッシュ
+    watchdog のスレッドからも無効化されるためロックで保護する
+    """
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class _FileChangeHandler(FileSystemEventHandler):
+    """ディレクトリ内のファイル変更をコールバックへ通知する（filenames を渡すとそのファイル名だけ）"""
+    def __init__(self, on_change, filenames=None):
+        self.on_change = on_change
+        self.filenames = frozenset(filenames) if filenames is not None else None
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if not path:
+                continue
+            path = os.fsdecode(path)
+            if self.filenames is None or os.path.basename(path) in self.filenames:
+                self.on_change(path)
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _watch_directory(directory: str, on_change, filenames=None):
+    """watchdog でディレクトリを監視する（filenames で通知するファイル名を限定）。利用できなければ None"""
+    if Observer is None:
+        return None
+    try:
+        observer = Observer()
+        observer.schedule(_FileChangeHandler(on_change, filenames), directory, recursive=False)
+        observer.daemon = True
+        observer.start()
+        return observer
+    except Exception as e:
+        logger.warning(f"Failed to watch {directory}: {e}")
+        return None
+
 class PaymentService:
     """
     課金・プラン管理サービス。将来的なStripe/Patreon等の外部連携や、
     ユーザー情報（名前・住所等）の管理もここに集約する。
     """
-    def __init__(self, db_path: str = ".payment_db.json"):
+    def __init__(self, db_path: str = ".payment_db.json", cache_size: int = 10000, watch: bool = True):
         self.db_path = db_path
         if not os.path.exists(self.db_path):
             with open(self.db_path, "w", encoding="utf-8") as f:
                 json.dump({}, f)
+        # is_paid/get_info はキャッシュから返し、DBファイルが外部で変更されたら全消去
+        self.cache = EntitlementCache(cache_size)
+        self._own_mtime = None
+        self._observer = None
+        if watch:
+            # DB はカレントディレクトリ直下にあるため、通知は DB ファイルの変更だけに絞る
+            self._observer = _watch_directory(
+                os.path.dirname(os.path.abspath(self.db_path)), self._on_file_change,
+                filenames={os.path.basename(self.db_path)},
+            )
+
+    def _on_file_change(self, path: str):
+        if os.path.abspath(path) != os.path.abspath(self.db_path):
+            return
+        # 自分の書き込みによる通知はキャッシュ更新済みなので無視
+        if _mtime(self.db_path) != self._own_mtime:
+            self.cache.clear()
 
     def _load(self):
         with open(self.db_path, "r", encoding="utf-8") as f:
@@ -25,26 +129,39 @@ class PaymentService:
     def _save(self, data):
         with open(self.db_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        self._own_mtime = _mtime(self.db_path)
+
+    def _entry(self, user_id: int) -> dict:
+        key = str(user_id)
+        entry = self.cache.get(key)
+        if entry is _MISSING:
+            entry = self._load().get(key, {})
+            self.cache.put(key, entry)
+        return entry
 
     def set_paid(self, user_id: int, info: Optional[dict] = None):
         """ユーザーを有料化し、必要なら追加情報も保存"""
         data = self._load()
         data[str(user_id)] = {"paid": True, "info": info or {}}
         self._save(data)
+        self.cache.put(str(user_id), data[str(user_id)])
 
     def set_free(self, user_id: int):
         """ユーザーを無料化"""
         data = self._load()
         data[str(user_id)] = {"paid": False, "info": {}}
         self._save(data)
+        self.cache.put(str(user_id), data[str(user_id)])
 
     def is_paid(self, user_id: int) -> bool:
-        data = self._load()
-        return data.get(str(user_id), {}).get("paid", False)
+        return self._entry(user_id).get("paid", False)
 
     def get_info(self, user_id: int) -> dict:
-        data = self._load()
-        return data.get(str(user_id), {}).get("info", {})
+        return self._entry(user_id).get("info", {})
+
+    def close(self):
+        if self._observer:
+            self._observer.stop()
 
     # 今後: Stripe/Patreon連携、決済履歴、ユーザー情報入力UIなどもここに追加 
 
@@ -52,41 +169,61 @@ class PaymentServiceV2:
     """
     DiscordユーザーIDごとに data/user_data/{id}.json を作成し、有料/無料状態を管理
     """
-    def __init__(self, user_data_dir: str = "data/user_data"):
+    def __init__(self, user_data_dir: str = "data/user_data", cache_size: int = 10000, watch: bool = True):
         self.user_data_dir = user_data_dir
         os.makedirs(self.user_data_dir, exist_ok=True)
+        # ファイル内容をユーザー単位でキャッシュし、外部からの変更は watchdog で個別に無効化
+        self.cache = EntitlementCache(cache_size)
+        self._own_mtimes = {}
+        self._observer = _watch_directory(self.user_data_dir, self._on_file_change) if watch else None
 
     def _get_path(self, user_id: int) -> str:
         return os.path.join(self.user_data_dir, f"{user_id}.json")
 
-    def set_paid(self, user_id: int, info: Optional[dict] = None):
+    def _on_file_change(self, path: str):
+        name = os.path.basename(path)
+        if not name.endswith(".json"):
+            return
+        key = name[:-len(".json")]
+        # 自分の書き込みによる通知はキャッシュ更新済みなので無視
+        if _mtime(path) != self._own_mtimes.get(key):
+            self.cache.invalidate(key)
+
+    def _load(self, user_id: int) -> dict:
+        key = str(user_id)
+        data = self.cache.get(key)
+        if data is not _MISSING:
+            return data
         path = self._get_path(user_id)
-        data = {"paid": True, "info": info or {}}
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        if not os.path.exists(path):
+            logger.debug(f"is_paid: user_id={user_id} ファイルが存在しません → False")
+            data = {}
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            logger.debug(f"is_paid: user_id={user_id} path={path} ファイル内容={data}")
+        self.cache.put(key, data)
+        return data
 
-    def set_free(self, user_id: int):
+    def _save(self, user_id: int, data: dict):
         path = self._get_path(user_id)
-        data = {"paid": False, "info": {}}
         with open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        self._own_mtimes[str(user_id)] = _mtime(path)
+        self.cache.put(str(user_id), data)
+
+    def set_paid(self, user_id: int, info: Optional[dict] = None):
+        self._save(user_id, {"paid": True, "info": info or {}})
+
+    def set_free(self, user_id: int):
+        self._save(user_id, {"paid": False, "info": {}})
 
     def is_paid(self, user_id: int) -> bool:
-        path = self._get_path(user_id)
-        print(f"[DEBUG] is_paid: user_id={user_id} path={path}")
-        if not os.path.exists(path):
-            print("[DEBUG] is_paid: ファイルが存在しません → False")
-            return False
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        result = data.get("paid", False)
-        print(f"[DEBUG] is_paid: ファイル内容={data} → result={result}")
-        return result
+        return self._load(user_id).get("paid", False)
 
     def get_info(self, user_id: int) -> dict:
-        path = self._get_path(user_id)
-        if not os.path.exists(path):
-            return {}
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data.get("info", {}) 
\ No newline at end of file
+        return self._load(user_id).get("info", {})
+
+    def close(self):
+        if self._observer:
+            self._observer.stop() 
\ No newline at end of file
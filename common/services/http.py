@@ -0,0 +1,59 @@
+# common/services/http.py
+"""
+サービス共通の aiohttp セッション
+
+プロセスで1つの ClientSession を共有し、keep-alive・ホストごとの接続数上限・DNSキャッシュを効かせる。
+BaseBot の起動時に warm_up() で接続を張っておき、終了時に close_session() で閉じる。
+"""
+import asyncio
+import logging
+import os
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_session: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """共有セッションを返す（初回呼び出し時にイベントループ上で生成）"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            limit_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20")),
+            ttl_dns_cache=int(os.getenv("HTTP_DNS_CACHE_TTL", "300")),
+            keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60")),
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=300, connect=10),
+        )
+    return _session
+
+
+async def warm_up(*urls: str, connections: int = 2):
+    """
+    各URLのホストに接続を張っておく（TCP+TLS ハンドシェイクを先に済ませる）
+    応答のステータスは問わず、失敗してもログのみ
+    """
+    session = get_session()
+
+    async def touch(url):
+        try:
+            async with session.get(url, allow_redirects=False) as response:
+                await response.read()
+        except Exception as e:
+            logger.warning(f"HTTP warm-up failed for {url}: {e}")
+
+    await asyncio.gather(*(touch(url) for url in urls for _ in range(connections)))
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,137 @@
+# common/services/llm.py
+"""
+非同期 LLM クライアント
+
+AsyncOpenAI を上限付きの httpx コネクションプールで共有し、呼び出しごとに期限を設ける。
+イベントループをブロックしないため、生成中も他ユーザーの操作や heartbeat が止まらない。
+"""
+import asyncio
+import logging
+import os
+
+import httpx
+from openai import AsyncOpenAI, RateLimitError
+
+from common.llm_governor import estimate_request_tokens, get_governor
+from common.llm_scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class LLMClient:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        max_connections: int | None = None,
+        default_timeout: float | None = None,
+        client=None,
+        cache=None,
+        scheduler=None,
+        governor=None,
+    ):
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        self.default_timeout = default_timeout or float(os.getenv("LLM_TIMEOUT", "30"))
+        self._http_client = None
+        if client is None:
+            # プール上限を超えた呼び出しは空きが出るまで待つ（最大 default_timeout 秒）
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(self.default_timeout, connect=10.0),
+            )
+            client = AsyncOpenAI(
+                api_key=api_key or os.getenv("OPENAI_API_KEY"),
+                http_client=self._http_client,
+            )
+        self._client = client
+        self.cache = cache  # common.llm_cache.ResponseCache（None なら無効）
+        self.scheduler = scheduler or get_scheduler()
+        self.governor = governor or get_governor("chat")
+
+    async def chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        timeout: float | None = None,
+        on_text=None,
+    ) -> str:
+        """
+        Chat Completions を1回呼び出して本文を返す
+        timeout 秒（リトライ込み）を超えたら asyncio.TimeoutError（スケジューラの待ち時間は含まない）
+        on_text を渡すとストリーミングで受信し、受信のたびにそれまでの本文で呼び出す
+        """
+        timeout = timeout or self.default_timeout
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(model, messages, temperature, max_tokens)
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                if on_text is not None:
+                    on_text(cached)
+                return cached
+
+        request = dict(model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
+        async with self.scheduler.slot():
+            # RPM/TPM の残量が足りなければ補充まで待つ（待ちすぎる場合は QuotaExceeded）
+            reserved = await self.governor.acquire(estimate_request_tokens(messages, max_tokens))
+            used = 0  # 失敗・タイムアウト時は予約したトークンをすべて返却
+            try:
+                if on_text is None:
+                    content, used = await asyncio.wait_for(self._complete(request), timeout=timeout)
+                else:
+                    content, used = await asyncio.wait_for(self._stream(request, on_text), timeout=timeout)
+            finally:
+                self.governor.settle(reserved, used)
+        if cache_key is not None and content:
+            await self.cache.aput(cache_key, content)
+        return content
+
+    async def _complete(self, request):
+        response = await self._create(**request)
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, getattr(usage, "total_tokens", None)
+
+    async def _stream(self, request, on_text):
+        stream = await self._create(**request, stream=True, stream_options={"include_usage": True})
+        text, used = "", None
+        async for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    text += delta
+                    on_text(text)
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                used = usage.total_tokens
+        return text, used
+
+    async def _create(self, **kwargs):
+        """応答ヘッダのレート制限情報をガバナに反映しつつ Chat Completions を呼ぶ"""
+        completions = self._client.chat.completions
+        raw_api = getattr(completions, "with_raw_response", None)
+        try:
+            if raw_api is None:
+                return await completions.create(**kwargs)
+            raw = await raw_api.create(**kwargs)
+        except RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            self.governor.penalize(float(retry_after) if retry_after else None)
+            raise
+        self.governor.update_from_headers(raw.headers)
+        return raw.parse()
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
@@ -1,15 +1,21 @@
 # OpenAI API 共通呼び出しサービスの骨格
-import aiohttp
 import os
 
+from common.llm_governor import QuotaExceeded, estimate_request_tokens, get_governor
+from common.llm_scheduler import get_scheduler
+from common.services.http import OPENAI_BASE_URL, get_session
+
 class OpenAIService:
     """
     OpenAIのAPIと通信するためのサービスクラス。
     各メソッドでモデルを指定できるため、Botごとに最適なモデルを使い分けることが可能。
     """
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, cache=None, scheduler=None, governor=None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
-        self.base_url = "https://api.openai.com/v1"
+        self.cache = cache  # common.llm_cache.ResponseCache（None なら無効）
+        self.scheduler = scheduler or get_scheduler()  # 同時実行数・優先度はプロセス共通で管理
+        self.governor = governor or get_governor("chat")  # RPM/TPM もプロセス共通
+        self.base_url = OPENAI_BASE_URL
         if not self.api_key:
             print("⚠️ 警告: OPENAI_API_KEYが設定されていません。OpenAI関連機能は使用できません。")
 
@@ -31,17 +37,38 @@ class OpenAIService:
             "messages": messages,
             "max_tokens": max_tokens,
         }
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(model, messages, None, max_tokens)
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                return cached
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        print(f"❌ OpenAI APIエラー: {response.status} {error_text}")
-                        return f"APIエラーが発生しました (コード: {response.status})。"
-                    
-                    data = await response.json()
-                    return data["choices"][0]["message"]["content"].strip()
+            async with self.scheduler.slot():
+                reserved = await self.governor.acquire(estimate_request_tokens(messages, max_tokens))
+                used = 0  # 失敗時は予約したトークンをすべて返却
+                try:
+                    async with get_session().post(url, headers=headers, json=payload) as response:
+                        self.governor.update_from_headers(response.headers)
+                        if response.status == 429:
+                            retry_after = response.headers.get("retry-after")
+                            self.governor.penalize(float(retry_after) if retry_after else None)
+                        if response.status != 200:
+                            error_text = await response.text()
+                            print(f"❌ OpenAI APIエラー: {response.status} {error_text}")
+                            return f"APIエラーが発生しました (コード: {response.status})。"
+
+                        data = await response.json()
+                        used = data.get("usage", {}).get("total_tokens")
+                        content = data["choices"][0]["message"]["content"].strip()
+                finally:
+                    self.governor.settle(reserved, used)
+            if cache_key is not None and content:
+                await self.cache.aput(cache_key, content)
+            return content
+        except QuotaExceeded as e:
+            return str(e)
         except Exception as e:
             print(f"❌ 予期せぬエラー: {e}")
             return "予期せぬエラーが発生しました。"
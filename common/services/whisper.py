@@ -1,16 +1,23 @@
 import aiohttp
 import os
 
+from common.llm_governor import get_governor
+from common.services.http import OPENAI_BASE_URL, get_session
+
 class WhisperService:
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, governor=None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.governor = governor or get_governor("whisper")
 
     async def transcribe(self, file_path: str, lang: str = "ja"):
-        url = "https://api.openai.com/v1/audio/transcriptions"
+        url = f"{OPENAI_BASE_URL}/audio/transcriptions"
         headers = {"Authorization": f"Bearer {self.api_key}"}
-        data = aiohttp.FormData()
-        data.add_field("model", "whisper-1")
-        data.add_field("file", open(file_path, "rb"), filename="audio.mp3")
-        async with aiohttp.ClientSession() as sess, sess.post(url, headers=headers, data=data) as r:
-            js = await r.json()
-            return js["text"] 
\ No newline at end of file
+        await self.governor.acquire()
+        with open(file_path, "rb") as f:
+            data = aiohttp.FormData()
+            data.add_field("model", "whisper-1")
+            data.add_field("file", f, filename="audio.mp3")
+            async with get_session().post(url, headers=headers, data=data) as r:
+                self.governor.update_from_headers(r.headers)
+                js = await r.json()
+                return js["text"]
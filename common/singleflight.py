@@ -0,0 +1,57 @@
+# common/singleflight.py
+"""
+重複リクエストの合流（singleflight）
+
+同じキー（操作名, メッセージID・内容ハッシュ等）の処理が実行中なら、新しく始めずに
+実行中の結果を待って同じ値（または同じ例外）を受け取る。完了したキーは忘れるので、
+後から来た同じリクエストは改めて実行される（結果のキャッシュではない）。
+
+処理は独立したタスクで実行するため、最初の呼び出し元がキャンセルされても
+合流した他の呼び出し元には結果が届く。
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """key の処理が実行中ならその結果を、なければ fn() を実行してその結果を返す"""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        self._record(key, shared)
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 呼び出し元が全員キャンセルした場合でも例外を「未取得」のまま残さない
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"SingleFlight: {key!r} failed: {task.exception()}")
+
+    def _record(self, key, shared):
+        if shared:
+            self.shared += 1
+        else:
+            self.executed += 1
+        if self.metrics is not None:
+            operation = key[0] if isinstance(key, tuple) else str(key)
+            self.metrics.inc("tdd_singleflight_calls_total", operation=operation, result="shared" if shared else "executed")
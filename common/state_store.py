@@ -0,0 +1,235 @@
+# common/state_store.py
+"""
+SQLite(WAL) ベースの状態ストア
+
+rate_limit.json / email_history.json を置き換え、同一ホスト上の複数Botプロセスで
+利用回数カウンタ・処理中フラグ・メール履歴を共有する。
+同期メソッドはSQLiteを直接叩き、`a` 付きの非同期メソッドは専用スレッドプールで実行する。
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from typing import Optional, Tuple
+
+from common.log_dict import read_log_dict
+
+logger = logging.getLogger(__name__)
+
+
+def _has_state(path) -> bool:
+    """JSON スナップショットか、ログ型バックエンドのログのいずれかがある"""
+    return any(Path(p).exists() for p in (path, f"{path}.log", f"{path}.log.old"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key        TEXT PRIMARY KEY,
+    value      INTEGER NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_counters_expires_at ON counters(expires_at);
+
+CREATE TABLE IF NOT EXISTS flags (
+    key        TEXT PRIMARY KEY,
+    owner      TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_flags_created_at ON flags(created_at);
+
+CREATE TABLE IF NOT EXISTS email_history (
+    key        TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class StateStore:
+    def __init__(self, db_path: str = "cache/state.db", max_workers: int = 2):
+        self.db_path = db_path
+        self.owner = f"{os.uname().nodename}:{os.getpid()}"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="state-store")
+        self._conn().executescript(_SCHEMA)
+
+    # --- 接続管理 --------------------------------------
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッドをまたげないため、スレッドごとに保持する
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    # --- 利用回数カウンタ -------------------------------
+    def incr_if_below(self, key: str, limit: int, expires_at: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        カウンタが limit 未満なら +1 する（プロセス間でアトミック）
+        Returns: (許可されたか, 更新後または現在のカウント)
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM counters WHERE key = ?", (key,)).fetchone()
+            count = 0
+            if row and (row[1] is None or row[1] > now):
+                count = row[0]
+            if count >= limit:
+                conn.execute("COMMIT")
+                return False, count
+            conn.execute(
+                "INSERT INTO counters(key, value, expires_at) VALUES(?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, count + 1, expires_at),
+            )
+            conn.execute("COMMIT")
+            return True, count + 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_counter(self, key: str) -> int:
+        row = self._conn().execute(
+            "SELECT value FROM counters WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+    # --- 処理中フラグ -----------------------------------
+    def acquire_flag(self, key: str) -> bool:
+        """フラグを立てる。既に他の処理が立てていれば False"""
+        cur = self._conn().execute(
+            "INSERT OR IGNORE INTO flags(key, owner, created_at) VALUES(?, ?, ?)",
+            (key, self.owner, time.time()),
+        )
+        return cur.rowcount == 1
+
+    def release_flag(self, key: str):
+        self._conn().execute("DELETE FROM flags WHERE key = ?", (key,))
+
+    def has_flag(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM flags WHERE key = ?", (key,)).fetchone() is not None
+
+    # --- メール履歴 -------------------------------------
+    def get_email(self, key: str) -> dict:
+        row = self._conn().execute("SELECT data FROM email_history WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set_email(self, key: str, data: dict):
+        self._conn().execute(
+            "INSERT INTO email_history(key, data, updated_at) VALUES(?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (key, json.dumps(data, ensure_ascii=False), time.time()),
+        )
+
+    # --- 期限切れの掃除 ---------------------------------
+    def purge_expired(self, flag_ttl: float) -> Tuple[int, int]:
+        """
+        期限切れカウンタと、flag_ttl 秒以上残っている孤立フラグを削除（いずれもインデックス経由）
+        Returns: (削除したカウンタ数, 削除したフラグ数)
+        """
+        conn = self._conn()
+        now = time.time()
+        counters = conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,)).rowcount
+        flags = conn.execute("DELETE FROM flags WHERE created_at <= ?", (now - flag_ttl,)).rowcount
+        return counters, flags
+
+    # --- 非同期ラッパー ---------------------------------
+    async def aincr_if_below(self, key: str, limit: int, expires_at: Optional[float] = None) -> Tuple[bool, int]:
+        return await self._run(self.incr_if_below, key, limit, expires_at)
+
+    async def aget_counter(self, key: str) -> int:
+        return await self._run(self.get_counter, key)
+
+    async def aacquire_flag(self, key: str) -> bool:
+        return await self._run(self.acquire_flag, key)
+
+    async def arelease_flag(self, key: str):
+        return await self._run(self.release_flag, key)
+
+    async def apurge_expired(self, flag_ttl: float) -> Tuple[int, int]:
+        return await self._run(self.purge_expired, flag_ttl)
+
+    async def aget_email(self, key: str) -> dict:
+        return await self._run(self.get_email, key)
+
+    async def aset_email(self, key: str, data: dict):
+        return await self._run(self.set_email, key, data)
+
+    # --- JSONからの移行 ---------------------------------
+    def migrate_from_json(self, rate_limit_path: str, email_history_path: str) -> bool:
+        """
+        既存の cache/rate_limit.json と cache/email_history.json を一度だけ取り込む
+        処理中フラグ（processing:* 等）は移行時点で孤立しているため取り込まない
+        ログ型バックエンド（LogStructuredDict）の `.log` に残っている未圧縮の更新も再生してから取り込む
+        複数プロセスが同時に起動しても、書き込みロック（BEGIN IMMEDIATE）の中で確認するので移行は1回だけ
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return False
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                conn.execute("ROLLBACK")
+                return False  # ロック待ちの間に別プロセスが移行済み
+
+            counters = 0
+            if _has_state(rate_limit_path):
+                data = read_log_dict(rate_limit_path)
+                for key, value in data.items():
+                    if not key.startswith("limit:"):
+                        continue
+                    day = key.rsplit(":", 1)[-1]
+                    try:
+                        expires_at = (datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)).timestamp()
+                    except ValueError:
+                        expires_at = None
+                    conn.execute(
+                        "INSERT OR REPLACE INTO counters(key, value, expires_at) VALUES(?, ?, ?)",
+                        (key, int(value or 0), expires_at),
+                    )
+                    counters += 1
+
+            emails = 0
+            if _has_state(email_history_path):
+                data = read_log_dict(email_history_path)
+                now = time.time()
+                for key, value in data.items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO email_history(key, data, updated_at) VALUES(?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now),
+                    )
+                    emails += 1
+
+            conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES('json_migrated', ?)", (datetime.now(timezone.utc).isoformat(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"StateStore: migrated {counters} counters and {emails} email history entries from JSON")
+        return True
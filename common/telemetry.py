@@ -0,0 +1,94 @@
+# common/telemetry.py
+"""
+Rate Limit イベントの固定メモリ集計
+
+- 直近イベント: 固定長リングバッファ
+- 分単位の件数: 過去24時間分を事前確保した配列（1440スロット）に記録
+- ユーザー別・コマンド別: Space-Saving による上位K件の近似カウント
+いずれも記録・参照のコストがイベント数に依存しない。
+"""
+import time
+from typing import Optional
+
+MINUTES_PER_DAY = 1440
+
+
+class RingBuffer:
+    def __init__(self, size: int):
+        self._items = [None] * size
+        self._next = 0
+        self._count = 0
+
+    def append(self, item):
+        self._items[self._next] = item
+        self._next = (self._next + 1) % len(self._items)
+        self._count = min(self._count + 1, len(self._items))
+
+    def latest(self, n: int) -> list:
+        """新しい順に最大n件"""
+        n = min(n, self._count)
+        size = len(self._items)
+        return [self._items[(self._next - 1 - i) % size] for i in range(n)]
+
+    def __len__(self):
+        return self._count
+
+
+class TopK:
+    """Space-Saving: k 個のカウンタだけで頻出キーを追跡する（件数は過大評価側の近似）"""
+    def __init__(self, k: int):
+        self.k = k
+        self._counts = {}
+
+    def add(self, key, amount: int = 1):
+        if key in self._counts or len(self._counts) < self.k:
+            self._counts[key] = self._counts.get(key, 0) + amount
+            return
+        # 最小カウンタを置き換え、その値を引き継ぐ
+        victim = min(self._counts, key=self._counts.get)
+        self._counts[key] = self._counts.pop(victim) + amount
+
+    def top(self, n: int) -> list:
+        return sorted(self._counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+class MinuteRollup:
+    """過去24時間の分単位件数。スロットは分の通し番号で再利用する"""
+    def __init__(self):
+        self._counts = [0] * MINUTES_PER_DAY
+        self._minutes = [-1] * MINUTES_PER_DAY
+
+    def add(self, ts: float, amount: int = 1):
+        minute = int(ts // 60)
+        slot = minute % MINUTES_PER_DAY
+        if self._minutes[slot] != minute:
+            self._minutes[slot] = minute
+            self._counts[slot] = 0
+        self._counts[slot] += amount
+
+    def hourly(self, now: Optional[float] = None) -> dict:
+        """過去24時間の件数を1時間単位で集計 {時刻の先頭(epoch秒): 件数}"""
+        now_minute = int((time.time() if now is None else now) // 60)
+        hours = {}
+        for minute, count in zip(self._minutes, self._counts):
+            if count and now_minute - MINUTES_PER_DAY < minute <= now_minute:
+                hour = minute // 60 * 3600
+                hours[hour] = hours.get(hour, 0) + count
+        return hours
+
+
+class RateLimitTelemetry:
+    def __init__(self, recent_size: int = 50, top_k: int = 32):
+        self.total = 0
+        self.recent = RingBuffer(recent_size)
+        self.per_minute = MinuteRollup()
+        self.users = TopK(top_k)
+        self.commands = TopK(top_k)
+
+    def record(self, user_id, command: str, details: dict, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self.total += 1
+        self.users.add(user_id)
+        self.commands.add(command)
+        self.per_minute.add(now)
+        self.recent.append({"timestamp": now, "user_id": user_id, "command": command, "details": details})
@@ -0,0 +1,128 @@
+# common/tokens.py
+"""
+トークン数の計測と予算配分
+
+- tiktoken とエンコーディングファイル（TIKTOKEN_CACHE_DIR に配置済みのもの）があれば正確なトークン数で数える
+  初回の読み込みはファイルの取得（キャッシュに無ければダウンロード）を伴うため、起動時に
+  load_encoding() をスレッドで呼んでおき、イベントループ上では読み込み済みのものだけを使う
+- 無い環境（オフライン等）では文字種ごとの概算で数える（日本語は1文字1トークン = 安全側）
+- TokenBudget は入力をコンテキスト予算に収め、残りから max_tokens を決める
+"""
+import logging
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken が無い環境では概算のみ
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+# メッセージごとの固定オーバーヘッド（ロール・区切りトークン）
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算（安全側）
+    ASCII は約4文字で1トークン、日本語などそれ以外は1文字1トークンとして数える
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """モデルのエンコーディング。読み込めなければ None（概算にフォールバック）"""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding for {model} unavailable, using estimate: {e}")
+        return None
+
+
+def load_encoding(model: str = DEFAULT_MODEL) -> bool:
+    """エンコーディングを読み込んでおく（ブロックするので asyncio.to_thread で呼ぶ）。使えるなら True"""
+    return _encoding(model) is not None
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[dict], model: str = DEFAULT_MODEL) -> int:
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD for m in messages) + 3
+
+
+def truncate_to_tokens(text: str, limit: int, model: str = DEFAULT_MODEL) -> str:
+    """先頭から limit トークン以内に収まる最長の部分を返す"""
+    if count_tokens(text, model) <= limit:
+        return text
+    encoding = _encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max(limit, 0)])
+    # 概算は文字数に対して単調なので二分探索（4文字で最低1トークンなので範囲は先頭 (limit + 1) * 4 文字まで）
+    low, high = 0, min(len(text), (max(limit, 0) + 1) * 4)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+@dataclass
+class TokenBudget:
+    """
+    1回の呼び出しのトークン配分
+
+    context_tokens: モデルのコンテキスト長
+    input_tokens: 本文（テンプレートに埋め込むコンテンツ）に使う上限。超える本文は分割要約か切り詰めの対象
+    max_output_tokens: モデルの出力上限
+    """
+    context_tokens: int = 128000
+    input_tokens: int = 6000
+    max_output_tokens: int = 16384
+    model: str = DEFAULT_MODEL
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            context_tokens=int(os.getenv("LLM_CONTEXT_TOKENS", "128000")),
+            input_tokens=int(os.getenv("LLM_INPUT_TOKENS", "6000")),
+            max_output_tokens=int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "16384")),
+        )
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def fits(self, text: str) -> bool:
+        return self.count(text) <= self.input_tokens
+
+    def fit(self, text: str, marker: str = "") -> str:
+        """本文を input_tokens 以内に切り詰める。切った場合は marker を付ける"""
+        if self.fits(text):
+            return text
+        return truncate_to_tokens(text, self.input_tokens - self.count(marker), self.model) + marker
+
+    def max_tokens(self, messages: list[dict], expected: int, floor: int = 64) -> int:
+        """
+        出力に見込む expected トークンを、コンテキストの残りと出力上限の範囲に収めて返す
+        小さすぎて途中で切れるのを防ぐため floor を下限とする
+        """
+        remaining = self.context_tokens - count_message_tokens(messages, self.model)
+        return max(floor, min(expected, remaining, self.max_output_tokens))
@@ -0,0 +1,225 @@
+# common/transcription.py
+"""
+長い音声の分割・並列文字起こし
+
+1. ffprobe で長さを調べ、segment_seconds の1.5倍以下（かつ Whisper のサイズ上限未満）なら1回で文字起こし
+2. 長ければ ffmpeg の silencedetect で無音区間を探し、目標長の付近の無音で区切る
+   （無音が見つからない区間は最大長で切り、前後を overlap_seconds 重ねる）
+3. 区間ごとに低ビットレートの音声を切り出し、max_workers 件まで並行して文字起こし
+4. 順番どおりに連結し、重ねた部分で重複した文字列を取り除く
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Whisper API のファイルサイズ上限（25MB）に余裕を持たせた値。超えるファイルは短くても再エンコードする
+MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+async def _run(*cmd) -> tuple[int, bytes, bytes]:
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode, stdout, stderr
+
+
+async def probe_duration(path: str) -> Optional[float]:
+    """ffprobe で長さ（秒）を取得。取得できなければ None"""
+    try:
+        code, stdout, stderr = await _run(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", path,
+        )
+    except FileNotFoundError:
+        logger.warning("ffprobe is not installed; transcribing without splitting")
+        return None
+    if code != 0:
+        logger.warning(f"ffprobe failed for {path}: {stderr.decode('utf-8', errors='ignore')[-300:]}")
+        return None
+    try:
+        return float(stdout.decode().strip())
+    except ValueError:
+        return None
+
+
+def parse_silences(stderr_text: str, duration: Optional[float] = None) -> list[tuple[float, float]]:
+    """silencedetect の出力から [(無音開始, 無音終了)] を取り出す（末尾まで続く無音は duration で閉じる）"""
+    silences, start = [], None
+    for line in stderr_text.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None and duration is not None:
+        silences.append((start, duration))
+    return silences
+
+
+async def detect_silences(path: str, noise_db: int = -30, min_silence: float = 0.5,
+                          duration: Optional[float] = None) -> list[tuple[float, float]]:
+    code, _, stderr = await _run(
+        "ffmpeg", "-hide_banner", "-nostats", "-i", path,
+        "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-",
+    )
+    if code != 0:
+        logger.warning(f"silencedetect failed for {path}; splitting at fixed intervals")
+        return []
+    return parse_silences(stderr.decode("utf-8", errors="ignore"), duration)
+
+
+def plan_segments(duration: float, silences: list[tuple[float, float]], target: float,
+                  max_length: Optional[float] = None, overlap: float = 1.5) -> list[tuple[float, float]]:
+    """
+    [(開始秒, 終了秒)] の区間リストを作る
+
+    各区間は target 秒付近の無音の中央で区切る（target の 0.5〜max_length 倍の範囲で
+    target に最も近い無音を選ぶ）。範囲内に無音が無ければ max_length 秒で切り、
+    次の区間の開始を overlap 秒前に戻して語の途切れを防ぐ。
+    """
+    max_length = max_length or target * 1.5
+    cuts = sorted((s + e) / 2 for s, e in silences)
+    segments, start = [], 0.0
+    while duration - start > max_length:
+        window = [c for c in cuts if start + target * 0.5 <= c <= start + max_length]
+        if window:
+            end = min(window, key=lambda c: abs(c - start - target))
+            segments.append((start, end))
+            start = end
+        else:
+            end = start + max_length
+            segments.append((start, end))
+            start = end - overlap
+    segments.append((start, duration))
+    return segments
+
+
+async def cut_segment(path: str, start: float, end: float, output_path: str, bitrate: str = "32k") -> None:
+    """区間を 16kHz モノラルの低ビットレート MP3 として切り出す"""
+    code, _, stderr = await _run(
+        "ffmpeg", "-hide_banner", "-nostats", "-y",
+        "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", path,
+        "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", bitrate,
+        output_path,
+    )
+    if code != 0:
+        raise RuntimeError(f"ffmpeg failed to cut {start:.1f}-{end:.1f}s: {stderr.decode('utf-8', errors='ignore')[-300:]}")
+
+
+def merge_transcripts(texts: list[str], max_overlap: int = 200, min_overlap: int = 4) -> str:
+    """
+    区間ごとの文字起こしを順に連結する
+    前の区間の末尾と次の区間の先頭が一致する部分（重ねて切り出した音声の重複）は1回だけ残す
+    """
+    merged = ""
+    for text in texts:
+        text = (text or "").strip()
+        if not text:
+            continue
+        if not merged:
+            merged = text
+            continue
+        overlap = 0
+        for size in range(min(max_overlap, len(merged), len(text)), min_overlap - 1, -1):
+            if merged.endswith(text[:size]):
+                overlap = size
+                break
+        rest = text[overlap:].lstrip()
+        separator = "" if not rest or _is_cjk(merged[-1]) or _is_cjk(rest[0]) else " "
+        merged = f"{merged}{separator}{rest}"
+    return merged
+
+
+def _is_cjk(ch: str) -> bool:
+    return ord(ch) >= 0x3000
+
+
+class TranscriptionEngine:
+    def __init__(
+        self,
+        transcribe: Callable[[str], Awaitable[str]],
+        max_workers: int = 4,
+        segment_seconds: float = 300.0,
+        overlap_seconds: float = 1.5,
+    ):
+        """
+        Args:
+            transcribe: 音声ファイルのパスを受け取り文字起こし結果を返す async 関数（Whisper 呼び出し）
+            max_workers: 同時に切り出し・文字起こしする区間数
+            segment_seconds: 区間の目標長（秒）。これ以下の音声は分割しない
+            overlap_seconds: 無音で区切れなかった区間の重ね幅（秒）
+        """
+        self._transcribe = transcribe
+        self.max_workers = max_workers
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+
+    @classmethod
+    def from_env(cls, transcribe):
+        return cls(
+            transcribe,
+            max_workers=int(os.getenv("TRANSCRIBE_MAX_WORKERS", "4")),
+            segment_seconds=float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "300")),
+            overlap_seconds=float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "1.5")),
+        )
+
+    async def transcribe_file(self, path: str, on_progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """
+        path の音声（動画でも可）を文字起こしする
+        on_progress には (完了区間数, 総区間数) を通知する
+        """
+        duration = await probe_duration(path)
+        oversized = os.path.getsize(path) > MAX_UPLOAD_BYTES
+        if duration is None or (duration <= self.segment_seconds * 1.5 and not oversized):
+            if on_progress:
+                on_progress(0, 1)
+            text = await self._transcribe(path)
+            if on_progress:
+                on_progress(1, 1)
+            return text
+
+        silences = await detect_silences(path, duration=duration) if duration > self.segment_seconds * 1.5 else []
+        segments = plan_segments(duration, silences, self.segment_seconds, overlap=self.overlap_seconds)
+        logger.info(f"Transcription: {duration:.0f}s split into {len(segments)} segments ({len(silences)} silences)")
+        total, done = len(segments), 0
+        if on_progress:
+            on_progress(0, total)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        with tempfile.TemporaryDirectory(prefix="transcribe_") as workdir:
+            async def run(index, start, end):
+                nonlocal done
+                async with semaphore:
+                    segment_path = os.path.join(workdir, f"segment_{index:04d}.mp3")
+                    await cut_segment(path, start, end, segment_path)
+                    try:
+                        text = await self._transcribe(segment_path)
+                    finally:
+                        os.unlink(segment_path)
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+                return text
+
+            tasks = [asyncio.create_task(run(i, s, e)) for i, (s, e) in enumerate(segments)]
+            try:
+                texts = await asyncio.gather(*tasks)
+            except BaseException:
+                # 1区間でも失敗したら残りを止めてから作業ディレクトリを消す
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        return merge_transcripts(texts)
@@ -7,6 +7,7 @@ TDD Discord Bot - ファイル/音声/動画→Markdown ジェネレータ
 # --- Additional Imports for Persistent Caching and File Watching ---
 import discord
 from discord.ext import commands
+import aiohttp
 import asyncio
 import os
 import tempfile
@@ -16,7 +17,7 @@ import json
 import subprocess
 import mimetypes
 from typing import Optional, Tuple
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
 from dotenv import load_dotenv
 import logging
 import smtplib
@@ -27,9 +28,30 @@ import yaml
 import fcntl
 # Persistent cache and file watching support
 import threading
+import time
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from common.log_dict import LogStructuredDict
+from common.state_store import StateStore
+from common.expiry import ExpiryIndex
+from common.ratelimit import redis_incr_if_below
+from common.debug_log import BufferedFileLogger
+from common.telemetry import RateLimitTelemetry
+from common.metrics import MetricsRegistry, start_metrics_server
+from common.services.llm import LLMClient
+from common.llm_cache import ResponseCache
+from common.llm_scheduler import current_llm_request, get_scheduler, llm_request
+from common.llm_governor import QuotaExceeded, get_governor
+from common.progress import ThrottledEditor, preview_tail
+from common.longdoc import map_reduce
+from common.tokens import TokenBudget, load_encoding, truncate_to_tokens
+from common.singleflight import SingleFlight
+from common.transcription import TranscriptionEngine
+from common.media import AUDIO_FORMATS, AudioPipe, ExtractionError, extract_audio_bytes, extract_audio_path, needs_seek
+from common.ingest import SpooledUpload, as_path, ingest, iter_chunks
+from common.extraction_cache import ExtractionCache, content_digest
+from common.pdf_extract import get_pdf_extractor
 
 # --- Persistent JSON-backed dict for cache ---
 class SyncDictJSON(dict):
@@ -61,6 +83,18 @@ class SyncDictJSON(dict):
             super().__delitem__(key)
             self._flush()
 
+    def delete_many(self, keys) -> int:
+        """存在するキーをまとめて削除し、削除件数を返す（ファイルの書き直しは1回）"""
+        with self.lock:
+            removed = 0
+            for key in keys:
+                if key in self:
+                    super().__delitem__(key)
+                    removed += 1
+            if removed:
+                self._flush()
+        return removed
+
     def _flush(self):
         tmp = f"{self.path}.tmp"
         with open(tmp, "w", encoding="utf-8") as f:
@@ -153,16 +187,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # INSERT デバッグ用ファイルログ (Discord API負荷なし)
-def debug_log_to_file(message: str):
+# 書き込みはバックグラウンドスレッドでまとめて行い、呼び出し側はキュー投入のみ
+DEBUG_LOGGER = BufferedFileLogger(
+    path=os.getenv('DEBUG_LOG_PATH', 'debug_insert.log'),
+    max_bytes=int(os.getenv('DEBUG_LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+    max_age=int(os.getenv('DEBUG_LOG_MAX_AGE', '86400')),
+    backup_count=int(os.getenv('DEBUG_LOG_BACKUPS', '5')),
+)
+
+def debug_log_to_file(message: str, level: int = logging.DEBUG):
     """DEBUG専用ファイルログ - Discord APIを使わない"""
-    try:
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open("debug_insert.log", "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] {message}\n")
-            f.flush()
-    except Exception as e:
-        print(f"Debug log error: {e}")
+    DEBUG_LOGGER.log(message, level)
 
 # --- 依存性チェック ---
 class DependencyError(Exception):
@@ -199,52 +234,69 @@ def check_dependencies():
         logger.info("✅ All dependencies check passed")
 
 # --- Rate Limiting モニタリングデータ収集 ---
-RATE_LIMIT_STATS = {
-    'total_429_errors': 0,
-    'errors_by_user': {},
-    'errors_by_command': {},
-    'errors_by_hour': {},
-    'recent_errors': []  # 最近50件のエラー情報
-}
+# 直近50件・過去24時間の分単位件数・上位ユーザー/コマンドを固定メモリで保持
+RATE_LIMIT_TELEMETRY = RateLimitTelemetry(recent_size=50, top_k=32)
+
+# --- 処理時間メトリクス ---
+# METRICS_PORT を指定すると http://METRICS_HOST:METRICS_PORT/metrics で Prometheus 形式を公開
+METRICS = MetricsRegistry()
+METRICS.describe("tdd_article_stage_seconds", "Duration of each /article stage")
+METRICS.describe("tdd_article_stage_errors_total", "Failures per /article stage")
+METRICS.describe("tdd_discord_api_seconds", "Duration of Discord API calls made through safe_discord_api_call")
+METRICS.describe("tdd_discord_api_errors_total", "Failed Discord API call attempts")
+METRICS.describe("tdd_discord_api_429_total", "Discord API calls that hit a 429")
+METRICS.describe("tdd_llm_cache_requests_total", "LLM response cache lookups by result")
+METRICS.describe("tdd_llm_queue_wait_seconds", "Time LLM calls spent waiting for a scheduler slot")
+METRICS.describe("tdd_llm_quota_utilization", "Estimated share of the OpenAI RPM/TPM quota in use")
+METRICS.describe("tdd_llm_quota_waiting", "Requests waiting for OpenAI quota to refill")
+METRICS.describe("tdd_llm_quota_shed_total", "Requests shed because the quota would not recover in time")
+METRICS.describe("tdd_longdoc_chunks_total", "Chunks summarized by the long-document map-reduce")
+METRICS.describe("tdd_attachment_download_seconds", "Time spent downloading and ingesting Discord attachments")
+METRICS.describe("tdd_extraction_cache_requests_total", "Extraction cache lookups by result (id_hit / hash_hit / miss)")
+METRICS.describe("tdd_singleflight_calls_total", "Coalesced operations by whether they executed or joined an in-flight call")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# ストリーミング生成: /article・insert の途中経過を PROGRESS_EDIT_INTERVAL 秒ごとに表示
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1").lower() in ("1", "true", "yes", "on")
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.5"))
+
+# 動画の音声抽出: pipe = stdin/stdout 経由で圧縮音声をメモリに受け取る / wav = 従来の一時ファイル + WAV
+AUDIO_EXTRACT_MODE = os.getenv("AUDIO_EXTRACT_MODE", "pipe").lower()
+AUDIO_EXTRACT_FORMAT = os.getenv("AUDIO_EXTRACT_FORMAT", "opus").lower()
+AUDIO_EXTRACT_BITRATE = os.getenv("AUDIO_EXTRACT_BITRATE", "24k")
+
+# 添付の取り込み: INGEST_SPOOL_BYTES まではメモリ、超えたら一時ファイルに書き出す
+INGEST_SPOOL_BYTES = int(os.getenv("INGEST_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# ダウンロード中から ffmpeg に流し込める動画の形式（先頭バイトで判定。MP4 は moov が先頭にある場合のみ）
+STREAMABLE_VIDEO_FORMATS = {"webm", "ogg", "mp3", "wav", "flac"}
+
+# トークン予算: 本文は LLM_INPUT_TOKENS まで（超える入力はチャンクごとに要点抽出してから生成）
+TOKEN_BUDGET = TokenBudget.from_env()
+LONGDOC_CONCURRENCY = int(os.getenv("LONGDOC_CONCURRENCY", "8"))
+# PDF はこのトークン数に達したら以降のページを読まない（分割要約で扱える量を超えた分は使われないため）
+PDF_MAX_TOKENS = int(os.getenv("PDF_MAX_TOKENS", "150000"))
+
+# 生成の期限: 出力が遅い場合でもこの速度（トークン/秒）なら間に合うだけの時間を max_tokens に応じて足す
+LLM_MIN_TOKENS_PER_SECOND = float(os.getenv("LLM_MIN_TOKENS_PER_SECOND", "40"))
+
+def output_budget(system_prompt: str, user_prompt: str, expected: int) -> int:
+    """見込みの出力トークン数をコンテキストの残りと出力上限に収めた max_tokens"""
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    return TOKEN_BUDGET.max_tokens(messages, expected)
+
+def output_timeout(max_tokens: int, base: float = 30) -> float:
+    """max_tokens まで生成し切れる LLM 呼び出しの期限（秒）。LLMClient.chat の timeout はストリーミング込みの総時間"""
+    return base + max_tokens / LLM_MIN_TOKENS_PER_SECOND
 
 def log_rate_limit_event(user_id, command_name, error_details):
     """
     Rate Limitイベントを統計情報に記録
     """
-    from datetime import datetime
-    
-    # 全体統計更新
-    RATE_LIMIT_STATS['total_429_errors'] += 1
-    
-    # ユーザー別統計
-    if user_id not in RATE_LIMIT_STATS['errors_by_user']:
-        RATE_LIMIT_STATS['errors_by_user'][user_id] = 0
-    RATE_LIMIT_STATS['errors_by_user'][user_id] += 1
-    
-    # コマンド別統計
-    if command_name not in RATE_LIMIT_STATS['errors_by_command']:
-        RATE_LIMIT_STATS['errors_by_command'][command_name] = 0
-    RATE_LIMIT_STATS['errors_by_command'][command_name] += 1
-    
-    # 時間帯別統計
-    hour = datetime.now().hour
-    if hour not in RATE_LIMIT_STATS['errors_by_hour']:
-        RATE_LIMIT_STATS['errors_by_hour'][hour] = 0
-    RATE_LIMIT_STATS['errors_by_hour'][hour] += 1
-    
-    # 最近のエラー情報を保存（最大50件）
-    recent_error = {
-        'timestamp': datetime.now().isoformat(),
-        'user_id': user_id,
-        'command': command_name,
-        'details': error_details
-    }
-    RATE_LIMIT_STATS['recent_errors'].append(recent_error)
-    if len(RATE_LIMIT_STATS['recent_errors']) > 50:
-        RATE_LIMIT_STATS['recent_errors'].pop(0)
+    RATE_LIMIT_TELEMETRY.record(user_id, command_name, error_details)
     
     # 統計サマリーログ
-    debug_log_to_file(f"RATE_LIMIT_STATS: Total: {RATE_LIMIT_STATS['total_429_errors']}, User {user_id}: {RATE_LIMIT_STATS['errors_by_user'][user_id]}, Command {command_name}: {RATE_LIMIT_STATS['errors_by_command'][command_name]}")
+    debug_log_to_file(f"RATE_LIMIT_STATS: Total: {RATE_LIMIT_TELEMETRY.total}, User {user_id}, Command {command_name}")
 
 # --- ユーザー権限キャッシュ ---
 USER_PERMISSIONS_CACHE = {}
@@ -300,7 +352,7 @@ def load_prompts_config():
                 debug_log_to_file(f"PROMPTS: Configuration file {prompts_path} not found, using defaults")
                 PROMPTS_CONFIG = {}
         except Exception as e:
-            debug_log_to_file(f"PROMPTS: Failed to load configuration: {e}")
+            debug_log_to_file(f"PROMPTS: Failed to load configuration: {e}", logging.ERROR)
             PROMPTS_CONFIG = {}
     return PROMPTS_CONFIG
 
@@ -331,7 +383,7 @@ def get_prompt(category, key, **kwargs):
         debug_log_to_file(f"PROMPTS: Retrieved {category}.{key}, length: {len(prompt_text)}")
         return prompt_text
     except Exception as e:
-        debug_log_to_file(f"PROMPTS: Failed to get {category}.{key}: {e}")
+        debug_log_to_file(f"PROMPTS: Failed to get {category}.{key}: {e}", logging.ERROR)
         return ""
 
 def get_discord_message(category, key, default=""):
@@ -342,7 +394,7 @@ def get_discord_message(category, key, default=""):
     try:
         return config.get('discord_messages', {}).get(category, {}).get(key, default)
     except Exception as e:
-        debug_log_to_file(f"PROMPTS: Failed to get discord message {category}.{key}: {e}")
+        debug_log_to_file(f"PROMPTS: Failed to get discord message {category}.{key}: {e}", logging.ERROR)
         return default
 
 # --- 例外クラス ---
@@ -354,13 +406,70 @@ class UnsupportedFileType(Exception):
     """サポートされていないファイル形式例外"""
     pass
 
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'json').lower()
+
+def open_persistent_cache(path: str):
+    """
+    CACHE_BACKEND に応じて永続キャッシュを生成
+    - json: 変更ごとにファイル全体を書き直す（従来動作）
+    - log : 変更ごとに1レコード追記し、閾値超過でバックグラウンド圧縮
+    """
+    if CACHE_BACKEND == "log":
+        return LogStructuredDict.create(
+            path,
+            compact_threshold=int(os.getenv('CACHE_LOG_COMPACT_BYTES', str(1024 * 1024))),
+            group_commit_ms=int(os.getenv('CACHE_GROUP_COMMIT_MS', '0')),
+        )
+    return SyncDictJSON.create(path)
+
 # --- In-memory caches with asyncio locks for thread safety ---
 # Fixed: Replace SyncDictJSON with standard dicts + asyncio.Lock to prevent race conditions
-RATE_LIMIT_CACHE = SyncDictJSON.create("cache/rate_limit.json")  # Keep for rate limiting
+# CACHE_BACKEND=sqlite の場合は SQLite(WAL) の状態ストアを複数プロセスで共有する
+STATE_STORE = None
+if CACHE_BACKEND == "sqlite":
+    STATE_STORE = StateStore(os.getenv('STATE_DB_PATH', 'cache/state.db'))
+    STATE_STORE.migrate_from_json("cache/rate_limit.json", "cache/email_history.json")
+    RATE_LIMIT_CACHE = {}  # 状態ストア利用時は未使用
+else:
+    RATE_LIMIT_CACHE = open_persistent_cache("cache/rate_limit.json")  # Keep for rate limiting
 INSERT_MODE_CACHE = {}  # Simple dict with asyncio.Lock protection
 insert_cache_lock = None  # Will be initialized in main after event loop starts
 # --- Persistent cache for email history (resend_result) ---
-EMAIL_HISTORY_CACHE = SyncDictJSON.create("cache/email_history.json")
+EMAIL_HISTORY_CACHE = {} if STATE_STORE else open_persistent_cache("cache/email_history.json")
+
+# --- RATE_LIMIT_CACHE の有効期限管理 ---
+PROCESSING_FLAG_PREFIXES = ("processing:", "insert_processing:", "tldr_processing:")
+PROCESSING_FLAG_TTL = int(os.getenv('PROCESSING_FLAG_TTL', '3600'))  # これ以上残っているフラグは孤立とみなす
+CACHE_SWEEP_INTERVAL = int(os.getenv('CACHE_SWEEP_INTERVAL', '300'))
+CACHE_EXPIRY = ExpiryIndex()
+
+def _index_existing_cache_keys():
+    """起動時に既存キーの期限をインデックスへ登録（全件走査は起動時の1回のみ）"""
+    now = time.time()
+    for key in list(RATE_LIMIT_CACHE.keys()):
+        if key.startswith("limit:"):
+            try:
+                day = datetime.strptime(key.rsplit(":", 1)[-1], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+                CACHE_EXPIRY.set(key, (day + timedelta(days=1)).timestamp())
+            except ValueError:
+                CACHE_EXPIRY.set(key, now)
+        elif key.startswith(PROCESSING_FLAG_PREFIXES):
+            # 前回プロセスの処理中フラグは既に孤立している
+            CACHE_EXPIRY.set(key, now)
+
+_index_existing_cache_keys()
+
+async def sweep_expired_cache() -> int:
+    """期限切れの日次カウンタと孤立した処理中フラグを削除し、削除件数を返す"""
+    if STATE_STORE is not None:
+        counters, flags = await STATE_STORE.apurge_expired(PROCESSING_FLAG_TTL)
+        removed = counters + flags
+    else:
+        # 1件ずつ del するとキーの数だけファイルを書き直すため、まとめて1回で書き込む
+        removed = RATE_LIMIT_CACHE.delete_many(CACHE_EXPIRY.pop_expired())
+    if removed:
+        debug_log_to_file(f"CACHE_SWEEP: Removed {removed} expired keys, stats: {CACHE_EXPIRY.stats()}")
+    return removed
 
 # --- リミット管理モジュール ---
 def limit_user(user_id: str, redis_client=None) -> bool:
@@ -373,6 +482,11 @@ def limit_user(user_id: str, redis_client=None) -> bool:
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     key = f"limit:{user_id}:{today}"
     daily_limit = int(os.getenv('DAILY_RATE_LIMIT', '5'))
+    if use_cache and STATE_STORE is not None:
+        allowed, _ = STATE_STORE.incr_if_below(key, daily_limit, _end_of_utc_day())
+        if not allowed:
+            raise UsageLimitExceeded(f"1日の使用回数制限（{daily_limit}回）を超過しています")
+        return True
     if use_cache:
         count = cache.get(key, 0)
         if count is None:
@@ -380,6 +494,7 @@ def limit_user(user_id: str, redis_client=None) -> bool:
         if count >= daily_limit:
             raise UsageLimitExceeded(f"1日の使用回数制限（{daily_limit}回）を超過しています")
         cache[key] = count + 1
+        CACHE_EXPIRY.set(key, _end_of_utc_day())
         return True
     else:
         try:
@@ -398,6 +513,67 @@ def limit_user(user_id: str, redis_client=None) -> bool:
             # Redis接続エラーの場合は制限なしで通す（サービス継続のため）
             return True
 
+def _end_of_utc_day() -> float:
+    """日次カウンタの失効時刻（UTCの翌日0時）"""
+    tomorrow = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return datetime(tomorrow.year, tomorrow.month, tomorrow.day, tzinfo=timezone.utc).timestamp()
+
+async def limit_user_async(user_id: str, redis_client=None) -> bool:
+    """
+    limit_user の非同期版（コマンドハンドラから使用）
+    - Redis利用時はLuaスクリプトでチェックと加算を1往復・アトミックに実行
+    - 状態ストア利用時はSQLiteアクセスを専用スレッドプールで実行する
+    """
+    if redis_client is None and STATE_STORE is None:
+        return limit_user(user_id, redis_client)
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    key = f"limit:{user_id}:{today}"
+    daily_limit = int(os.getenv('DAILY_RATE_LIMIT', '5'))
+    if redis_client is not None:
+        try:
+            allowed, _ = await redis_incr_if_below(redis_client, key, daily_limit, 86400)
+        except Exception as e:
+            logger.error(f"Redis error: {e}")
+            # Redis接続エラーの場合は制限なしで通す（サービス継続のため）
+            return True
+    else:
+        allowed, _ = await STATE_STORE.aincr_if_below(key, daily_limit, _end_of_utc_day())
+    if not allowed:
+        raise UsageLimitExceeded(f"1日の使用回数制限（{daily_limit}回）を超過しています")
+    return True
+
+# --- 処理中フラグ・メール履歴ヘルパー ---
+async def acquire_processing_flag(key: str) -> bool:
+    """処理中フラグを立てる。既に処理中なら False"""
+    if STATE_STORE is not None:
+        return await STATE_STORE.aacquire_flag(key)
+    if key in RATE_LIMIT_CACHE:
+        return False
+    RATE_LIMIT_CACHE[key] = True
+    CACHE_EXPIRY.set(key, time.time() + PROCESSING_FLAG_TTL)
+    return True
+
+async def release_processing_flag(key: str):
+    """処理中フラグを解除"""
+    if STATE_STORE is not None:
+        await STATE_STORE.arelease_flag(key)
+    elif key in RATE_LIMIT_CACHE:
+        del RATE_LIMIT_CACHE[key]
+        CACHE_EXPIRY.discard(key)
+
+async def save_email_history(key: str, data: dict):
+    """/resend_result 用の直近送信内容を保存"""
+    if STATE_STORE is not None:
+        await STATE_STORE.aset_email(key, data)
+    else:
+        EMAIL_HISTORY_CACHE[key] = data
+
+async def load_email_history(key: str) -> dict:
+    """/resend_result 用の直近送信内容を取得"""
+    if STATE_STORE is not None:
+        return await STATE_STORE.aget_email(key)
+    return EMAIL_HISTORY_CACHE.get(key, {})
+
 # --- プロンプト生成モジュール ---
 def build_prompt(content: str, style: str = "prep") -> str:
     """
@@ -410,6 +586,9 @@ def build_prompt(content: str, style: str = "prep") -> str:
     Returns:
         str: 生成されたプロンプト
     """
+    # 本文はトークン予算内に収める（長文は generate_article 側で分割要約済みの想定）
+    content = TOKEN_BUDGET.fit(content, marker="\n\n[入力上限のため以降を省略]")
+    
     # 外部YAMLからプロンプトテンプレートを取得
     if style == "prep":
         template = get_prompt('article_generation', 'prep_template', content=content)
@@ -445,7 +624,7 @@ def build_prompt(content: str, style: str = "prep") -> str:
 """
         template = template.format(content=content)
     
-    debug_log_to_file(f"PROMPTS: Built prompt for style '{style}', length: {len(template)}")
+    debug_log_to_file(f"PROMPTS: Built prompt for style '{style}', tokens: {TOKEN_BUDGET.count(template)}")
     return template
 
 # --- Rate Limiting バックオフハンドラー ---
@@ -462,11 +641,14 @@ async def safe_discord_api_call(api_call_func, max_retries=3, base_delay=1.0, us
     Returns:
         API呼び出しの結果またはNone
     """
+    call_name = getattr(api_call_func, '__name__', 'unknown_api_call')
     for attempt in range(max_retries + 1):
         try:
-            return await api_call_func()
+            with METRICS.timer("tdd_discord_api_seconds", call=call_name):
+                return await api_call_func()
         except discord.errors.HTTPException as e:
             if e.status == 429:  # Rate Limited
+                METRICS.inc("tdd_discord_api_429_total", call=call_name)
                 # 詳細なRate Limit情報を収集・ログ出力
                 rate_limit_info = {
                     'timestamp': datetime.now().isoformat(),
@@ -503,8 +685,7 @@ async def safe_discord_api_call(api_call_func, max_retries=3, base_delay=1.0, us
                     debug_log_to_file(f"RATE_LIMIT_SUMMARY: User {user_id}, Limit: {limit}, Remaining: {remaining}, Reset in: {reset_after}s, Bucket: {bucket}")
                     
                     # 統計情報に記録
-                    command_name = getattr(api_call_func, '__name__', 'unknown_api_call')
-                    log_rate_limit_event(user_id, command_name, rate_limit_info)
+                    log_rate_limit_event(user_id, call_name, rate_limit_info)
                 
                 if attempt < max_retries:
                     # Exponential backoff with jitter
@@ -515,23 +696,36 @@ async def safe_discord_api_call(api_call_func, max_retries=3, base_delay=1.0, us
                     if hasattr(e, 'retry_after') and e.retry_after:
                         delay = max(delay, e.retry_after)
                     
-                    debug_log_to_file(f"RATE_LIMIT: 429 error for user {user_id}, attempt {attempt + 1}/{max_retries + 1}, waiting {delay:.1f}s")
+                    debug_log_to_file(f"RATE_LIMIT: 429 error for user {user_id}, attempt {attempt + 1}/{max_retries + 1}, waiting {delay:.1f}s", logging.WARNING)
                     await asyncio.sleep(delay)
                     continue
                 else:
-                    debug_log_to_file(f"RATE_LIMIT: Max retries exceeded for user {user_id}, giving up")
+                    debug_log_to_file(f"RATE_LIMIT: Max retries exceeded for user {user_id}, giving up", logging.ERROR)
                     return None
             else:
                 # 429以外のエラーは再試行しない
-                debug_log_to_file(f"RATE_LIMIT: Non-429 error for user {user_id}: {e}")
+                debug_log_to_file(f"RATE_LIMIT: Non-429 error for user {user_id}: {e}", logging.ERROR)
                 raise
         except Exception as e:
-            debug_log_to_file(f"RATE_LIMIT: Unexpected error for user {user_id}: {e}")
+            debug_log_to_file(f"RATE_LIMIT: Unexpected error for user {user_id}: {e}", logging.ERROR)
             raise
     
     return None
 
 # --- ファイル処理モジュール ---
+def whisper_transcribe_sync(path: str) -> tuple[str, dict]:
+    """
+    Whisper API 呼び出し（スレッドで実行する同期版）
+    Returns: (文字起こし結果, レート制限ヘッダ)
+    """
+    client = OpenAI(timeout=60)  # Whisper API用に60秒タイムアウト
+    with open(path, 'rb') as audio_file:
+        raw = client.audio.transcriptions.with_raw_response.create(
+            model="whisper-1",
+            file=audio_file
+        )
+    return raw.parse().text, dict(raw.headers)
+
 async def extract_audio(video_path: str, output_path: str) -> bool:
     """
     動画ファイルから音声を抽出（非同期版）
@@ -631,7 +825,7 @@ class TDDCog(commands.Cog):
             debug_log_to_file(f"INSERT_COMMAND: Defer successful for user {user_id}")
         except discord.errors.NotFound:
             logger.error(f"Insert Interaction expired before defer (user: {interaction.user.id})")
-            debug_log_to_file(f"INSERT_COMMAND: Interaction expired before defer for user {user_id}")
+            debug_log_to_file(f"INSERT_COMMAND: Interaction expired before defer for user {user_id}", logging.WARNING)
             return
         except discord.errors.InteractionResponded:
             logger.warning(f"Insert Interaction already responded (user: {interaction.user.id})")
@@ -639,13 +833,13 @@ class TDDCog(commands.Cog):
             return
         except Exception as e:
             logger.error(f"Failed to defer Insert interaction: {e}")
-            debug_log_to_file(f"INSERT_COMMAND: Failed to defer for user {user_id}: {e}")
+            debug_log_to_file(f"INSERT_COMMAND: Failed to defer for user {user_id}: {e}", logging.ERROR)
             return
         
         # defer成功後にバックグラウンド処理（時間制限なし）
         
-        # 重複実行防止チェック
-        if processing_key in RATE_LIMIT_CACHE:
+        # 重複実行防止チェック + 処理フラグ設定
+        if not await acquire_processing_flag(processing_key):
             debug_log_to_file(f"INSERT_COMMAND: User {user_id} already processing, rejecting")
             try:
                 await interaction.followup.send("⚠️ 既に処理中です。完了をお待ちください。", ephemeral=True)
@@ -653,8 +847,6 @@ class TDDCog(commands.Cog):
                 pass  # エラー時は無音
             return
         
-        # 処理フラグ設定
-        RATE_LIMIT_CACHE[processing_key] = True
         debug_log_to_file(f"INSERT_COMMAND: Set processing flag for user {user_id}")
         
         # キャッシュ書き込み処理
@@ -695,24 +887,23 @@ class TDDCog(commands.Cog):
                 await interaction.followup.send(get_discord_message('processing_messages', 'insert_notification'), ephemeral=True)
                 debug_log_to_file(f"INSERT_COMMAND: Sent followup notification for user {user_id} after {delay_seconds:.1f}s delay")
             except Exception as e:
-                debug_log_to_file(f"INSERT_COMMAND: Failed to send followup: {e}")
+                debug_log_to_file(f"INSERT_COMMAND: Failed to send followup: {e}", logging.WARNING)
                 # followup失敗でも機能は有効
             
             # 成功時のみprocessing_keyをクリア
             try:
-                del RATE_LIMIT_CACHE[processing_key]
+                await release_processing_flag(processing_key)
                 debug_log_to_file(f"INSERT_COMMAND: Cleared processing flag for user {user_id}")
             except Exception as e:
-                debug_log_to_file(f"INSERT_COMMAND: Failed to clear processing flag: {e}")
+                debug_log_to_file(f"INSERT_COMMAND: Failed to clear processing flag: {e}", logging.WARNING)
                 pass
                 
         except Exception as e:
             logger.error(f"INSERT: Command error for user {user_id}: {e}")
-            debug_log_to_file(f"INSERT_COMMAND: Command error for user {user_id}: {e}")
+            debug_log_to_file(f"INSERT_COMMAND: Command error for user {user_id}: {e}", logging.ERROR)
             # エラー時もprocessing_keyをクリア
-            if processing_key in RATE_LIMIT_CACHE:
-                del RATE_LIMIT_CACHE[processing_key]
-                debug_log_to_file(f"INSERT_COMMAND: Cleared processing flag after error for user {user_id}")
+            await release_processing_flag(processing_key)
+            debug_log_to_file(f"INSERT_COMMAND: Cleared processing flag after error for user {user_id}")
     @discord.app_commands.command(name="help", description="このBotの使い方一覧を表示")
     async def help_command(self, interaction: discord.Interaction):
         try:
@@ -766,9 +957,11 @@ class TDDCog(commands.Cog):
         include_tldr="TLDR（要約）も含めて生成する"
     )
     async def article_command(self, interaction: discord.Interaction, file: discord.Attachment, style: str = "prep", include_tldr: bool = False):
+        started = time.perf_counter()
         # 最優先: 即座にdefer()を実行
         try:
-            await interaction.response.defer()
+            with METRICS.timer("tdd_article_stage_seconds", stage="defer"):
+                await interaction.response.defer()
         except discord.errors.NotFound:
             logger.error(f"Interaction expired before defer (user: {interaction.user.id})")
             return
@@ -783,15 +976,13 @@ class TDDCog(commands.Cog):
         user_id = str(interaction.user.id)
         processing_key = f"processing:{user_id}"
         
-        if processing_key in RATE_LIMIT_CACHE:
+        # 処理開始フラグ設定（既に処理中なら拒否）
+        if not await acquire_processing_flag(processing_key):
             try:
                 await interaction.followup.send("⚠️ 既に処理中です。完了をお待ちください。", ephemeral=True)
             except:
                 pass
             return
-            
-        # 処理開始フラグ設定
-        RATE_LIMIT_CACHE[processing_key] = True
         
         # 統合プログレス embed を作成して初期状態を送信
         progress_embed = discord.Embed(
@@ -812,7 +1003,7 @@ class TDDCog(commands.Cog):
         try:
             if not self.bot.is_premium_user(interaction.user):
                 try:
-                    limit_user(str(interaction.user.id), self.bot.redis_client)
+                    await limit_user_async(str(interaction.user.id), self.bot.redis_client)
                 except UsageLimitExceeded as e:
                     embed = discord.Embed(
                         title="使用回数制限",
@@ -821,9 +1012,10 @@ class TDDCog(commands.Cog):
                     )
                     await interaction.followup.send(embed=embed)
                     return
-            file_content = await file.read()
             try:
-                file_type = validate_file_type(file.filename, file_content)
+                # 形式はファイル名で判定する（ダウンロードは抽出キャッシュを確認してから）
+                with METRICS.timer("tdd_article_stage_seconds", stage="validate"):
+                    file_type = validate_file_type(file.filename, b'')
             except UnsupportedFileType as e:
                 embed = discord.Embed(
                     title="サポートされていないファイル形式",
@@ -870,16 +1062,25 @@ class TDDCog(commands.Cog):
                     except Exception as e:
                         logger.warning(f"Failed to update progress embed: {e}")
                 
-                if file_type == "text":
-                    content = await self.bot.process_text_file(file_content, file.filename)
-                elif file_type == "pdf":
-                    content = await self.bot.process_pdf_file(file_content)
-                elif file_type == "audio":
-                    content = await self.bot.process_audio_file(file_content, file.filename)
-                elif file_type == "video":
-                    content = await self.bot.process_video_file(file_content, file.filename)
-                else:
-                    raise ValueError(f"Unknown file type: {file_type}")
+                # 長い音声・動画は区間ごとの文字起こし進捗を表示
+                transcribe_editor = None
+                if progress_message and file_type in ["audio", "video"]:
+                    transcribe_editor = ThrottledEditor(
+                        lambda embed: progress_message.edit(embed=embed),
+                        min_interval=PROGRESS_EDIT_INTERVAL,
+                    )
+                def report_transcribe_progress(done, total):
+                    if not transcribe_editor or total <= 1:
+                        return
+                    progress_embed.set_field_at(1, name="📊 進行状況", value=f"🎧 文字起こし中...（{done}/{total}区間）", inline=False)
+                    transcribe_editor.update(progress_embed)
+                
+                try:
+                    with METRICS.timer("tdd_article_stage_seconds", stage=f"extract_{file_type}"):
+                        content = await self.bot.extract_attachment(file, file_type, on_progress=report_transcribe_progress)
+                finally:
+                    if transcribe_editor:
+                        await transcribe_editor.aclose()
                 
                 # プログレス embed を更新（AI処理段階）
                 if progress_message:
@@ -888,19 +1089,69 @@ class TDDCog(commands.Cog):
                         await progress_message.edit(embed=progress_embed)
                     except Exception as e:
                         logger.warning(f"Failed to update AI progress: {e}")
-                article = await self.bot.generate_article(content, style)
+                # 待ち順位・生成途中の本文を進行状況に表示（編集は PROGRESS_EDIT_INTERVAL 秒ごとにまとめる）
+                progress_editor = None
+                if progress_message:
+                    progress_editor = ThrottledEditor(
+                        lambda embed: progress_message.edit(embed=embed),
+                        min_interval=PROGRESS_EDIT_INTERVAL,
+                    )
+                queued = False
+                def report_queue_position(position):
+                    nonlocal queued
+                    if not progress_editor or (position == 0 and not queued):
+                        return  # 待たずに実行できた場合は表示を変えない
+                    if position > 0:
+                        queued = True
+                        status = f"⏳ AI生成の順番待ち（{position}番目）..."
+                    else:
+                        status = "🤖 AIが記事を生成中..."
+                    progress_embed.set_field_at(1, name="📊 進行状況", value=status, inline=False)
+                    progress_editor.update(progress_embed)
+                def report_condense_progress(done, total):
+                    if not progress_editor:
+                        return
+                    status = f"📚 長文を分割して要約中...（{done}/{total}）"
+                    progress_embed.set_field_at(1, name="📊 進行状況", value=status, inline=False)
+                    progress_editor.update(progress_embed)
+                def report_article_text(partial):
+                    progress_embed.description = preview_tail(partial, 3500)
+                    progress_embed.set_field_at(1, name="📊 進行状況", value=f"✍️ 記事を生成中...（{len(partial)}文字）", inline=False)
+                    progress_editor.update(progress_embed)
+                
+                # 記事と TLDR は互いに独立なので並行生成（TLDR が失敗しても記事は届ける）
+                try:
+                    with llm_request(
+                        premium=self.bot.is_premium_user(interaction.user),
+                        guild_id=interaction.guild_id,
+                        on_position=report_queue_position,
+                    ):
+                        article, tldr_summary = await self.bot.generate_article_with_tldr(
+                            content, style, include_tldr,
+                            on_article_text=report_article_text if progress_editor and LLM_STREAMING else None,
+                            on_condense_progress=report_condense_progress,
+                        )
+                finally:
+                    if progress_editor:
+                        await progress_editor.aclose()
+                if progress_message:
+                    try:
+                        progress_embed.set_field_at(1, name="📊 進行状況", value="📤 生成完了、ファイルを送信中...", inline=False)
+                        await progress_message.edit(embed=progress_embed)
+                    except Exception as e:
+                        logger.warning(f"Failed to update progress embed: {e}")
+                with_tldr = tldr_summary is not None
                 final_content = article
-                if include_tldr:
-                    tldr_summary = await self.bot.generate_tldr(content)
+                if with_tldr:
                     final_content = f"""# TLDR (要約)\n\n{tldr_summary}\n\n---\n\n{article}"""
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                prefix = "tldr_article" if include_tldr else "article"
+                prefix = "tldr_article" if with_tldr else "article"
                 filename = f"{prefix}_{timestamp}.md"
                 with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as tmp_file:
                     tmp_file.write(final_content)
                     tmp_file.flush()
                     file_obj = discord.File(tmp_file.name, filename=filename)
-                    title_text = "記事生成完了 (TLDR付き)" if include_tldr else "記事生成完了"
+                    title_text = "記事生成完了 (TLDR付き)" if with_tldr else "記事生成完了"
                     embed = discord.Embed(
                         title=title_text,
                         description=f"ファイル「{file.filename}」から記事を生成しました",
@@ -908,10 +1159,13 @@ class TDDCog(commands.Cog):
                     )
                     embed.add_field(name="スタイル", value=style.upper(), inline=True)
                     embed.add_field(name="ファイル形式", value=file_type, inline=True)
-                    if include_tldr:
+                    if with_tldr:
                         embed.add_field(name="📋 TLDR", value="✅ 含む", inline=True)
+                    elif include_tldr:
+                        embed.add_field(name="📋 TLDR", value="⚠️ 生成失敗（記事のみ）", inline=True)
                     # Send the embed and file, and keep the returned message object
-                    sent_msg = await interaction.followup.send(embed=embed, file=file_obj)
+                    with METRICS.timer("tdd_article_stage_seconds", stage="upload"):
+                        sent_msg = await interaction.followup.send(embed=embed, file=file_obj)
                     # --- Send generated article via email ---
                     user_id = str(interaction.user.id)
                     
@@ -943,12 +1197,13 @@ class TDDCog(commands.Cog):
                         # attach the markdown file
                         attachments = [(filename, final_content.encode("utf-8"), "text/markdown")]
                         try:
-                            await send_email(recipient, subject_email, body_email, attachments)
+                            with METRICS.timer("tdd_article_stage_seconds", stage="email"):
+                                await send_email(recipient, subject_email, body_email, attachments)
                             logger.info(f"ARTICLE: Email sent successfully")
                             debug_log_to_file(f"ARTICLE: Email sent successfully to {recipient}")
                         except Exception as e:
                             logger.error(f"ARTICLE: Failed to send email: {e}")
-                            debug_log_to_file(f"ARTICLE: Failed to send email: {e}")
+                            debug_log_to_file(f"ARTICLE: Failed to send email: {e}", logging.ERROR)
                             # メール送信失敗をメイン結果embedに統合
                             embed.add_field(name="📧 メール送信", value="⚠️ 送信失敗（記事は正常生成）", inline=True)
                     
@@ -966,7 +1221,7 @@ class TDDCog(commands.Cog):
                                 "mime_type": "text/markdown"
                             }])
                         }
-                        EMAIL_HISTORY_CACHE[key] = email_data
+                        await save_email_history(key, email_data)
                         
                         # メール送信成功をメイン結果embedに統合
                         embed.add_field(name="📧 メール送信", value="✅ 送信完了", inline=True)
@@ -979,7 +1234,7 @@ class TDDCog(commands.Cog):
                             await interaction.followup.send("📧 記事をメールで送信しました（添付ファイル付き）", ephemeral=True)
                             debug_log_to_file(f"ARTICLE: Sent email success notification to user {user_id}")
                         except Exception as e:
-                            debug_log_to_file(f"ARTICLE: Failed to send email success notification: {e}")
+                            debug_log_to_file(f"ARTICLE: Failed to send email success notification: {e}", logging.WARNING)
                             # 通知失敗でもメイン処理は継続
                     else:
                         # メール未登録の理由を詳細ログで記録
@@ -991,17 +1246,18 @@ class TDDCog(commands.Cog):
                         # メール未登録をメイン結果embedに統合
                         embed.add_field(name="📧 メール送信", value="❌ 未登録 (`/register_email`で設定)", inline=True)
                     # --- END PATCH ---
-                    await self.bot.log_to_moderator(
-                        title="📄 Article Generated",
-                        description=f"User {interaction.user.mention} generated article from {file_type} file",
-                        color=discord.Color.green(),
-                        **{
-                            "User ID": interaction.user.id,
-                            "File": file.filename,
-                            "Size": f"{file.size / 1024:.1f} KB",
-                            "Style": style.upper()
-                        }
-                    )
+                    with METRICS.timer("tdd_article_stage_seconds", stage="moderator_log"):
+                        await self.bot.log_to_moderator(
+                            title="📄 Article Generated",
+                            description=f"User {interaction.user.mention} generated article from {file_type} file",
+                            color=discord.Color.green(),
+                            **{
+                                "User ID": interaction.user.id,
+                                "File": file.filename,
+                                "Size": f"{file.size / 1024:.1f} KB",
+                                "Style": style.upper()
+                            }
+                        )
                     os.unlink(tmp_file.name)
             except asyncio.TimeoutError:
                 logger.error("File processing timeout")
@@ -1030,6 +1286,17 @@ class TDDCog(commands.Cog):
                         color=discord.Color.orange()
                     )
                     await interaction.followup.send(embed=timeout_embed)
+            except QuotaExceeded as e:
+                # 上流のクォータ逼迫で送信を見送った（エラー扱いにせず再試行を案内）
+                logger.warning(f"Article generation shed by quota governor: {e}")
+                busy_embed = discord.Embed(title="⏳ 混雑中", description=str(e), color=discord.Color.orange())
+                if progress_message:
+                    try:
+                        await progress_message.edit(embed=busy_embed)
+                    except Exception:
+                        await interaction.followup.send(embed=busy_embed)
+                else:
+                    await interaction.followup.send(embed=busy_embed)
             except Exception as e:
                 logger.error(f"File processing error: {e}")
                 # プログレス embed をエラー状態に更新
@@ -1080,8 +1347,8 @@ class TDDCog(commands.Cog):
                 await interaction.followup.send(embed=embed)
         finally:
             # 処理完了フラグをクリア
-            if processing_key in RATE_LIMIT_CACHE:
-                del RATE_LIMIT_CACHE[processing_key]
+            await release_processing_flag(processing_key)
+            METRICS.observe("tdd_article_stage_seconds", time.perf_counter() - started, stage="total")
 
     @discord.app_commands.command(name="usage", description="本日の使用回数を確認")
     async def usage_command(self, interaction: discord.Interaction):
@@ -1143,19 +1410,17 @@ class TDDCog(commands.Cog):
         user_id = str(interaction.user.id)
         processing_key = f"tldr_processing:{user_id}"
         
-        if processing_key in RATE_LIMIT_CACHE:
+        # 処理開始フラグ設定（既に処理中なら拒否）
+        if not await acquire_processing_flag(processing_key):
             try:
                 await interaction.followup.send("⚠️ 既にTLDR処理中です。完了をお待ちください。", ephemeral=True)
             except:
                 pass
             return
-            
-        # 処理開始フラグ設定
-        RATE_LIMIT_CACHE[processing_key] = True
         try:
             if not self.bot.is_premium_user(interaction.user):
                 try:
-                    limit_user(str(interaction.user.id), self.bot.redis_client)
+                    await limit_user_async(str(interaction.user.id), self.bot.redis_client)
                 except UsageLimitExceeded as e:
                     embed = discord.Embed(
                         title="使用回数制限",
@@ -1164,9 +1429,8 @@ class TDDCog(commands.Cog):
                     )
                     await interaction.followup.send(embed=embed)
                     return
-            file_content = await file.read()
             try:
-                file_type = validate_file_type(file.filename, file_content)
+                file_type = validate_file_type(file.filename, b'')
             except UnsupportedFileType as e:
                 embed = discord.Embed(
                     title="サポートされていないファイル形式",
@@ -1203,17 +1467,9 @@ class TDDCog(commands.Cog):
                     await interaction.followup.send(embed=embed)
                     return
             try:
-                if file_type == "text":
-                    content = await self.bot.process_text_file(file_content, file.filename)
-                elif file_type == "pdf":
-                    content = await self.bot.process_pdf_file(file_content)
-                elif file_type == "audio":
-                    content = await self.bot.process_audio_file(file_content, file.filename)
-                elif file_type == "video":
-                    content = await self.bot.process_video_file(file_content, file.filename)
-                else:
-                    raise ValueError(f"Unknown file type: {file_type}")
-                tldr_summary = await self.bot.generate_tldr(content)
+                content = await self.bot.extract_attachment(file, file_type)
+                with llm_request(premium=self.bot.is_premium_user(interaction.user), guild_id=interaction.guild_id):
+                    tldr_summary = await self.bot.generate_tldr(content)
                 embed = discord.Embed(
                     title="📝 TLDR (要約)",
                     description=tldr_summary,
@@ -1246,7 +1502,7 @@ class TDDCog(commands.Cog):
                         "body": body_email,
                         "attachments": "[]"
                     }
-                    EMAIL_HISTORY_CACHE[key] = email_data
+                    await save_email_history(key, email_data)
                     
                     try:
                         await interaction.followup.send("📧 要約をメールで送信しました", ephemeral=True)
@@ -1300,8 +1556,7 @@ class TDDCog(commands.Cog):
                 await interaction.followup.send(embed=embed)
         finally:
             # 処理完了フラグをクリア
-            if processing_key in RATE_LIMIT_CACHE:
-                del RATE_LIMIT_CACHE[processing_key]
+            await release_processing_flag(processing_key)
 
     @discord.app_commands.command(name="register_email", description="メールアドレスを登録し、認証メールを送信します")
     @discord.app_commands.describe(email="登録したいメールアドレス")
@@ -1361,7 +1616,7 @@ class TDDCog(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         user_id = str(interaction.user.id)
         key = f"last_email:{user_id}:{BOT_ID}"
-        data = EMAIL_HISTORY_CACHE.get(key, {})
+        data = await load_email_history(key)
         if not data:
             await interaction.followup.send(
                 "❌ 再送信可能な送信履歴がありません。",
@@ -1426,8 +1681,8 @@ class TDDCog(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         # Rate Limiting統計情報を収集
-        stats = RATE_LIMIT_STATS
-        total_errors = stats['total_429_errors']
+        stats = RATE_LIMIT_TELEMETRY
+        total_errors = stats.total
         
         # メイン統計embed
         embed = discord.Embed(
@@ -1437,32 +1692,44 @@ class TDDCog(commands.Cog):
         )
         
         # ユーザー別統計（上位5人）
-        user_errors = sorted(stats['errors_by_user'].items(), key=lambda x: x[1], reverse=True)[:5]
+        user_errors = stats.users.top(5)
         if user_errors:
             user_list = "\n".join([f"<@{user_id}>: {count}回" for user_id, count in user_errors])
             embed.add_field(name="👥 ユーザー別エラー（上位5人）", value=user_list, inline=False)
         
-        # コマンド別統計
-        command_errors = stats['errors_by_command']
+        # コマンド別統計（上位10件）
+        command_errors = stats.commands.top(10)
         if command_errors:
-            command_list = "\n".join([f"`{cmd}`: {count}回" for cmd, count in command_errors.items()])
+            command_list = "\n".join([f"`{cmd}`: {count}回" for cmd, count in command_errors])
             embed.add_field(name="💻 コマンド別エラー", value=command_list, inline=False)
         
-        # 時間帯別統計（上位5時間）
-        hour_errors = sorted(stats['errors_by_hour'].items(), key=lambda x: x[1], reverse=True)[:5]
+        # 時間帯別統計（過去24時間の上位5時間）
+        hour_errors = sorted(stats.per_minute.hourly().items(), key=lambda x: x[1], reverse=True)[:5]
         if hour_errors:
-            hour_list = "\n".join([f"{hour:02d}:00-{hour:02d}:59: {count}回" for hour, count in hour_errors])
-            embed.add_field(name="⏰ 時間帯別エラー（上位5時間）", value=hour_list, inline=False)
+            hour_list = "\n".join([
+                f"{datetime.fromtimestamp(hour_start).strftime('%m/%d %H:00')}-{datetime.fromtimestamp(hour_start).strftime('%H:59')}: {count}回"
+                for hour_start, count in hour_errors
+            ])
+            embed.add_field(name="⏰ 時間帯別エラー（過去24時間・上位5時間）", value=hour_list, inline=False)
         
         # キャッシュ統計
         cache_size = len(USER_PERMISSIONS_CACHE)
-        embed.add_field(name="📄 キャッシュ状態", value=f"ユーザー権限キャッシュ: {cache_size}件", inline=False)
+        expiry_stats = CACHE_EXPIRY.stats()
+        embed.add_field(
+            name="📄 キャッシュ状態",
+            value=(
+                f"ユーザー権限キャッシュ: {cache_size}件\n"
+                f"レート制限キャッシュ: {len(RATE_LIMIT_CACHE)}件 "
+                f"(期限管理中: {expiry_stats['live']}件 / 期限切れ削除済み: {expiry_stats['evicted']}件)"
+            ),
+            inline=False
+        )
         
         # 最近のエラー（直近5件）
-        recent_errors = stats['recent_errors'][-5:] if stats['recent_errors'] else []
+        recent_errors = stats.recent.latest(5)
         if recent_errors:
             recent_list = "\n".join([
-                f"`{error['timestamp'][:19]}` <@{error['user_id']}> `{error['command']}`" 
+                f"`{datetime.fromtimestamp(error['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}` <@{error['user_id']}> `{error['command']}`" 
                 for error in recent_errors
             ])
             embed.add_field(name="⏱️ 最近のエラー（直近5件）", value=recent_list, inline=False)
@@ -1476,6 +1743,49 @@ class TDDCog(commands.Cog):
         await interaction.followup.send(embed=embed, ephemeral=True)
         debug_log_to_file(f"RATE_STATS: Admin {interaction.user.id} viewed Rate Limiting statistics")
 
+    @discord.app_commands.command(name="metrics", description="[管理者用] 処理時間メトリクスを表示")
+    async def metrics_command(self, interaction: discord.Interaction):
+        """
+        処理段階ごとの所要時間（p50/p95/p99）とエラー件数を表示（管理者用）
+        """
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("❌ このコマンドは管理者のみ使用できます。", ephemeral=True)
+            return
+        
+        embed = discord.Embed(title="⏱️ 処理時間メトリクス", color=discord.Color.blue())
+        
+        # ヒストグラム（件数と p50 / p95 / p99）
+        latency_lines = [
+            f"`{name.removeprefix('tdd_').removesuffix('_seconds')}` {' '.join(f'{v}' for v in labels.values())}: "
+            f"{count}件 p50={p50 * 1000:.0f}ms p95={p95 * 1000:.0f}ms p99={p99 * 1000:.0f}ms"
+            for name, labels, count, p50, p95, p99 in METRICS.histogram_summaries()
+        ]
+        # カウンタ
+        counter_lines = [
+            f"`{name.removeprefix('tdd_')}` {' '.join(f'{v}' for v in labels.values())}: {value:g}"
+            for name, labels, value in METRICS.counter_values()
+        ]
+        if not latency_lines and not counter_lines:
+            embed.description = "まだ計測データがありません。"
+        if latency_lines:
+            embed.add_field(name="📊 所要時間", value="\n".join(latency_lines)[:1024], inline=False)
+        if counter_lines:
+            embed.add_field(name="🔢 カウンタ", value="\n".join(counter_lines)[:1024], inline=False)
+        # OpenAI クォータの使用率
+        quota_lines = []
+        for api in ("chat", "whisper"):
+            usage = get_governor(api).utilization()
+            line = f"`{api}` RPM {usage['requests'] * 100:.0f}%"
+            if "tokens" in usage:
+                line += f" / TPM {usage['tokens'] * 100:.0f}%"
+            quota_lines.append(line + f"（待機中 {usage['waiting']}件・見送り {usage['shed']}件）")
+        embed.add_field(name="📈 OpenAI クォータ使用率", value="\n".join(quota_lines), inline=False)
+        if METRICS_PORT:
+            embed.set_footer(text=f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        debug_log_to_file(f"METRICS: Admin {interaction.user.id} viewed metrics")
+
 class TDDBot(commands.Bot):
     """TDD仕様に基づいたDiscord Bot"""
     
@@ -1493,7 +1803,29 @@ class TDDBot(commands.Bot):
             self.moderator_channel_id = int(self.moderator_channel_id)
         
         # OpenAI設定
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # 非同期LLMクライアント（記事・TLDR・insert・ツイート要約で共有）
+        # LLM_CACHE=1 なら同一プロンプトの応答を再利用（prompts.yaml の version 変更で無効化）
+        # LLM呼び出しはプロセス共通のスケジューラで同時実行数・優先度を管理（LLM_MAX_CONCURRENCY）
+        get_scheduler().metrics = METRICS
+        # OpenAI の RPM/TPM を送信前に見積もって制御（LLM_RPM / LLM_TPM / WHISPER_RPM）
+        get_governor("chat").metrics = METRICS
+        get_governor("whisper").metrics = METRICS
+        self.llm = LLMClient(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            cache=ResponseCache.from_env(version=load_prompts_config().get('version', ''), metrics=METRICS),
+        )
+        
+        # 長い音声は無音で区切って並行文字起こし（TRANSCRIBE_SEGMENT_SECONDS / TRANSCRIBE_MAX_WORKERS）
+        self.transcriber = TranscriptionEngine.from_env(self.transcribe_path)
+        
+        # 文字起こし・PDF テキストの抽出結果キャッシュ（EXTRACTION_CACHE=0 で無効）
+        self.extraction_cache = ExtractionCache.from_env(metrics=METRICS)
+        
+        # リアクション連打などで同時に来た同一処理を1回にまとめる
+        self.inflight = SingleFlight(metrics=METRICS)
+        
+        # 添付のチャンク単位ダウンロード用（初回使用時に作成）
+        self.download_session = None
         
         # asyncio.Lock for INSERT_MODE_CACHE to prevent race conditions
         global insert_cache_lock
@@ -1541,7 +1873,7 @@ class TDDBot(commands.Bot):
                         debug_log_to_file(f"ON_MESSAGE: Deleted cache entry, remaining cache size: {len(INSERT_MODE_CACHE)}")
                     except Exception as e:
                         logger.error(f"INSERT: Failed to delete cache entry: {e}")
-                        debug_log_to_file(f"ON_MESSAGE: Failed to delete cache entry: {e}")
+                        debug_log_to_file(f"ON_MESSAGE: Failed to delete cache entry: {e}", logging.WARNING)
                 else:
                     debug_log_to_file(f"ON_MESSAGE: No local insert mode for user {user_id}, key: {key}")
                 
@@ -1556,29 +1888,46 @@ class TDDBot(commands.Bot):
             await asyncio.sleep(notify_delay)
             
             # UX一貫性: articleと同様の処理開始通知（遅延後）
+            # ストリーミング時は通知メッセージを整形途中のプレビューとして更新し、結果送信後に削除する
+            notice = None
+            processing_text = get_discord_message('processing_messages', 'markdown_processing')
             try:
-                await message.channel.send(get_discord_message('processing_messages', 'markdown_processing'), delete_after=30)
+                notice = await message.channel.send(processing_text, delete_after=None if LLM_STREAMING else 30)
                 debug_log_to_file(f"ON_MESSAGE: Sent processing notification for user {user_id} after {notify_delay:.1f}s delay")
             except Exception as e:
-                debug_log_to_file(f"ON_MESSAGE: Failed to send processing notification: {e}")
+                debug_log_to_file(f"ON_MESSAGE: Failed to send processing notification: {e}", logging.WARNING)
                 # 通知失敗でも処理は継続
+            preview_editor = None
+            if notice and LLM_STREAMING:
+                preview_editor = ThrottledEditor(
+                    lambda text: notice.edit(content=f"{processing_text}\n{preview_tail(text, 1800)}"),
+                    min_interval=PROGRESS_EDIT_INTERVAL,
+                )
             
             # 外部YAMLからプロンプトテンプレートを取得
             system_prompt = get_prompt('markdown_formatting', 'system_prompt')
             user_prompt = get_prompt('markdown_formatting', 'formatting_template', content=message.content)
             
             try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    max_tokens=1200,
-                    temperature=0.5,
-                    timeout=30
-                )
-                markdown = response.choices[0].message.content
+                try:
+                    with llm_request(premium=self.is_premium_user(message.author), guild_id=getattr(message.guild, "id", None)):
+                        # 整形結果は入力と同程度 + 見出し等の装飾分
+                        max_tokens = output_budget(system_prompt, user_prompt, TOKEN_BUDGET.count(message.content) * 3 // 2 + 300)
+                        markdown = await self.llm.chat(
+                            system_prompt,
+                            user_prompt,
+                            max_tokens=max_tokens,
+                            temperature=0.5,
+                            timeout=output_timeout(max_tokens),
+                            on_text=preview_editor.update if preview_editor else None
+                        )
+                finally:
+                    if preview_editor:
+                        await preview_editor.aclose()
+                        try:
+                            await notice.delete(delay=30)  # 従来の delete_after=30 と同様に生成後30秒で消す
+                        except Exception as e:
+                            debug_log_to_file(f"ON_MESSAGE: Failed to schedule preview deletion: {e}", logging.WARNING)
                 logger.info(f"INSERT: OpenAI response received for user {user_id}")
                 debug_log_to_file(f"ON_MESSAGE: OpenAI response received for user {user_id}, markdown_length: {len(markdown)}")
                 
@@ -1624,7 +1973,7 @@ class TDDBot(commands.Bot):
                     await asyncio.sleep(2)
                     
                 except Exception as e:
-                    debug_log_to_file(f"ON_MESSAGE: Failed to send file for user {user_id}: {e}")
+                    debug_log_to_file(f"ON_MESSAGE: Failed to send file for user {user_id}: {e}", logging.ERROR)
                     logger.error(f"INSERT: Failed to send markdown file for user {user_id}: {e}")
                     
                 finally:
@@ -1634,7 +1983,7 @@ class TDDBot(commands.Bot):
                             os.unlink(tmp_file_path)
                             debug_log_to_file(f"ON_MESSAGE: Cleaned up temp file for user {user_id}")
                         except Exception as e:
-                            debug_log_to_file(f"ON_MESSAGE: Failed to cleanup temp file: {e}")
+                            debug_log_to_file(f"ON_MESSAGE: Failed to cleanup temp file: {e}", logging.WARNING)
                 
                 # --- Send formatted markdown via email with attachment ---
                 user_settings = load_user_settings(user_id)
@@ -1681,13 +2030,13 @@ class TDDBot(commands.Bot):
                                 "mime_type": "text/markdown"
                             }])
                         }
-                        EMAIL_HISTORY_CACHE[key] = email_data
+                        await save_email_history(key, email_data)
                         
                         await message.channel.send("📧 整形結果をメールで送信しました（添付ファイル付き）", delete_after=30)
                         
                     except Exception as e:
                         logger.error(f"INSERT: Failed to send email: {e}")
-                        debug_log_to_file(f"ON_MESSAGE: Failed to send email: {e}")
+                        debug_log_to_file(f"ON_MESSAGE: Failed to send email: {e}", logging.WARNING)
                         await message.channel.send("⚠️ メール送信に失敗しましたが、整形は正常に完了しました。", delete_after=30)
                 else:
                     # ユーザーがメール未登録の場合の処理
@@ -1696,7 +2045,7 @@ class TDDBot(commands.Bot):
                     
             except Exception as e:
                 logger.error(f"INSERT: Failed to process insert: {e}")
-                debug_log_to_file(f"ON_MESSAGE: Failed to process insert for user {user_id}: {e}")
+                debug_log_to_file(f"ON_MESSAGE: Failed to process insert for user {user_id}: {e}", logging.ERROR)
                 try:
                     await message.channel.send("❌ テキスト整形中にエラーが発生しました。", delete_after=30)
                 except:
@@ -1708,7 +2057,7 @@ class TDDBot(commands.Bot):
         try:
             await self.process_commands(message)
         except Exception as e:
-            debug_log_to_file(f"ON_MESSAGE: Failed to process commands: {e}")
+            debug_log_to_file(f"ON_MESSAGE: Failed to process commands: {e}", logging.ERROR)
             pass  # Prevent cascading errors during rate limiting
     
     async def on_ready(self):
@@ -1781,6 +2130,85 @@ class TDDBot(commands.Bot):
         debug_log_to_file(f"PREMIUM_CHECK: User {user_id}, Premium: {is_premium} (cached)")
         return is_premium
     
+    async def extract_attachment(self, attachment, file_type: str, on_progress=None) -> str:
+        """
+        添付ファイルをダウンロードしてテキストを取り出す
+        文字起こし・PDF は抽出キャッシュを使う（添付IDで事前確認 → 内容の SHA-256 で確認 → 処理して保存）
+        ダウンロードはチャンク単位で取り込み、動画は受信しながら ffmpeg に流し込んで音声を抽出する
+        """
+        kind = {"pdf": "pdf", "audio": "transcript", "video": "transcript"}.get(file_type)
+        cache = self.extraction_cache if kind else None
+        if cache is not None:
+            cached = await cache.aget_by_id(attachment.id, kind)
+            if cached is not None:
+                return cached
+        
+        stream_audio = file_type == "video" and AUDIO_EXTRACT_MODE == "pipe"
+        with METRICS.timer("tdd_attachment_download_seconds"):
+            upload, sink = await ingest(
+                iter_chunks(attachment, self.get_download_session()),
+                suffix=os.path.splitext(attachment.filename)[1].lower(),
+                spool_bytes=INGEST_SPOOL_BYTES,
+                open_sink=self.open_audio_stream if stream_audio else None,
+            )
+        debug_log_to_file(
+            f"INGEST: {attachment.filename} {upload.size} bytes, format={upload.format}, "
+            f"{'memory' if upload.in_memory else 'disk'}, streamed={sink is not None}"
+        )
+        with upload:
+            try:
+                if file_type == "text":
+                    return await self.process_text_file(upload.getvalue(), attachment.filename)
+                
+                if cache is not None:
+                    cached = await cache.aget(upload.digest, kind, attachment_id=attachment.id)
+                    if cached is not None:
+                        return cached
+                
+                if file_type == "pdf":
+                    content = await self.process_pdf_file(upload)
+                elif file_type == "audio":
+                    content = await self.process_audio_file(upload, attachment.filename, on_progress=on_progress)
+                elif file_type == "video" and sink is not None:
+                    # 受信と並行して抽出済みの音声を受け取る
+                    stream, sink = sink, None
+                    try:
+                        audio = await stream.finish()
+                    except ExtractionError as e:
+                        logger.error(f"Audio extraction failed: {e}")
+                        raise ValueError("Failed to extract audio from video")
+                    content = await self.process_audio_file(audio, f"audio{AUDIO_FORMATS[AUDIO_EXTRACT_FORMAT][2]}", on_progress=on_progress)
+                elif file_type == "video":
+                    content = await self.process_video_file(upload, attachment.filename, on_progress=on_progress)
+                else:
+                    raise ValueError(f"Unknown file type: {file_type}")
+            finally:
+                if sink is not None:
+                    await sink.abort()
+            
+            if cache is not None and content:
+                await cache.aput(upload.digest, kind, content, attachment_id=attachment.id)
+            return content
+    
+    def get_download_session(self):
+        """添付のチャンク単位ダウンロード用セッション"""
+        if self.download_session is None or self.download_session.closed:
+            self.download_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+        return self.download_session
+    
+    async def open_audio_stream(self, upload: SpooledUpload):
+        """先頭バイトを見て、パイプで読める動画なら ffmpeg を起動して返す（読めなければ None）"""
+        streamable = upload.format in STREAMABLE_VIDEO_FORMATS or (
+            upload.format == "mp4" and not needs_seek(upload.head, ".mp4")
+        )
+        if not streamable:
+            return None
+        try:
+            return await AudioPipe(AUDIO_EXTRACT_FORMAT, AUDIO_EXTRACT_BITRATE).start()
+        except ExtractionError as e:
+            logger.warning(f"Audio stream unavailable: {e}")
+            return None
+    
     async def process_text_file(self, content: bytes, filename: str) -> str:
         """テキストファイルの処理"""
         try:
@@ -1796,120 +2224,178 @@ class TDDBot(commands.Bot):
                     continue
             raise ValueError("Could not decode text file")
     
-    async def process_pdf_file(self, content: bytes) -> str:
-        """PDFファイルの処理"""
+    async def process_pdf_file(self, content: bytes | SpooledUpload) -> str:
+        """PDFファイルの処理（解析はワーカープロセスでページ並列、PDF_MAX_TOKENS に達したら打ち切り）"""
         try:
-            from pdfminer.high_level import extract_text
-            import io
-            
-            # バイトコンテンツからテキストを抽出
-            text = extract_text(io.BytesIO(content))
-            
-            if not text.strip():
-                raise ValueError("PDF appears to be empty or contains no extractable text")
-            
-            # 長すぎるテキストは制限
-            max_length = 8000  # GPT-4o-miniのトークン制限を考慮
-            if len(text) > max_length:
-                text = text[:max_length] + "\n\n[テキストが長すぎるため切り詰められました]"
-            
-            return text.strip()
-            
+            with as_path(content, ".pdf") as path:
+                result = await get_pdf_extractor().extract_file(path, limit=PDF_MAX_TOKENS, measure=TOKEN_BUDGET.count)
         except ImportError:
             raise ValueError("pdfminer.six is not installed. Please install it with: pip install pdfminer.six")
         except Exception as e:
             logger.error(f"PDF processing error: {e}")
             raise ValueError(f"PDFの処理中にエラーが発生しました: {str(e)}")
+        
+        text = result.text.strip()
+        if not text:
+            raise ValueError("PDF appears to be empty or contains no extractable text")
+        if not result.complete:
+            debug_log_to_file(f"PDF_EXTRACT: stopped at page {result.pages_read}/{result.total_pages} (PDF_MAX_TOKENS={PDF_MAX_TOKENS})")
+            text += f"\n\n[全{result.total_pages}ページのうち先頭{result.pages_read}ページまでを使用]"
+        
+        # 長いテキストは生成時に condense_content() で分割要約する（ここでは切り詰めない）
+        return text
     
-    async def process_audio_file(self, content: bytes, filename: str) -> str:
-        """音声ファイルの処理"""
-        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1], delete=False) as tmp_file:
-            tmp_file.write(content)
-            tmp_file.flush()
-
-            def sync_transcribe(path):
-                client = OpenAI(timeout=60)  # Whisper API用に60秒タイムアウト
-                with open(path, 'rb') as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                return transcript.text
-
-            try:
-                return await asyncio.to_thread(sync_transcribe, tmp_file.name)
-            finally:
-                os.unlink(tmp_file.name)
+    async def transcribe_path(self, path: str) -> str:
+        """Whisper API で音声ファイルを文字起こし（WHISPER_RPM のクォータ管理付き）"""
+        governor = get_governor("whisper")
+        await governor.acquire()
+        try:
+            text, headers = await asyncio.to_thread(whisper_transcribe_sync, path)
+        except RateLimitError as e:
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            governor.penalize(float(retry_after) if retry_after else None)
+            raise
+        governor.update_from_headers(headers)
+        return text
     
-    async def process_video_file(self, content: bytes, filename: str) -> str:
-        """動画ファイルの処理"""
-        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1], delete=False) as video_file:
-            video_file.write(content)
-            video_file.flush()
-            
+    async def process_audio_file(self, content: bytes | SpooledUpload, filename: str, on_progress=None) -> str:
+        """音声ファイルの処理（長い音声は無音で分割して並行文字起こし、on_progress に区間の進捗）"""
+        with as_path(content, os.path.splitext(filename)[1]) as path:
+            return await self.transcriber.transcribe_file(path, on_progress=on_progress)
+    
+    async def process_video_file(self, content: bytes | SpooledUpload, filename: str, on_progress=None) -> str:
+        """動画ファイルの処理（音声を抽出して process_audio_file と同様に文字起こし）"""
+        suffix = os.path.splitext(filename)[1]
+        if AUDIO_EXTRACT_MODE == "pipe":
+            # 圧縮音声は stdout からメモリへ（WAV の一時ファイルを作らない）
+            try:
+                if isinstance(content, SpooledUpload):
+                    with content.as_path() as path:
+                        audio = await extract_audio_path(path, AUDIO_EXTRACT_FORMAT, AUDIO_EXTRACT_BITRATE)
+                else:
+                    audio = await extract_audio_bytes(
+                        content, suffix, audio_format=AUDIO_EXTRACT_FORMAT, bitrate=AUDIO_EXTRACT_BITRATE,
+                    )
+            except ExtractionError as e:
+                logger.error(f"Audio extraction failed: {e}")
+                raise ValueError("Failed to extract audio from video")
+            return await self.process_audio_file(audio, f"audio{AUDIO_FORMATS[AUDIO_EXTRACT_FORMAT][2]}", on_progress=on_progress)
+        
+        # AUDIO_EXTRACT_MODE=wav: 従来どおり一時ファイル経由で 16kHz WAV に変換
+        with as_path(content, suffix) as video_path:
             with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as audio_file:
                 try:
                     # 動画から音声を抽出（非同期）
-                    success = await extract_audio(video_file.name, audio_file.name)
+                    success = await extract_audio(video_path, audio_file.name)
                     if not success:
                         raise ValueError("Failed to extract audio from video")
 
-                    # 抽出した音声をテキストに変換 (openai>=1.0.0)
-                    def sync_transcribe(path):
-                        client = OpenAI(timeout=60)  # Whisper API用に60秒タイムアウト
-                        with open(path, 'rb') as af:
-                            transcript = client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=af
-                            )
-                        return transcript.text
-
-                    return await asyncio.to_thread(sync_transcribe, audio_file.name)
+                    # 抽出した音声をテキストに変換
+                    return await self.transcriber.transcribe_file(audio_file.name, on_progress=on_progress)
                 finally:
-                    os.unlink(video_file.name)
                     os.unlink(audio_file.name)
     
+    async def condense_content(self, content: str, on_progress=None) -> str:
+        """
+        LLM_INPUT_TOKENS を超えるコンテンツをチャンクごとの要点に縮める（map-reduce）
+        チャンクの要点抽出は裏処理レーンで並行実行し、収まっていればそのまま返す
+        """
+        if TOKEN_BUDGET.fits(content):
+            return content
+        system_prompt = get_prompt('summarization', 'chunk_system_prompt') or "あなたは長文資料の要点を漏れなく抽出するアシスタントです。"
+        
+        async def summarize(chunk, index, total):
+            user_prompt = get_prompt('summarization', 'chunk_template', content=chunk, index=index + 1, total=total)
+            if not user_prompt:
+                user_prompt = f"以下は長い資料の {index + 1}/{total} 番目の部分です。事実・数値・固有名詞を残して要点を箇条書きにしてください。\n\n{chunk}"
+            METRICS.inc("tdd_longdoc_chunks_total")
+            context = current_llm_request()
+            with llm_request(premium=context.premium, interactive=False, guild_id=context.guild_id):
+                max_tokens = output_budget(system_prompt, user_prompt, 900)  # 要点は600文字以内
+                return await self.llm.chat(
+                    system_prompt, user_prompt,
+                    max_tokens=max_tokens,
+                    temperature=0.3, timeout=output_timeout(max_tokens, base=60),
+                )
+        
+        with METRICS.timer("tdd_article_stage_seconds", stage="condense"):
+            condensed = await map_reduce(
+                content, summarize,
+                limit=TOKEN_BUDGET.input_tokens,
+                measure=TOKEN_BUDGET.count,
+                concurrency=LONGDOC_CONCURRENCY,
+                on_progress=on_progress,
+            )
+        debug_log_to_file(f"LONGDOC: condensed {TOKEN_BUDGET.count(content)} -> {TOKEN_BUDGET.count(condensed)} tokens")
+        return condensed
+    
     async def generate_tldr(self, content: str) -> str:
         """長文コンテンツのTLDR（要約）を生成"""
-        # 長すぎるコンテンツは制限
-        if len(content) > 6000:
-            content = content[:6000] + "...[要約のため一部省略]"
+        content = await self.condense_content(content)
         
         # 外部YAMLからプロンプトテンプレートを取得
         system_prompt = get_prompt('summarization', 'system_prompt')
         user_prompt = get_prompt('summarization', 'tldr_template', content=content)
 
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=300,
+        max_tokens = output_budget(system_prompt, user_prompt, 400)  # 200文字の箇条書き + 絵文字
+        return await self.llm.chat(
+            system_prompt,
+            user_prompt,
+            max_tokens=max_tokens,
             temperature=0.3,  # 要約は一貫性を重視
-            timeout=30  # 30秒タイムアウト
+            timeout=output_timeout(max_tokens)
         )
 
-        return response.choices[0].message.content
-
-    async def generate_article(self, content: str, style: str = "prep") -> str:
-        """OpenAI GPT-4o-miniを使用してMarkdown記事を生成"""
+    async def generate_article(self, content: str, style: str = "prep", on_text=None) -> str:
+        """OpenAI GPT-4o-miniを使用してMarkdown記事を生成（on_text 指定時はストリーミング）"""
         # 外部YAMLからプロンプトテンプレートを取得
         system_prompt = get_prompt('article_generation', 'system_prompt')
+        content = await self.condense_content(content)
         user_prompt = build_prompt(content, style)
 
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=2000,
+        # 記事の長さは入力量に応じて伸ばす（短い入力に大きな枠を予約しない）
+        expected = min(4000, 1200 + TOKEN_BUDGET.count(content) // 2)
+        max_tokens = output_budget(system_prompt, user_prompt, expected)
+        return await self.llm.chat(
+            system_prompt,
+            user_prompt,
+            max_tokens=max_tokens,
             temperature=0.7,
-            timeout=30  # 30秒タイムアウト
+            timeout=output_timeout(max_tokens),  # 長い記事ほど生成に時間がかかる
+            on_text=on_text
         )
-
-        return response.choices[0].message.content
+    
+    async def generate_article_with_tldr(self, content: str, style: str = "prep", include_tldr: bool = False, on_article_text=None, on_condense_progress=None):
+        """
+        記事と TLDR を並行して生成（on_article_text には記事の途中経過を渡す）
+        長文は先に1回だけ分割要約し、その結果を記事・TLDR の両方で使う
+        
+        Returns:
+            (記事, TLDR)。TLDR は不要または生成失敗なら None（記事の失敗は例外として伝播）
+        """
+        async def timed(stage, coro):
+            with METRICS.timer("tdd_article_stage_seconds", stage=stage):
+                return await coro
+        
+        content = await self.condense_content(content, on_progress=on_condense_progress)
+        article_task = asyncio.create_task(timed("generate_article", self.generate_article(content, style, on_text=on_article_text)))
+        tldr_task = asyncio.create_task(timed("generate_tldr", self.generate_tldr(content))) if include_tldr else None
+        try:
+            article = await article_task
+        except BaseException:
+            if tldr_task:
+                tldr_task.cancel()
+                await asyncio.gather(tldr_task, return_exceptions=True)
+            raise
+        
+        tldr_summary = None
+        if tldr_task:
+            try:
+                tldr_summary = await tldr_task
+            except Exception as e:
+                logger.warning(f"TLDR generation failed, delivering article only: {e}")
+                debug_log_to_file(f"ARTICLE: TLDR generation failed, delivering article only: {e}", logging.WARNING)
+        return article, tldr_summary
     
     async def on_raw_reaction_add(self, payload):
         """🎤/❤️ リアクションで音声・動画処理 or ツイートプレビュー"""
@@ -1948,7 +2434,7 @@ class TDDBot(commands.Bot):
                                         if md_file.filename.endswith(".md"):
                                             md_bytes = await md_file.read()
                                             md_text = md_bytes.decode('utf-8', errors='ignore')
-                                            tweet_content = md_text[:600]
+                                            tweet_content = truncate_to_tokens(md_text, 800)
                                             break
                                 except Exception as e:
                                     logger.warning(f"Failed to fetch .md content from referenced message: {e}")
@@ -1962,7 +2448,7 @@ class TDDBot(commands.Bot):
                             try:
                                 md_bytes = await attachment.read()
                                 md_text = md_bytes.decode('utf-8', errors='ignore')
-                                tweet_content = md_text[:600]
+                                tweet_content = truncate_to_tokens(md_text, 800)
                                 break
                             except Exception as e:
                                 logger.warning(f"Failed to read .md file content for tweet: {e}")
@@ -1975,16 +2461,19 @@ class TDDBot(commands.Bot):
                         system_prompt = get_prompt('tweet_generation', 'system_prompt')
                         user_prompt = get_prompt('tweet_generation', 'tweet_template', content=original_content)
                         
-                        response = self.openai_client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {"role": "system", "content": system_prompt},
-                                {"role": "user", "content": user_prompt}
-                            ],
-                            max_tokens=160,
-                            temperature=0.7
-                        )
-                        candidate = response.choices[0].message.content.strip().replace('\n', ' ')
+                        premium = payload.member is not None and self.is_premium_user(payload.member)
+                        with llm_request(premium=premium, guild_id=payload.guild_id):
+                            # 同じ内容への同時リアクションは1回の要約に合流する
+                            candidate = await self.inflight.do(
+                                ("tweet_preview", hashlib.sha256(original_content.encode("utf-8")).hexdigest()),
+                                lambda: self.llm.chat(
+                                    system_prompt,
+                                    user_prompt,
+                                    max_tokens=output_budget(system_prompt, user_prompt, 300),  # 140文字 + 余裕
+                                    temperature=0.7
+                                ),
+                            )
+                        candidate = candidate.strip().replace('\n', ' ')
                         logger.info(f"🧪 Candidate tweet: {candidate} ({len(candidate)} chars)")
                         if len(candidate) <= 140:
                             preview = candidate
@@ -2073,13 +2562,13 @@ class TDDBot(commands.Bot):
                     file_type = validate_file_type(attachment.filename, b'')
                     if file_type not in ["audio", "video"]:
                         continue
-                    # 使用回数制限チェック（Premium以外）
+                    # 使用回数制限の対象か（Premium以外）。消費は実際に処理を始めるときだけ
                     user = self.get_user(payload.user_id)
+                    charge_quota = False
                     if hasattr(user, 'roles'):  # ギルドメンバーの場合
                         guild = self.get_guild(payload.guild_id)
                         member = guild.get_member(payload.user_id)
-                        if not self.is_premium_user(member):
-                            limit_user(str(payload.user_id), self.redis_client)
+                        charge_quota = not self.is_premium_user(member)
                     # 文字起こしログ
                     await self.log_to_moderator(
                         title="🎤 Transcription Request",
@@ -2091,34 +2580,56 @@ class TDDBot(commands.Bot):
                             "Type": file_type
                         }
                     )
-                    # ファイル処理
-                    file_content = await attachment.read()
-                    if file_type == "audio":
-                        content = await self.process_audio_file(file_content, attachment.filename)
-                    else:  # video
-                        content = await self.process_video_file(file_content, attachment.filename)
-                    # 文字起こし結果をファイルとして保存・送信
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"transcript_{timestamp}.txt"
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp_file:
-                        tmp_file.write(content)
-                        tmp_file.flush()
-                        file_obj = discord.File(tmp_file.name, filename=filename)
-                        embed = discord.Embed(
-                            title="文字起こし完了",
-                            description=f"「{attachment.filename}」の文字起こしが完了しました",
-                            color=discord.Color.green()
-                        )
-                        await channel.send(embed=embed, file=file_obj)
-                        os.unlink(tmp_file.name)
+                    await self.request_transcription(channel, attachment, file_type, payload.user_id, charge_quota)
                 except Exception as e:
                     logger.error(f"Reaction processing error: {e}")
                     await channel.send("処理中にエラーが発生しました")
         except Exception as e:
             logger.error(f"Reaction handler error: {e}")
 
+    async def request_transcription(self, channel, attachment, file_type: str, user_id, charge_quota: bool):
+        """
+        同じ添付への同時リアクションは1回のダウンロード・文字起こし・投稿に合流する
+        利用回数は処理を新しく始める呼び出し元だけが開始前に消費し、実行中の処理に合流した人は消費しない
+        （上限超過で断られた人は処理を始めないので、後から来た人の文字起こしには影響しない）
+        """
+        key = ("transcribe", attachment.id)
+        if charge_quota and key not in self.inflight:
+            try:
+                await limit_user_async(str(user_id), self.redis_client)
+            except UsageLimitExceeded as e:
+                await channel.send(f"<@{user_id}> ⚠️ {e}")
+                return
+        await self.inflight.do(key, lambda: self.transcribe_and_post(channel, attachment, file_type))
+    
+    async def transcribe_and_post(self, channel, attachment, file_type: str):
+        """添付の音声・動画を文字起こしして結果をチャンネルに投稿（失敗時もエラー通知は1回だけ）"""
+        try:
+            content = await self.extract_attachment(attachment, file_type)
+            # 文字起こし結果をファイルとして保存・送信
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"transcript_{timestamp}.txt"
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp_file:
+                tmp_file.write(content)
+                tmp_file.flush()
+                file_obj = discord.File(tmp_file.name, filename=filename)
+                embed = discord.Embed(
+                    title="文字起こし完了",
+                    description=f"「{attachment.filename}」の文字起こしが完了しました",
+                    color=discord.Color.green()
+                )
+                await channel.send(embed=embed, file=file_obj)
+                os.unlink(tmp_file.name)
+        except Exception as e:
+            logger.error(f"Reaction processing error: {e}")
+            await channel.send("処理中にエラーが発生しました")
+
     async def setup_hook(self):
         """Cog 登録と Slash コマンド同期を確実に実行する"""
+        # 0) トークナイザの読み込み（初回はダウンロードを伴うことがあるのでイベントループの外で）
+        if not await asyncio.to_thread(load_encoding, TOKEN_BUDGET.model):
+            logger.info("[setup_hook] tiktoken unavailable, token counts are estimated")
+
         # 1) Cog を登録
         await self.add_cog(TDDCog(self))
         
@@ -2140,6 +2651,35 @@ class TDDBot(commands.Bot):
         async def ping(ctx):
             await ctx.send("Pong!")
 
+        # 4) 期限切れキャッシュの定期掃除
+        self.cache_sweeper_task = asyncio.create_task(self.cache_sweeper())
+
+        # 5) メトリクスの HTTP 公開（METRICS_PORT 指定時のみ）
+        self.metrics_runner = None
+        if METRICS_PORT:
+            try:
+                self.metrics_runner = await start_metrics_server(METRICS, METRICS_PORT, METRICS_HOST)
+            except OSError as e:
+                logger.error(f"[setup_hook] Failed to start metrics endpoint: {e}")
+
+    async def close(self):
+        if getattr(self, "metrics_runner", None):
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+        await self.llm.aclose()
+        if self.download_session is not None:
+            await self.download_session.close()
+        await super().close()
+
+    async def cache_sweeper(self):
+        """RATE_LIMIT_CACHE / 状態ストアの期限切れキーを定期的に削除"""
+        while not self.is_closed():
+            try:
+                await sweep_expired_cache()
+            except Exception as e:
+                logger.error(f"Cache sweep failed: {e}")
+            await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+
 # --- プロセスロック機能 ---
 def acquire_lock():
     """プロセスロックを取得して複数インスタンス起動を防ぐ"""
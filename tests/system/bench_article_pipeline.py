@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+/article include_tldr:true の生成段階ベンチマーク（フェイクLLM）: 直列 vs 並行
+
+従来 : await generate_article() → await generate_tldr()
+新   : await generate_article_with_tldr()（2つの呼び出しを並行実行）
+
+LLM 呼び出しは max_tokens に比例した待ち時間を返すフェイクに差し替える
+（既定: 1000トークンあたり BENCH_SECONDS_PER_1K_TOKENS 秒）。
+
+使い方:
+    python tests/system/bench_article_pipeline.py
+    BENCH_RUNS=20 BENCH_SECONDS_PER_1K_TOKENS=2.0 python tests/system/bench_article_pipeline.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from common.services.llm import LLMClient  # noqa: E402
+from tdd_bot import TDDBot  # noqa: E402
+
+RUNS = int(os.getenv("BENCH_RUNS", "10"))
+SECONDS_PER_1K_TOKENS = float(os.getenv("BENCH_SECONDS_PER_1K_TOKENS", "0.5"))
+CONTENT = "テスト用の本文です。" * 200
+
+
+async def fake_create(**kwargs):
+    await asyncio.sleep(kwargs["max_tokens"] / 1000 * SECONDS_PER_1K_TOKENS)
+    message = SimpleNamespace(content="# generated")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_bot():
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create)))
+    bot = SimpleNamespace(llm=LLMClient(client=client))
+    for name in ("condense_content", "generate_article", "generate_tldr", "generate_article_with_tldr"):
+        setattr(bot, name, partial(getattr(TDDBot, name), bot))
+    return bot
+
+
+async def sequential(bot):
+    article = await bot.generate_article(CONTENT, "prep")
+    tldr = await bot.generate_tldr(CONTENT)
+    return article, tldr
+
+
+async def concurrent(bot):
+    return await bot.generate_article_with_tldr(CONTENT, "prep", True)
+
+
+async def measure(call, bot):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        await call(bot)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+async def main():
+    bot = make_bot()
+    before = await measure(sequential, bot)
+    after = await measure(concurrent, bot)
+    print(f"sequential (article → tldr) median={before * 1000:.0f}ms")
+    print(f"concurrent (article ∥ tldr) median={after * 1000:.0f}ms")
+    print(f"saving: {(before - after) * 1000:.0f}ms ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+動画からの音声抽出ベンチマーク: 一時ファイル + WAV vs パイプ + 圧縮音声
+
+従来 : 動画を一時ファイルへ書き出し → ffmpeg で 16kHz WAV の一時ファイルへ → WAV を読み戻して送信
+新   : 動画を ffmpeg の stdin へ → 低ビットレート Opus/MP3 を stdout からメモリへ（extract_audio_bytes）
+
+ディスクへの書き込み・読み込みバイト数、Whisper へ送るバイト数、所要時間（中央値）を比較する。
+ffmpeg が必要。入力を省略すると lavfi で BENCH_SECONDS 秒のテスト動画を生成する。
+
+使い方:
+    python tests/system/bench_audio_extract.py [動画ファイル]
+    BENCH_RUNS=5 BENCH_SECONDS=600 AUDIO_EXTRACT_FORMAT=mp3 python tests/system/bench_audio_extract.py
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from common.media import extract_audio_bytes  # noqa: E402
+from tdd_bot import extract_audio  # noqa: E402
+
+RUNS = int(os.getenv("BENCH_RUNS", "3"))
+SECONDS = int(os.getenv("BENCH_SECONDS", "300"))
+AUDIO_FORMAT = os.getenv("AUDIO_EXTRACT_FORMAT", "opus")
+BITRATE = os.getenv("AUDIO_EXTRACT_BITRATE", "24k")
+
+
+def make_sample(directory: str) -> str:
+    path = os.path.join(directory, "sample.webm")
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-y",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={SECONDS}",
+         "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=15:duration={SECONDS}",
+         "-c:v", "libvpx", "-b:v", "500k", "-c:a", "libopus", "-shortest", path],
+        check=True,
+    )
+    return path
+
+
+async def legacy(data: bytes, suffix: str) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as video_file:
+        video_file.write(data)
+    audio_path = video_file.name + ".wav"
+    try:
+        if not await extract_audio(video_file.name, audio_path):
+            raise RuntimeError("ffmpeg failed")
+        with open(audio_path, "rb") as f:
+            audio = f.read()
+    finally:
+        os.unlink(video_file.name)
+        if os.path.exists(audio_path):
+            os.unlink(audio_path)
+    return {"disk_written": len(data) + len(audio), "disk_read": len(audio), "upload": len(audio)}
+
+
+async def pipe(data: bytes, suffix: str) -> dict:
+    stats = {}
+    audio = await extract_audio_bytes(data, suffix, audio_format=AUDIO_FORMAT, bitrate=BITRATE, stats=stats)
+    return {"disk_written": stats["disk_bytes"], "disk_read": 0, "upload": len(audio), "mode": stats["mode"]}
+
+
+async def measure(call, data, suffix):
+    samples, result = [], None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = await call(data, suffix)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f}MB"
+
+
+async def main():
+    if shutil.which("ffmpeg") is None:
+        sys.exit("ffmpeg is not installed")
+    with tempfile.TemporaryDirectory() as directory:
+        path = sys.argv[1] if len(sys.argv) > 1 else make_sample(directory)
+        data = Path(path).read_bytes()
+        suffix = Path(path).suffix
+        print(f"input: {path} ({mb(len(data))})")
+        for name, call in (("tempfile + wav", legacy), (f"pipe + {AUDIO_FORMAT} {BITRATE}", pipe)):
+            elapsed, result = await measure(call, data, suffix)
+            mode = f" [{result['mode']}]" if "mode" in result else ""
+            print(
+                f"{name:<22} median={elapsed * 1000:.0f}ms "
+                f"disk_written={mb(result['disk_written'])} disk_read={mb(result['disk_read'])} "
+                f"upload={mb(result['upload'])}{mode}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+limit_user マイクロベンチマーク: 従来の同期パス vs 非同期アトミックパス
+
+従来パス : イベントループ上で limit_user()（GET/INCR/EXPIRE の3往復、ブロッキング）
+新パス   : await limit_user_async()（Luaスクリプト1往復、redis.asyncio）
+
+一定間隔でリクエストを到着させ、到着予定時刻から完了までのレイテンシを計測する
+（イベントループのブロッキングによる待ち時間も含まれる）。
+fakeredis はネットワーク往復が無く Lua もプロセス内実行のため、実測値は REDIS_URL で取ること。
+
+使い方:
+    python tests/system/bench_limit_user.py                 # fakeredis
+    REDIS_URL=redis://localhost:6379/15 python tests/system/bench_limit_user.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+os.environ.setdefault("DAILY_RATE_LIMIT", "1000000")
+
+from tdd_bot import limit_user, limit_user_async  # noqa: E402
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "2000"))
+RATE = float(os.getenv("BENCH_RATE", "500"))  # req/s
+
+
+def make_clients():
+    url = os.getenv("REDIS_URL")
+    if url:
+        import redis
+        import redis.asyncio
+        return redis.Redis.from_url(url), redis.asyncio.Redis.from_url(url)
+    import fakeredis
+    from fakeredis import aioredis
+    server = fakeredis.FakeServer()
+    return fakeredis.FakeStrictRedis(server=server), aioredis.FakeRedis(server=server)
+
+
+async def run(call):
+    latencies = []
+    start = time.perf_counter() + 0.05
+
+    async def one(i):
+        scheduled = start + i / RATE
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await call(f"bench_{i % 500}")
+        latencies.append(time.perf_counter() - scheduled)
+
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max": latencies[-1] * 1000,
+    }
+
+
+async def main():
+    sync_client, async_client = make_clients()
+
+    async def current_path(user_id):
+        limit_user(user_id, sync_client)
+
+    async def async_path(user_id):
+        await limit_user_async(user_id, async_client)
+
+    for name, call in (("limit_user (sync, 3 round trips)", current_path),
+                       ("limit_user_async (Lua, 1 round trip)", async_path)):
+        sync_client.flushdb()
+        result = await run(call)
+        print(f"{name:40s} p50={result['p50']:.2f}ms p99={result['p99']:.2f}ms max={result['max']:.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
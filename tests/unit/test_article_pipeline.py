@@ -0,0 +1,64 @@
+import asyncio
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+
+def make_bot(article_delay=0.2, tldr_delay=0.2, tldr_error=None, article_error=None):
+    from tdd_bot import TDDBot
+
+    state = SimpleNamespace(tldr_cancelled=False)
+
+    async def generate_article(content, style, on_text=None):
+        await asyncio.sleep(article_delay)
+        if article_error:
+            raise article_error
+        return f"article:{style}"
+
+    async def generate_tldr(content):
+        try:
+            await asyncio.sleep(tldr_delay)
+        except asyncio.CancelledError:
+            state.tldr_cancelled = True
+            raise
+        if tldr_error:
+            raise tldr_error
+        return "tldr"
+
+    async def condense_content(content, on_progress=None):
+        return content
+
+    bot = SimpleNamespace(generate_article=generate_article, generate_tldr=generate_tldr, condense_content=condense_content)
+    bot.generate_article_with_tldr = partial(TDDBot.generate_article_with_tldr, bot)
+    return bot, state
+
+
+@pytest.mark.asyncio
+async def test_article_and_tldr_run_concurrently():
+    bot, _ = make_bot()
+    start = time.perf_counter()
+    article, tldr = await bot.generate_article_with_tldr("content", "prep", True)
+    assert (article, tldr) == ("article:prep", "tldr")
+    assert time.perf_counter() - start < 0.35  # 直列なら 0.4 秒以上
+
+
+@pytest.mark.asyncio
+async def test_tldr_failure_still_delivers_article():
+    bot, _ = make_bot(tldr_delay=0.01, tldr_error=RuntimeError("boom"))
+    assert await bot.generate_article_with_tldr("content", "pas", True) == ("article:pas", None)
+
+
+@pytest.mark.asyncio
+async def test_article_failure_cancels_tldr():
+    bot, state = make_bot(article_delay=0.01, tldr_delay=1.0, article_error=RuntimeError("boom"))
+    with pytest.raises(RuntimeError):
+        await bot.generate_article_with_tldr("content", "prep", True)
+    assert state.tldr_cancelled
+
+
+@pytest.mark.asyncio
+async def test_without_tldr():
+    bot, _ = make_bot()
+    assert await bot.generate_article_with_tldr("content", "prep", False) == ("article:prep", None)
@@ -0,0 +1,36 @@
+import logging
+import os
+
+from common.debug_log import BufferedFileLogger
+
+
+def test_messages_are_written_in_order(tmp_path):
+    path = str(tmp_path / "debug.log")
+    logger = BufferedFileLogger(path)
+    for i in range(100):
+        logger.log(f"message {i}")
+    logger.close()
+    lines = open(path, encoding="utf-8").read().splitlines()
+    assert len(lines) == 100
+    assert lines[0].endswith("message 0") and lines[-1].endswith("message 99")
+
+
+def test_rotates_by_size(tmp_path):
+    path = str(tmp_path / "debug.log")
+    logger = BufferedFileLogger(path, max_bytes=512, backup_count=2, batch_size=1)
+    for i in range(100):
+        logger.log(f"message {i}")
+    logger.close()
+    assert os.path.exists(f"{path}.1") and os.path.exists(f"{path}.2")
+    assert not os.path.exists(f"{path}.3")
+
+
+def test_drops_low_levels_under_load(tmp_path):
+    logger = BufferedFileLogger(str(tmp_path / "debug.log"), queue_size=10)
+    logger._thread = object()  # 書き込みスレッドを止めた状態でキューを溢れさせる
+    for i in range(50):
+        logger.log(f"debug {i}")
+    logger.log("warning", logging.WARNING)
+    assert logger.dropped > 0
+    queued = [logger._queue.get_nowait()[2] for _ in range(logger._queue.qsize())]
+    assert "warning" in queued
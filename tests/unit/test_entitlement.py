@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+
+import pytest
+
+from common.entitlement import EntitlementResolver
+from common.feature_flag import FeatureFlagManager
+from common.guild_config import FileGuildConfig
+from common.ratelimit import RateLimiter
+from common.services.auth import PaymentServiceV2
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    guild_config = FileGuildConfig(str(tmp_path / "guilds"))
+    payment = PaymentServiceV2(str(tmp_path / "users"), watch=False)
+    return EntitlementResolver(guild_config, payment, FeatureFlagManager(), RateLimiter())
+
+
+def member(user_id, guild_id=1):
+    return SimpleNamespace(id=user_id, guild=SimpleNamespace(id=guild_id))
+
+
+@pytest.mark.asyncio
+async def test_paid_feature_follows_plan_and_payment(resolver):
+    resolver.preload([1])
+    assert await resolver.has_access(member(10), "transcribe") is False
+    resolver.payment.set_paid(10)
+    assert await resolver.has_access(member(10), "transcribe") is True
+
+
+@pytest.mark.asyncio
+async def test_set_plan_invalidates_cached_plan(resolver):
+    resolver.preload([1])
+    assert await resolver.has_access(member(10), "twitter_post") is False
+    resolver.guild_config.set_plan(1, "pro")
+    assert await resolver.has_access(member(10), "twitter_post") is True
+
+
+def test_check_many_does_not_consume_rate_limit(resolver):
+    members = [member(i) for i in range(3)]
+    resolver.payment.set_paid(1)
+    assert resolver.check_many(members, "transcribe") == {0: False, 1: True, 2: False}
+    assert resolver.rate_limiter._state == {}
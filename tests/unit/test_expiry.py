@@ -0,0 +1,36 @@
+from common.expiry import ExpiryIndex
+
+
+def test_pop_expired_returns_only_due_keys():
+    idx = ExpiryIndex()
+    idx.set("limit:1:2025-01-01", 100)
+    idx.set("limit:2:2025-01-02", 200)
+    idx.set("processing:1", 50)
+    assert sorted(idx.pop_expired(now=150)) == ["limit:1:2025-01-01", "processing:1"]
+    assert idx.stats() == {"live": 1, "heap_size": 1, "evicted": 2}
+
+
+def test_reset_and_discard_skip_stale_entries():
+    idx = ExpiryIndex()
+    idx.set("processing:1", 50)
+    idx.set("processing:1", 500)
+    idx.set("processing:2", 50)
+    idx.discard("processing:2")
+    assert idx.pop_expired(now=100) == []
+    assert idx.pop_expired(now=600) == ["processing:1"]
+
+
+def test_same_deadline_does_not_grow_heap():
+    idx = ExpiryIndex()
+    for _ in range(1000):
+        idx.set("limit:1:2025-01-01", 100)
+    assert idx.stats()["heap_size"] == 1
+
+
+def test_heap_stays_bounded_under_churn():
+    idx = ExpiryIndex()
+    for i in range(10000):
+        idx.set(f"processing:{i}", i)
+        idx.discard(f"processing:{i}")
+    assert len(idx) == 0
+    assert idx.stats()["heap_size"] <= 64
@@ -0,0 +1,100 @@
+import gzip
+import os
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+from common.extraction_cache import ExtractionCache, content_digest
+
+
+def test_put_get_by_hash_and_attachment_id(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    digest = content_digest(b"audio-bytes")
+    assert cache.get(digest, "transcript") is None
+    cache.put(digest, "transcript", "こんにちは" * 100, attachment_id=123)
+
+    assert cache.get_by_id(123, "transcript") == "こんにちは" * 100
+    assert cache.get_by_id(123, "pdf") is None
+    assert cache.get(digest, "transcript", attachment_id=456) == "こんにちは" * 100
+    assert cache.get_by_id("456", "transcript") == "こんにちは" * 100
+    assert cache.stats()["id_hits"] == 2 and cache.stats()["hash_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_entries_are_compressed_on_disk(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    text = "繰り返しの多い文字起こし。" * 1000
+    cache.put("ab" * 32, "transcript", text)
+    path = tmp_path / "ab" / f"{'ab' * 32}.transcript.gz"
+    assert gzip.decompress(path.read_bytes()).decode() == text
+    assert path.stat().st_size < len(text.encode()) / 10
+
+
+def test_index_and_aliases_survive_restart(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    cache.put("cd" * 32, "pdf", "PDF本文", attachment_id=1)
+    reopened = ExtractionCache(tmp_path)
+    assert reopened.stats()["entries"] == 1
+    assert reopened.get_by_id(1, "pdf") == "PDF本文"
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    cache = ExtractionCache(tmp_path, max_bytes=6_000)
+    blobs = {f"{i:064x}": os.urandom(1500).hex() for i in range(3)}  # 圧縮の効きにくい本文
+    for i, (digest, text) in enumerate(blobs.items()):
+        cache.put(digest, "transcript", text, attachment_id=i)
+    first = next(iter(blobs))
+    assert cache.get(first, "transcript") is not None  # 最初のエントリを最近使ったことにする
+    extra = f"{99:064x}"
+    cache.put(extra, "transcript", os.urandom(1500).hex())
+
+    assert cache.stats()["disk_bytes"] <= 5_400
+    assert cache.get(first, "transcript") is not None
+    assert cache.get(f"{1:064x}", "transcript") is None  # 最も古いものから削除
+    assert cache.get_by_id(1, "transcript") is None
+    assert cache.stats()["evicted"] >= 1
+
+
+def test_alias_for_evicted_entry_is_not_resurrected(tmp_path):
+    cache = ExtractionCache(tmp_path, max_bytes=6_000)
+    digest = f"{1:064x}"
+    cache.put(digest, "transcript", os.urandom(1500).hex())
+    cache.max_bytes = 0
+    cache._evict()
+    cache._link(9, digest, "transcript")  # 読み出しと削除が入れ替わった場合の遅れた対応付け
+    assert cache.digest_for(9, "transcript") is None
+    assert ExtractionCache(tmp_path).digest_for(9, "transcript") is None
+
+
+@pytest.mark.asyncio
+async def test_extract_attachment_skips_download_on_repeat(tmp_path):
+    from tdd_bot import TDDBot
+
+    reads, processed = [], []
+
+    class Attachment:
+        def __init__(self, attachment_id, data):
+            self.id = attachment_id
+            self.filename = "memo.mp3"
+            self._data = data
+
+        async def read(self):
+            reads.append(self.id)
+            return self._data
+
+    async def process_audio_file(content, filename, on_progress=None):
+        processed.append(filename)
+        return "文字起こし結果"
+
+    bot = SimpleNamespace(
+        extraction_cache=ExtractionCache(tmp_path),
+        process_audio_file=process_audio_file,
+        get_download_session=lambda: None,  # url の無い添付は attachment.read() で一括取得
+    )
+    extract = partial(TDDBot.extract_attachment, bot)
+
+    assert await extract(Attachment(1, b"voice"), "audio") == "文字起こし結果"
+    assert await extract(Attachment(1, b"voice"), "audio") == "文字起こし結果"  # 添付IDでヒット
+    assert await extract(Attachment(2, b"voice"), "audio") == "文字起こし結果"  # 再投稿: 内容でヒット
+    assert reads == [1, 2]
+    assert processed == ["memo.mp3"]
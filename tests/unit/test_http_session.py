@@ -0,0 +1,57 @@
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from common.services import http
+from common.services.whisper import WhisperService
+
+
+@pytest_asyncio.fixture
+async def server():
+    peers = set()
+
+    async def transcribe(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        form = await request.post()
+        return web.json_response({"text": form["file"].file.read().decode()})
+
+    async def head(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        return web.Response(status=404, text="not found")
+
+    app = web.Application()
+    app.router.add_post("/v1/audio/transcriptions", transcribe)
+    app.router.add_get("/v1", head)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1", peers
+    await http.close_session()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_shared_session_reuses_warm_connection(server, tmp_path, monkeypatch):
+    base_url, peers = server
+    monkeypatch.setattr("common.services.whisper.OPENAI_BASE_URL", base_url)
+    await http.warm_up(base_url, connections=1)
+
+    audio = tmp_path / "audio.mp3"
+    audio.write_bytes(b"hello")
+    service = WhisperService(api_key="test")
+    assert await service.transcribe(str(audio)) == "hello"
+    assert await service.transcribe(str(audio)) == "hello"
+
+    assert len(peers) == 1  # warm_up で張った接続を使い回している
+    assert http.get_session() is http.get_session()
+
+
+@pytest.mark.asyncio
+async def test_close_session():
+    session = http.get_session()
+    await http.close_session()
+    assert session.closed
+    assert http.get_session() is not session
+    await http.close_session()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+from common.ingest import HEAD_BYTES, SpooledUpload, as_path, ingest, sniff_format
+
+
+async def chunked(data: bytes, size: int):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+def test_sniff_format_by_magic_bytes():
+    assert sniff_format(b"%PDF-1.7\n") == "pdf"
+    assert sniff_format(b"\x00\x00\x00\x18ftypisom") == "mp4"
+    assert sniff_format(b"\x1a\x45\xdf\xa3\x01") == "webm"
+    assert sniff_format(b"OggS\x00\x02") == "ogg"
+    assert sniff_format(b"RIFF\x24\x00\x00\x00WAVEfmt ") == "wav"
+    assert sniff_format(b"ID3\x04\x00") == "mp3"
+    assert sniff_format(b"\xff\xfb\x90\x00") == "mp3"
+    assert sniff_format(b"hello") is None
+
+
+def test_small_upload_stays_in_memory():
+    upload = SpooledUpload(suffix=".txt", spool_bytes=1024)
+    upload.write(b"abc")
+    upload.write(b"def")
+    upload.finish()
+    assert upload.in_memory and upload.getvalue() == b"abcdef"
+    assert upload.digest == hashlib.sha256(b"abcdef").hexdigest()
+    with upload.as_path() as path:
+        assert path.endswith(".txt") and open(path, "rb").read() == b"abcdef"
+    assert not os.path.exists(path)
+
+
+@pytest.mark.asyncio
+async def test_large_upload_spills_to_named_file(tmp_path):
+    data = os.urandom(300_000)
+    upload, sink = await ingest(chunked(data, 65_536), suffix=".mp3", spool_bytes=100_000, directory=tmp_path)
+    assert sink is None
+    assert not upload.in_memory and upload.path.endswith(".mp3")
+    with upload.as_path() as path:
+        assert path == upload.path  # 書き出し済みのファイルをそのまま渡す
+    assert upload.getvalue() == data
+    assert upload.digest == hashlib.sha256(data).hexdigest()
+    assert upload.head == data[:HEAD_BYTES]
+    upload.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+class RecordingSink:
+    def __init__(self):
+        self.received = bytearray()
+        self.aborted = False
+
+    async def feed(self, chunk):
+        self.received += chunk
+
+    async def abort(self):
+        self.aborted = True
+
+
+@pytest.mark.asyncio
+async def test_sink_receives_every_byte_while_ingesting():
+    data = b"\x1a\x45\xdf\xa3" + os.urandom(200_000)
+    opened = []
+
+    async def open_sink(upload):
+        opened.append((upload.format, upload.size))
+        return RecordingSink()
+
+    upload, sink = await ingest(chunked(data, 10_000), suffix=".webm", open_sink=open_sink)
+    assert opened == [("webm", 70_000)]  # 先頭 HEAD_BYTES が揃った時点で開く
+    assert bytes(sink.received) == data
+
+
+@pytest.mark.asyncio
+async def test_small_file_opens_sink_at_end_and_failure_aborts_it():
+    sinks = []
+
+    async def open_sink(upload):
+        sinks.append(RecordingSink())
+        return sinks[-1]
+
+    upload, sink = await ingest(chunked(b"OggS-short", 4), open_sink=open_sink)
+    assert bytes(sink.received) == b"OggS-short"
+
+    async def failing():
+        yield b"\x1a\x45\xdf\xa3" + b"x" * HEAD_BYTES
+        raise ConnectionError("download interrupted")
+
+    with pytest.raises(ConnectionError):
+        await ingest(failing(), open_sink=open_sink)
+    assert sinks[-1].aborted
+
+
+def test_as_path_accepts_bytes():
+    with as_path(b"%PDF-1.4", ".pdf") as path:
+        assert open(path, "rb").read() == b"%PDF-1.4"
+    assert not os.path.exists(path)
+
+
+@pytest.mark.asyncio
+async def test_extract_attachment_streams_video_into_audio_pipe(tmp_path):
+    from tdd_bot import TDDBot
+
+    transcribed = []
+
+    class Pipe(RecordingSink):
+        async def finish(self):
+            return b"audio:" + bytes(self.received[:4])
+
+    class Attachment:
+        id = 7
+        filename = "clip.webm"
+
+        async def read(self):
+            return b"\x1a\x45\xdf\xa3" + b"v" * 100
+
+    async def process_audio_file(content, filename, on_progress=None):
+        transcribed.append((content, filename))
+        return "動画の文字起こし"
+
+    async def open_audio_stream(upload):
+        return Pipe()
+
+    bot = SimpleNamespace(
+        extraction_cache=None,
+        process_audio_file=process_audio_file,
+        get_download_session=lambda: None,
+        open_audio_stream=open_audio_stream,
+    )
+    assert await partial(TDDBot.extract_attachment, bot)(Attachment(), "video") == "動画の文字起こし"
+    assert transcribed == [(b"audio:\x1a\x45\xdf\xa3", "audio.ogg")]
@@ -0,0 +1,62 @@
+import asyncio
+
+import fakeredis
+import pytest
+from fakeredis import aioredis
+
+from tdd_bot import limit_user_async, UsageLimitExceeded
+
+
+@pytest.fixture
+def async_redis():
+    return aioredis.FakeRedis()
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+@pytest.mark.asyncio
+async def test_limit_async_increment(async_redis):
+    for _ in range(5):
+        assert await limit_user_async("123", async_redis) is True
+    with pytest.raises(UsageLimitExceeded):
+        await limit_user_async("123", async_redis)
+
+
+@pytest.mark.asyncio
+async def test_limit_async_sets_expire_once(async_redis):
+    await limit_user_async("456", async_redis)
+    [key] = await async_redis.keys("limit:456:*")
+    assert 0 < await async_redis.ttl(key) <= 86400
+
+
+@pytest.mark.asyncio
+async def test_limit_async_concurrent_requests_never_exceed_limit(async_redis):
+    async def attempt():
+        try:
+            return await limit_user_async("789", async_redis)
+        except UsageLimitExceeded:
+            return False
+
+    results = await asyncio.gather(*(attempt() for _ in range(20)))
+    assert results.count(True) == 5
+    [key] = await async_redis.keys("limit:789:*")
+    assert int(await async_redis.get(key)) == 5
+
+
+@pytest.mark.asyncio
+async def test_limit_async_sync_client_runs_script(redis_client):
+    for _ in range(5):
+        await limit_user_async("321", redis_client)
+    with pytest.raises(UsageLimitExceeded):
+        await limit_user_async("321", redis_client)
+
+
+@pytest.mark.asyncio
+async def test_limit_async_fails_open_on_redis_error():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    broken = aioredis.FakeRedis(server=server)
+    assert await limit_user_async("999", broken) is True
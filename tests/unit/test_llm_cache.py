@@ -0,0 +1,63 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from common.llm_cache import ResponseCache
+from common.metrics import MetricsRegistry
+from common.services.llm import LLMClient
+
+MESSAGES = [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+
+
+def test_key_includes_prompt_version_and_params(tmp_path):
+    v1 = ResponseCache(tmp_path, version="1.1")
+    v2 = ResponseCache(tmp_path, version="1.2")
+    assert v1.key("gpt-4o-mini", MESSAGES, 0.7, 100) != v2.key("gpt-4o-mini", MESSAGES, 0.7, 100)
+    assert v1.key("gpt-4o-mini", MESSAGES, 0.7, 100) != v1.key("gpt-4o-mini", MESSAGES, 0.3, 100)
+    assert v1.key("gpt-4o-mini", MESSAGES, 0.7, 100) == v1.key("gpt-4o-mini", list(MESSAGES), 0.7, 100)
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    metrics = MetricsRegistry()
+    cache = ResponseCache(tmp_path, memory_entries=1, metrics=metrics)
+    cache.put("a" * 64, "first")
+    cache.put("b" * 64, "second")  # メモリからは "a" が追い出される
+    assert cache.get("b" * 64) == "second"
+    assert cache.get("a" * 64) == "first"
+    assert cache.get("c" * 64) is None
+    assert (cache.memory_hits, cache.disk_hits, cache.misses) == (1, 1, 1)
+    assert metrics.counter("tdd_llm_cache_requests_total", result="disk_hit") == 1
+
+    # 再起動後もディスクから読める
+    assert ResponseCache(tmp_path).get("b" * 64) == "second"
+
+
+def test_disk_eviction_by_size(tmp_path):
+    cache = ResponseCache(tmp_path, memory_entries=0, max_bytes=1000)
+    for i in range(5):
+        key = f"{i:064d}"
+        cache.put(key, "x" * 300)
+        os.utime(cache._path(key), (i, i))  # 書き込み順を更新時刻で明示
+    assert cache.stats()["disk_bytes"] <= 900
+    assert cache.evicted >= 2
+    assert cache.get(f"{4:064d}") == "x" * 300
+    assert cache.get(f"{0:064d}") is None
+
+
+@pytest.mark.asyncio
+async def test_llm_client_uses_cache(tmp_path):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content="answer")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    llm = LLMClient(client=client, cache=ResponseCache(tmp_path, version="1.2"))
+    results = [await llm.chat("system", "user", max_tokens=300) for _ in range(3)]
+    assert results == ["answer"] * 3
+    assert len(calls) == 1
+    await llm.chat("system", "user", max_tokens=2000)
+    assert len(calls) == 2
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+from common.services.llm import LLMClient
+
+
+class FakeCompletions:
+    """呼び出しごとに delay 秒待ってから応答する AsyncOpenAI 互換のスタブ"""
+    def __init__(self, delay):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        message = SimpleNamespace(content=f"# {kwargs['model']} {kwargs['max_tokens']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def fake_llm(delay):
+    completions = FakeCompletions(delay)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return LLMClient(client=client), completions
+
+
+@pytest.mark.asyncio
+async def test_concurrent_article_generation_overlaps():
+    from tdd_bot import TDDBot
+
+    llm, completions = fake_llm(0.2)
+    bot = SimpleNamespace(llm=llm)
+    bot.condense_content = partial(TDDBot.condense_content, bot)
+    start = time.perf_counter()
+    articles = await asyncio.gather(*(
+        TDDBot.generate_article(bot, f"content {i}", "prep") for i in range(5)
+    ))
+    elapsed = time.perf_counter() - start
+    # 短い入力には小さめの max_tokens を割り当てる
+    assert len(set(articles)) == 1
+    assert 1200 <= int(articles[0].split()[-1]) < 2000
+    assert completions.max_in_flight == 5
+    assert elapsed < 0.6  # 直列なら 1.0 秒以上
+
+
+def test_output_timeout_grows_with_max_tokens():
+    from tdd_bot import output_timeout
+
+    assert output_timeout(4000) > output_timeout(1200) > 30
+    assert output_timeout(4000) >= 4000 / 40  # 4000 トークンの記事でも 30 秒で打ち切らない
+
+
+@pytest.mark.asyncio
+async def test_chat_deadline():
+    llm, _ = fake_llm(1.0)
+    with pytest.raises(asyncio.TimeoutError):
+        await llm.chat("system", "user", timeout=0.05)
+
+
+@pytest.mark.asyncio
+async def test_streaming_reports_partial_text():
+    async def chunks():
+        for piece in ("# 見出し", "\n本文", "の続き"):
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=42))
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return chunks()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    partials = []
+    text = await LLMClient(client=client).chat("system", "user", on_text=partials.append)
+    assert text == "# 見出し\n本文の続き"
+    assert partials == ["# 見出し", "# 見出し\n本文", "# 見出し\n本文の続き"]
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+
+from common.llm_governor import QuotaExceeded, QuotaGovernor, estimate_tokens, parse_reset
+from common.metrics import MetricsRegistry
+from common.services.llm import LLMClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("日本語") == 3
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1.5s") == 1.5
+    assert parse_reset(None) is None
+
+
+@pytest.mark.asyncio
+async def test_sheds_when_request_quota_would_not_recover():
+    clock = FakeClock()
+    governor = QuotaGovernor("chat", rpm=2, max_wait=5, clock=clock)
+    await governor.acquire()
+    await governor.acquire()
+    with pytest.raises(QuotaExceeded):
+        await governor.acquire()  # 次の枠は30秒後
+    assert governor.shed == 1
+    clock.now += 30
+    await governor.acquire()
+
+
+@pytest.mark.asyncio
+async def test_token_budget_and_settle():
+    clock = FakeClock()
+    metrics = MetricsRegistry()
+    governor = QuotaGovernor("chat", rpm=100, tpm=1000, max_wait=5, metrics=metrics, clock=clock)
+    reserved = await governor.acquire(800)
+    assert governor.utilization()["tokens"] == pytest.approx(0.8)
+    with pytest.raises(QuotaExceeded):
+        await governor.acquire(800)
+    governor.settle(reserved, 100)  # 実使用量が少なければ差分を返却
+    await governor.acquire(800)
+    assert metrics.gauge("tdd_llm_quota_utilization", api="chat", quota="tokens") == pytest.approx(0.9)
+    assert metrics.counter("tdd_llm_quota_shed_total", api="chat") == 1
+
+
+@pytest.mark.asyncio
+async def test_headers_override_local_estimate():
+    clock = FakeClock()
+    governor = QuotaGovernor("chat", rpm=600, tpm=100000, max_wait=1, clock=clock)
+    governor.update_from_headers({
+        "x-ratelimit-limit-requests": "600",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "6s",
+    })
+    with pytest.raises(QuotaExceeded):
+        await governor.acquire(10)
+    clock.now += 6.2
+    await governor.acquire(10)
+
+
+@pytest.mark.asyncio
+async def test_llm_client_does_not_send_when_shed():
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content="ok")
+        usage = SimpleNamespace(total_tokens=50)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    governor = QuotaGovernor("chat", rpm=100, tpm=500, max_wait=0.1, clock=FakeClock())
+    llm = LLMClient(client=client, governor=governor)
+    assert await llm.chat("system", "user", max_tokens=300) == "ok"
+    with pytest.raises(QuotaExceeded):
+        await llm.chat("system", "x" * 4000, max_tokens=300)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_call_returns_reserved_tokens():
+    async def create(**kwargs):
+        raise RuntimeError("upstream error")
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    governor = QuotaGovernor("chat", rpm=100, tpm=1000, max_wait=0.1, clock=FakeClock())
+    llm = LLMClient(client=client, governor=governor)
+    with pytest.raises(RuntimeError):
+        await llm.chat("system", "user", max_tokens=300)
+    assert governor.utilization()["tokens"] == 0
+
+
+@pytest.mark.asyncio
+async def test_openai_service_error_response_returns_reserved_tokens(monkeypatch):
+    from common.services import openai_api
+
+    class Response:
+        status = 500
+        headers = {}
+
+        async def text(self):
+            return "internal error"
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(openai_api, "get_session", lambda: SimpleNamespace(post=lambda *a, **k: Response()))
+    governor = QuotaGovernor("chat", rpm=100, tpm=1000, max_wait=0.1, clock=FakeClock())
+    service = openai_api.OpenAIService(api_key="test", governor=governor)
+    result = await service._create_chat_completion("gpt-4o-mini", [{"role": "user", "content": "hi"}], max_tokens=300)
+    assert "500" in result
+    assert governor.utilization()["tokens"] == 0
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from common.llm_scheduler import LLMRequestContext, LLMScheduler, llm_request
+
+
+async def hold(scheduler, context, log, name, release):
+    async with scheduler.slot(context):
+        log.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_max_concurrency_and_priority_lanes():
+    scheduler = LLMScheduler(max_concurrency=1)
+    log, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(hold(scheduler, LLMRequestContext(), log, "first", release))]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(hold(scheduler, LLMRequestContext(interactive=False), log, "free_bg", release)))
+    tasks.append(asyncio.create_task(hold(scheduler, LLMRequestContext(), log, "free", release)))
+    tasks.append(asyncio.create_task(hold(scheduler, LLMRequestContext(premium=True), log, "premium", release)))
+    await asyncio.sleep(0)
+    assert log == ["first"]
+    assert scheduler.active == 1 and scheduler.waiting == 3
+    release.set()
+    await asyncio.gather(*tasks)
+    assert log == ["first", "premium", "free", "free_bg"]
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_guild_round_robin_and_positions():
+    scheduler = LLMScheduler(max_concurrency=1)
+    log, release = [], asyncio.Event()
+    positions = {}
+    blocker = asyncio.create_task(hold(scheduler, LLMRequestContext(), log, "blocker", release))
+    await asyncio.sleep(0)
+    tasks = []
+    for name, guild in (("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2)):
+        context = LLMRequestContext(guild_id=guild, on_position=lambda p, n=name: positions.setdefault(n, []).append(p))
+        tasks.append(asyncio.create_task(hold(scheduler, context, log, name, release)))
+        await asyncio.sleep(0)
+    # ギルド2の b1 は ギルド1 の a1 の次に回る
+    assert {name: p[-1] for name, p in positions.items()} == {"a1": 1, "a2": 3, "a3": 4, "b1": 2}
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    assert log == ["blocker", "a1", "b1", "a2", "a3"]
+    assert all(p[-1] == 0 for p in positions.values())
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+    log, release = [], asyncio.Event()
+    blocker = asyncio.create_task(hold(scheduler, LLMRequestContext(), log, "blocker", release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold(scheduler, LLMRequestContext(), log, "cancelled", release))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert scheduler.waiting == 0
+    release.set()
+    await blocker
+    assert scheduler.active == 0 and log == ["blocker"]
+
+
+@pytest.mark.asyncio
+async def test_context_propagates_to_tasks():
+    scheduler = LLMScheduler(max_concurrency=1)
+    seen = []
+
+    async def call():
+        async with scheduler.slot():
+            pass
+
+    with llm_request(premium=True, guild_id=42, on_position=seen.append):
+        await asyncio.create_task(call())
+    assert seen == [0]
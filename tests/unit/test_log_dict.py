@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+
+from common.log_dict import LogStructuredDict
+
+
+def _open(path, **kwargs):
+    return LogStructuredDict(str(path), threading.Lock(), **kwargs)
+
+
+def test_replay_snapshot_and_log(tmp_path):
+    path = tmp_path / "rate_limit.json"
+    path.write_text(json.dumps({"limit:1:2025-01-01": 3}), encoding="utf-8")
+    d = _open(path)
+    d["limit:1:2025-01-01"] = 4
+    d["processing:1"] = True
+    del d["processing:1"]
+    d.close()
+
+    restored = _open(path)
+    assert dict(restored) == {"limit:1:2025-01-01": 4}
+    restored.close()
+
+
+def test_torn_record_is_skipped(tmp_path):
+    path = tmp_path / "cache.json"
+    d = _open(path)
+    d["a"] = 1
+    d.close()
+    with open(f"{path}.log", "a", encoding="utf-8") as f:
+        f.write('["s","b",')
+
+    restored = _open(path)
+    assert dict(restored) == {"a": 1}
+    restored.close()
+
+
+def test_background_compaction(tmp_path):
+    path = tmp_path / "cache.json"
+    d = _open(path, compact_threshold=256)
+    for i in range(50):
+        d[f"k{i}"] = i
+    deadline = time.time() + 5
+    while d._compacting and time.time() < deadline:
+        time.sleep(0.01)
+    d.close()
+
+    assert json.loads(path.read_text(encoding="utf-8"))
+    restored = _open(path)
+    assert restored["k49"] == 49 and len(restored) == 50
+    restored.close()
+
+
+def test_group_commit(tmp_path):
+    path = tmp_path / "cache.json"
+    d = _open(path, group_commit_ms=20)
+    for i in range(10):
+        d[f"k{i}"] = i
+    d.close()
+
+    restored = _open(path)
+    assert len(restored) == 10
+    restored.close()
+
+
+def test_delete_many_appends_once(tmp_path):
+    path = tmp_path / "rate_limit.json"
+    d = _open(path)
+    for i in range(3):
+        d[f"limit:{i}:2025-01-01"] = i
+    appends = []
+    original = d._append
+    d._append = lambda *records: (appends.append(len(records)), original(*records))
+    assert d.delete_many(["limit:0:2025-01-01", "limit:2:2025-01-01", "missing"]) == 2
+    assert appends == [2]
+    d.close()
+
+    restored = _open(path)
+    assert dict(restored) == {"limit:1:2025-01-01": 1}
+    restored.close()
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+
+from common.longdoc import map_reduce, split_into_chunks
+
+
+def test_short_text_is_single_chunk():
+    assert split_into_chunks("  短い文章  ", 100) == ["短い文章"]
+    assert split_into_chunks("", 100) == []
+
+
+def test_split_prefers_headings_and_paragraphs():
+    sections = [f"# 見出し{i}\n\n" + "本文です。" * 30 for i in range(5)]
+    text = "\n".join(sections)
+    chunks = split_into_chunks(text, 200)
+    assert all(len(c) <= 200 for c in chunks)
+    # 見出しはチャンクの先頭に来る（途中で切られない）
+    for i in range(5):
+        assert any(c.startswith(f"# 見出し{i}") for c in chunks)
+
+
+def test_split_falls_back_to_sentences_and_characters():
+    text = "これは文です。" * 100
+    chunks = split_into_chunks(text, 50)
+    assert all(len(c) <= 50 for c in chunks)
+    assert all(c.endswith("。") for c in chunks)
+    assert "".join(chunks) == text
+
+    unbroken = "あ" * 120
+    assert split_into_chunks(unbroken, 50) == ["あ" * 50, "あ" * 50, "あ" * 20]
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_passthrough_without_calls():
+    async def summarize(chunk, index, total):
+        raise AssertionError("should not be called")
+
+    assert await map_reduce("短い", summarize, limit=100) == "短い"
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_keeps_order_and_bounds_concurrency():
+    text = "\n\n".join(f"段落{i}。" + "あ" * 90 for i in range(20))
+    running = peak = 0
+    progress = []
+
+    async def summarize(chunk, index, total):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"[{index}]"
+
+    result = await map_reduce(text, summarize, limit=200, concurrency=3,
+                              on_progress=lambda done, total: progress.append((done, total)))
+    notes = result.split("\n\n")
+    assert notes == [f"[{i}]" for i in range(len(notes))]
+    assert peak == 3
+    assert progress[0] == (0, len(notes))
+    assert progress[-1] == (len(notes), len(notes))
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_runs_chunks_in_parallel():
+    text = "\n\n".join("い" * 95 for _ in range(16))
+
+    async def summarize(chunk, index, total):
+        await asyncio.sleep(0.05)
+        return "要点"
+
+    start = time.perf_counter()
+    await map_reduce(text, summarize, limit=100, concurrency=16)
+    assert time.perf_counter() - start < 0.4  # 直列なら 0.8 秒
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_reduces_repeatedly():
+    text = "\n\n".join("う" * 90 for _ in range(30))
+    rounds = []
+
+    async def summarize(chunk, index, total):
+        rounds.append(total)
+        return "え" * 40
+
+    result = await map_reduce(text, summarize, limit=100)
+    assert len(result) <= 100
+    assert len(set(rounds)) > 1  # 要点をさらに縮める段があった
+
+
+def test_split_with_custom_measure():
+    from common.tokens import estimate_tokens
+
+    text = "English words only here. " * 40 + "日本語の文章です。" * 40
+    chunks = split_into_chunks(text, 60, measure=estimate_tokens)
+    assert all(estimate_tokens(c) <= 60 for c in chunks)
+    # 英語部分は文字数では長くてもトークン数では少ないのでチャンクが大きくなる
+    assert max(len(c) for c in chunks) > 60
+
+
+def test_hard_split_only_measures_a_bounded_prefix():
+    measured = []
+
+    def measure(text):
+        measured.append(len(text))
+        return len(text)
+
+    text = "x" * 200_000  # 区切りの無い長い文字列
+    chunks = split_into_chunks(text, 1000, measure=measure)
+    assert all(len(c) <= 1000 for c in chunks) and "".join(chunks) == text
+    # 区切りの段ごとの全体計測を除き、二分探索は残り全体ではなく先頭の一定範囲だけを数える
+    assert sum(1 for n in measured if n > 1000 * 8) <= 6
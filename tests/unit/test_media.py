@@ -0,0 +1,97 @@
+import os
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from common import media
+from common.media import ExtractionError, extract_audio_bytes, needs_seek
+
+
+def box(name: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), name) + payload
+
+
+def test_needs_seek_for_mp4_depends_on_moov_position():
+    faststart = box(b"ftyp", b"isom") + box(b"moov", b"x" * 20) + box(b"mdat", b"y" * 100)
+    trailing_index = box(b"ftyp", b"isom") + box(b"mdat", b"y" * 100) + box(b"moov", b"x" * 20)
+    assert not needs_seek(faststart, ".mp4")
+    assert needs_seek(trailing_index, ".MOV")
+    assert needs_seek(b"garbage", ".m4a")  # 判定できなければ安全側
+    assert not needs_seek(trailing_index, ".webm")  # MP4 系以外はストリームで読める
+
+
+class FakeProcess:
+    def __init__(self, returncode=0, stdout=b"OggS...", stderr=b""):
+        self.returncode = returncode
+        self._out = (stdout, stderr)
+        self.input = None
+
+    async def communicate(self, input=None):
+        self.input = input
+        return self._out
+
+
+@pytest.fixture
+def fake_exec(monkeypatch):
+    calls = []
+
+    def install(process):
+        async def create_subprocess_exec(*cmd, **kwargs):
+            calls.append((cmd, kwargs))
+            if cmd[cmd.index("-i") + 1] != "pipe:0":
+                assert os.path.exists(cmd[cmd.index("-i") + 1])
+            return process
+        monkeypatch.setattr(media.asyncio, "create_subprocess_exec", create_subprocess_exec)
+        return calls
+
+    return install
+
+
+@pytest.mark.asyncio
+async def test_pipe_mode_streams_bytes_through_ffmpeg(fake_exec):
+    process = FakeProcess(stdout=b"opus-audio")
+    calls = fake_exec(process)
+    stats = {}
+    audio = await extract_audio_bytes(b"webm-bytes", ".webm", stats=stats)
+    cmd, _ = calls[0]
+    assert audio == b"opus-audio"
+    assert process.input == b"webm-bytes"
+    assert cmd[cmd.index("-i") + 1] == "pipe:0"
+    assert cmd[-1] == "pipe:1" and "libopus" in cmd
+    assert stats == {"mode": "pipe", "disk_bytes": 0}
+
+
+@pytest.mark.asyncio
+async def test_seekable_container_falls_back_to_tempfile(fake_exec):
+    process = FakeProcess(stdout=b"mp3-audio")
+    calls = fake_exec(process)
+    data = box(b"ftyp") + box(b"mdat", b"y" * 10) + box(b"moov")
+    stats = {}
+    assert await extract_audio_bytes(data, ".mp4", audio_format="mp3", stats=stats) == b"mp3-audio"
+    cmd, _ = calls[0]
+    tmp_path = cmd[cmd.index("-i") + 1]
+    assert tmp_path.endswith(".mp4") and not os.path.exists(tmp_path)
+    assert process.input is None
+    assert stats == {"mode": "tempfile", "disk_bytes": len(data)}
+
+
+@pytest.mark.asyncio
+async def test_ffmpeg_failure_raises(fake_exec):
+    fake_exec(FakeProcess(returncode=1, stdout=b"", stderr=b"Invalid data"))
+    with pytest.raises(ExtractionError, match="Invalid data"):
+        await extract_audio_bytes(b"x", ".webm")
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+@pytest.mark.asyncio
+async def test_real_ffmpeg_extracts_opus(tmp_path):
+    video = tmp_path / "clip.webm"
+    subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+         "-f", "lavfi", "-i", "color=size=64x64:duration=3", "-shortest", str(video)],
+        check=True,
+    )
+    audio = await extract_audio_bytes(video.read_bytes(), ".webm")
+    assert audio.startswith(b"OggS")
@@ -0,0 +1,47 @@
+import pytest
+
+from common.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_quantiles_within_relative_error():
+    h = Histogram()
+    for ms in range(1, 1001):
+        h.observe(ms / 1000)
+    assert h.count == 1000
+    assert h.quantile(0.5) == pytest.approx(0.5, rel=0.04)
+    assert h.quantile(0.95) == pytest.approx(0.95, rel=0.04)
+    assert h.quantile(0.99) == pytest.approx(0.99, rel=0.04)
+    assert h.quantile(1.0) <= h.max
+
+
+def test_histogram_clamps_out_of_range():
+    h = Histogram(max_value=1.0)
+    h.observe(-1)
+    h.observe(10)
+    assert h.count == 2
+    assert h.quantile(1.0) == 10
+
+
+def test_timer_records_errors():
+    metrics = MetricsRegistry()
+    with metrics.timer("tdd_stage_seconds", stage="ok"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.timer("tdd_stage_seconds", stage="fail"):
+            raise RuntimeError
+    assert metrics.histogram("tdd_stage_seconds", stage="ok").count == 1
+    assert metrics.histogram("tdd_stage_seconds", stage="fail").count == 1
+    assert metrics.counter("tdd_stage_errors_total", stage="fail") == 1
+
+
+def test_render_prometheus():
+    metrics = MetricsRegistry()
+    metrics.describe("tdd_calls_total", "Calls")
+    metrics.inc("tdd_calls_total", call='say "hi"')
+    metrics.observe("tdd_latency_seconds", 0.25, stage="extract")
+    text = metrics.render_prometheus()
+    assert "# HELP tdd_calls_total Calls" in text
+    assert 'tdd_calls_total{call="say \\"hi\\""} 1' in text
+    assert "# TYPE tdd_latency_seconds summary" in text
+    assert 'tdd_latency_seconds{stage="extract",quantile="0.95"}' in text
+    assert 'tdd_latency_seconds_count{stage="extract"} 1' in text
@@ -0,0 +1,48 @@
+import json
+import os
+from types import SimpleNamespace
+
+from common.services.auth import EntitlementCache, PaymentServiceV2, _FileChangeHandler
+
+
+def test_is_paid_is_served_from_cache(tmp_path):
+    payment = PaymentServiceV2(str(tmp_path), watch=False)
+    payment.set_paid(1)
+    os.unlink(tmp_path / "1.json")
+    assert payment.is_paid(1) is True
+    assert payment.cache.hits == 1
+
+
+def test_external_change_invalidates_entry(tmp_path):
+    payment = PaymentServiceV2(str(tmp_path), watch=False)
+    payment.set_paid(1)
+    path = tmp_path / "1.json"
+    path.write_text(json.dumps({"paid": False}), encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    payment._on_file_change(str(path))
+    assert payment.is_paid(1) is False
+
+
+def test_own_write_keeps_cache(tmp_path):
+    payment = PaymentServiceV2(str(tmp_path), watch=False)
+    payment.set_free(1)
+    payment._on_file_change(str(tmp_path / "1.json"))
+    assert payment.is_paid(1) is False
+    assert payment.cache.misses == 0
+
+
+def test_cache_is_bounded():
+    cache = EntitlementCache(max_size=2)
+    for i in range(3):
+        cache.put(str(i), {"paid": True})
+    assert len(cache._data) == 2
+    assert "0" not in cache._data
+
+
+def test_watch_handler_ignores_other_files(tmp_path):
+    changed = []
+    handler = _FileChangeHandler(changed.append, filenames={"payment_db.json"})
+    for name in ("bot.log", "payment_db.json"):
+        handler.on_any_event(SimpleNamespace(is_directory=False, src_path=str(tmp_path / name)))
+    assert changed == [str(tmp_path / "payment_db.json")]
+
@@ -0,0 +1,118 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+from common.pdf_extract import PDFExtractionError, PDFExtractor, count_pages, extract_pages
+
+
+def make_pdf(pages: list[str]) -> bytes:
+    """ページごとに1行のテキストを持つ最小限の PDF を組み立てる"""
+    count = len(pages)
+    font_id = 3 + 2 * count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>"
+         % (" ".join(f"{3 + 2 * i} 0 R" for i in range(count)), count)).encode(),
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(
+            (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+             f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>").encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class ScriptExtractor(PDFExtractor):
+    """ワーカーの代わりに、同じ上限を設定してから script を実行するプロセスを起動する"""
+
+    def __init__(self, script, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+
+    def _command(self, *args):
+        return [sys.executable, "-c",
+                f"from common.pdf_extract import _apply_limits; _apply_limits({self.cpu_seconds}, {self.memory_bytes})\n"
+                + self.script]
+
+
+def test_worker_functions_count_and_slice_pages(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf([f"Page {i}" for i in range(5)]))
+    assert count_pages(str(path)) == 5
+    texts = extract_pages(str(path), 2, 4)
+    assert [t.strip() for t in texts] == ["Page 2", "Page 3"]
+
+
+@pytest.mark.asyncio
+async def test_extract_keeps_page_order_across_jobs():
+    extractor = PDFExtractor(workers=2, pages_per_job=3, cpu_seconds=30)
+    result = await extractor.extract(make_pdf([f"Page {i}" for i in range(10)]))
+    assert result.complete and result.total_pages == 10
+    assert [line for line in result.text.split() if line != "Page"] == [str(i) for i in range(10)]
+
+
+@pytest.mark.asyncio
+async def test_extract_stops_once_budget_is_reached():
+    extractor = PDFExtractor(workers=1, pages_per_job=2, cpu_seconds=30)
+    result = await extractor.extract(make_pdf([f"Page {i}" for i in range(10)]), limit=15)
+    assert not result.complete
+    assert result.pages_read == 2
+    assert "Page 1" in result.text and "Page 2" not in result.text
+
+
+@pytest.mark.asyncio
+async def test_cpu_limit_kills_only_that_job():
+    spinning = ScriptExtractor("while True: pass", workers=1, cpu_seconds=1)
+    extractor = PDFExtractor(workers=1, pages_per_job=2, cpu_seconds=30)
+    failed, result = await asyncio.gather(
+        spinning._run("pages"),
+        extractor.extract(make_pdf(["Page 0", "Page 1", "Page 2"])),
+        return_exceptions=True,
+    )
+    assert isinstance(failed, PDFExtractionError)
+    assert result.complete and "Page 2" in result.text  # 他の文書の抽出は影響を受けない
+
+
+@pytest.mark.asyncio
+async def test_memory_limit_raises_extraction_error():
+    extractor = ScriptExtractor(
+        "import sys\ntry:\n    bytearray(512 * 1024 * 1024)\nexcept MemoryError:\n    sys.exit(3)",
+        workers=1, cpu_seconds=30, memory_bytes=256 * 1024 * 1024,
+    )
+    with pytest.raises(PDFExtractionError, match="メモリ"):
+        await extractor._run("pages")
+
+
+@pytest.mark.asyncio
+async def test_hung_worker_is_killed_on_timeout(tmp_path):
+    marker = tmp_path / "alive"
+    extractor = ScriptExtractor(
+        f"import time\nwhile True:\n    open({str(marker)!r}, 'w').close(); time.sleep(0.1)",
+        workers=1, cpu_seconds=30, timeout=0.5,
+    )
+    with pytest.raises(PDFExtractionError, match="処理時間"):
+        await extractor._run("pages")
+    marker.unlink(missing_ok=True)
+    time.sleep(0.3)
+    assert not marker.exists()  # プロセスは終了している
+
+
+@pytest.mark.asyncio
+async def test_corrupt_pdf_raises_extraction_error():
+    with pytest.raises(PDFExtractionError):
+        await PDFExtractor(workers=1).extract(b"not a pdf")
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from common.progress import ThrottledEditor, preview_tail
+
+
+def test_preview_tail():
+    assert preview_tail("abc", 5) == "abc"
+    assert preview_tail("abcdefgh", 5) == "…efgh"
+
+
+@pytest.mark.asyncio
+async def test_updates_are_coalesced_and_throttled():
+    edits = []
+
+    async def edit(value):
+        edits.append((asyncio.get_running_loop().time(), value))
+
+    editor = ThrottledEditor(edit, min_interval=0.1)
+    for i in range(50):
+        editor.update(i)
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(0.15)
+    await editor.aclose(final="done")
+
+    values = [v for _, v in edits]
+    assert values[0] == 0 and values[-1] == "done"
+    assert 49 in values  # 最後の途中経過は必ず反映される
+    assert len(edits) <= 6  # 約0.25秒間で 0.1秒間隔
+    gaps = [b[0] - a[0] for a, b in zip(edits, edits[1:-1])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+@pytest.mark.asyncio
+async def test_edit_failures_do_not_propagate():
+    async def edit(value):
+        raise RuntimeError("rate limited")
+
+    editor = ThrottledEditor(edit, min_interval=0)
+    editor.update("x")
+    await asyncio.sleep(0.01)
+    await editor.aclose(final="y")
+    assert editor.edits == 0
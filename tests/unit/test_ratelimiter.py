@@ -0,0 +1,58 @@
+import pytest
+
+from common.ratelimit import RateLimiter, DAY_SECONDS
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_burst_and_refill():
+    clock = FakeClock()
+    limiter = RateLimiter(policies={"write": {"burst": 2, "refill_per_sec": 1.0, "daily": 100}}, clock=clock)
+    assert await limiter.check(1, "write") is True
+    assert await limiter.check(1, "write") is True
+    assert await limiter.check(1, "write") is False
+    clock.now += 1
+    assert await limiter.check(1, "write") is True
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_daily_cap():
+    clock = FakeClock()
+    limiter = RateLimiter(policies={"write": {"burst": 10, "refill_per_sec": 10.0, "daily": 3}}, clock=clock)
+    for _ in range(3):
+        assert await limiter.check(1, "write") is True
+    assert await limiter.check(1, "write") is False
+    # 翌日0時を過ぎた直後は前日分の重みがほぼ残る
+    clock.now += DAY_SECONDS - clock.now % DAY_SECONDS + 1
+    assert await limiter.check(1, "write") is False
+    clock.now += DAY_SECONDS
+    assert await limiter.check(1, "write") is True
+
+
+@pytest.mark.asyncio
+async def test_features_and_members_are_independent():
+    limiter = RateLimiter(policies={"default": {"burst": 1, "refill_per_sec": 0.0, "daily": 10}})
+    assert await limiter.check(1, "a") is True
+    assert await limiter.check(1, "a") is False
+    assert await limiter.check(1, "b") is True
+    assert await limiter.check(2, "a") is True
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(tmp_path):
+    db = str(tmp_path / "rate.db")
+    policies = {"write": {"burst": 1, "refill_per_sec": 0.0, "daily": 10}}
+    limiter = RateLimiter(db_path=db, policies=policies)
+    assert await limiter.check(1, "write") is True
+    await limiter.close()
+
+    restarted = RateLimiter(db_path=db, policies=policies)
+    assert await restarted.check(1, "write") is False
+    await restarted.close()
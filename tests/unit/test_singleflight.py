@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from common.metrics import MetricsRegistry
+from common.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_execution():
+    metrics = MetricsRegistry()
+    flight = SingleFlight(metrics=metrics)
+    calls = 0
+
+    async def transcribe():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "transcript"
+
+    results = await asyncio.gather(*(flight.do(("transcribe", 1), transcribe) for _ in range(10)))
+    assert results == ["transcript"] * 10
+    assert calls == 1
+    assert (flight.executed, flight.shared) == (1, 9)
+    assert len(flight) == 0
+    assert metrics.counter("tdd_singleflight_calls_total", operation="transcribe", result="shared") == 9
+
+
+@pytest.mark.asyncio
+async def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    assert await asyncio.gather(flight.do(("op", 1), lambda: work(1)), flight.do(("op", 2), lambda: work(2))) == [1, 2]
+    assert await flight.do(("op", 1), lambda: work(1)) == 1  # 完了後は再実行される
+    assert calls == [1, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_exception_is_delivered_to_all_waiters():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert "k" not in flight
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.create_task(flight.do("k", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("k", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.asyncio
+async def test_only_the_executing_reaction_is_charged(monkeypatch):
+    import tdd_bot
+    from tdd_bot import TDDBot
+
+    charged, posted = [], []
+
+    async def limit_user_async(user_id, redis_client=None):
+        charged.append(user_id)
+        return True
+
+    async def transcribe_and_post(channel, attachment, file_type):
+        await asyncio.sleep(0.05)
+        posted.append(attachment.id)
+
+    monkeypatch.setattr(tdd_bot, "limit_user_async", limit_user_async)
+    bot = type("Bot", (), {})()
+    bot.inflight = SingleFlight()
+    bot.redis_client = None
+    bot.transcribe_and_post = transcribe_and_post
+    attachment = type("Attachment", (), {"id": 42})()
+
+    await asyncio.gather(*(
+        TDDBot.request_transcription(bot, None, attachment, "audio", user_id, True) for user_id in (1, 2, 3)
+    ))
+    assert charged == ["1"]  # 合流した 2, 3 は利用回数を消費しない
+    assert posted == [42]
+
+
+@pytest.mark.asyncio
+async def test_rejected_leader_does_not_drop_follower(monkeypatch):
+    import tdd_bot
+    from tdd_bot import TDDBot, UsageLimitExceeded
+
+    sent, posted = [], []
+
+    async def limit_user_async(user_id, redis_client=None):
+        raise UsageLimitExceeded("本日の利用上限に達しました")
+
+    async def transcribe_and_post(channel, attachment, file_type):
+        await asyncio.sleep(0.05)
+        posted.append(attachment.id)
+
+    class Channel:
+        async def send(self, content):
+            sent.append(content)
+
+    monkeypatch.setattr(tdd_bot, "limit_user_async", limit_user_async)
+    bot = type("Bot", (), {})()
+    bot.inflight = SingleFlight()
+    bot.redis_client = None
+    bot.transcribe_and_post = transcribe_and_post
+    attachment = type("Attachment", (), {"id": 42})()
+
+    await asyncio.gather(
+        TDDBot.request_transcription(bot, Channel(), attachment, "audio", 1, True),   # 上限超過
+        TDDBot.request_transcription(bot, Channel(), attachment, "audio", 2, False),  # Premium
+    )
+    assert sent == ["<@1> ⚠️ 本日の利用上限に達しました"]
+    assert posted == [42]  # 断られた人がいても Premium ユーザーには届く
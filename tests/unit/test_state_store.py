@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from common.state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = StateStore(str(tmp_path / "state.db"))
+    yield s
+    s.close()
+
+
+def test_incr_if_below_enforces_limit(store):
+    expires_at = time.time() + 60
+    for i in range(5):
+        assert store.incr_if_below("limit:1:2025-01-01", 5, expires_at) == (True, i + 1)
+    assert store.incr_if_below("limit:1:2025-01-01", 5, expires_at) == (False, 5)
+
+
+def test_expired_counter_restarts(store):
+    store.incr_if_below("limit:1:2025-01-01", 5, time.time() - 1)
+    assert store.get_counter("limit:1:2025-01-01") == 0
+    assert store.incr_if_below("limit:1:2025-01-01", 5, time.time() + 60) == (True, 1)
+
+
+def test_flags_are_shared_between_connections(tmp_path):
+    a = StateStore(str(tmp_path / "state.db"))
+    b = StateStore(str(tmp_path / "state.db"))
+    assert a.acquire_flag("processing:1") is True
+    assert b.acquire_flag("processing:1") is False
+    a.release_flag("processing:1")
+    assert b.acquire_flag("processing:1") is True
+    a.close(); b.close()
+
+
+def test_async_wrappers_run_in_executor(store):
+    async def main():
+        await store.aset_email("last_email:1:bot", {"subject": "s"})
+        return await store.aget_email("last_email:1:bot")
+    assert asyncio.run(main()) == {"subject": "s"}
+
+
+def test_migrate_from_json_once(store, tmp_path):
+    rate = tmp_path / "rate_limit.json"
+    email = tmp_path / "email_history.json"
+    rate.write_text(json.dumps({"limit:1:2999-01-01": 3, "processing:1": True}), encoding="utf-8")
+    email.write_text(json.dumps({"last_email:1:bot": {"subject": "s"}}), encoding="utf-8")
+
+    assert store.migrate_from_json(str(rate), str(email)) is True
+    assert store.get_counter("limit:1:2999-01-01") == 3
+    assert store.has_flag("processing:1") is False
+    assert store.get_email("last_email:1:bot") == {"subject": "s"}
+    assert store.migrate_from_json(str(rate), str(email)) is False
+
+
+def test_migrate_replays_log_backend_updates(store, tmp_path):
+    rate = tmp_path / "rate_limit.json"
+    rate.write_text(json.dumps({"limit:1:2999-01-01": 1, "limit:2:2999-01-01": 4}), encoding="utf-8")
+    # 前回の圧縮以降に LogStructuredDict が追記した更新
+    (tmp_path / "rate_limit.json.log").write_text(
+        '["s","limit:1:2999-01-01",2]\n["d","limit:2:2999-01-01"]\n["s","limit:3:2999-01-01",5]\n',
+        encoding="utf-8",
+    )
+    assert store.migrate_from_json(str(rate), str(tmp_path / "missing.json")) is True
+    assert store.get_counter("limit:1:2999-01-01") == 2
+    assert store.get_counter("limit:2:2999-01-01") == 0
+    assert store.get_counter("limit:3:2999-01-01") == 5
+
+
+def test_concurrent_migration_runs_once(tmp_path):
+    rate = tmp_path / "rate_limit.json"
+    rate.write_text(json.dumps({"limit:1:2999-01-01": 3}), encoding="utf-8")
+    a = StateStore(str(tmp_path / "state.db"))
+    b = StateStore(str(tmp_path / "state.db"))
+    conn = b._conn()
+
+    class StaleCheck:
+        """b の事前チェックが a の移行前に行われた状況を再現（最初の確認だけ未移行に見える）"""
+        checked = False
+
+        def execute(self, sql, *args):
+            if "json_migrated" in sql and sql.startswith("SELECT") and not self.checked:
+                self.checked = True
+                return conn.execute("SELECT 1 WHERE 0")
+            return conn.execute(sql, *args)
+
+    b._conn = lambda proxy=StaleCheck(): proxy
+    assert a.migrate_from_json(str(rate), str(tmp_path / "none.json")) is True
+    assert b.migrate_from_json(str(rate), str(tmp_path / "none.json")) is False
+    a.close(); b.close()
+
+
+def test_purge_expired(store):
+    store.incr_if_below("limit:1:2025-01-01", 5, time.time() - 1)
+    store.incr_if_below("limit:1:2999-01-01", 5, time.time() + 60)
+    store.acquire_flag("processing:1")
+    assert store.purge_expired(flag_ttl=3600) == (1, 0)
+    assert store.purge_expired(flag_ttl=-1) == (0, 1)
@@ -0,0 +1,40 @@
+from common.telemetry import MinuteRollup, RateLimitTelemetry, RingBuffer, TopK
+
+
+def test_ring_buffer_keeps_latest():
+    ring = RingBuffer(3)
+    for i in range(5):
+        ring.append(i)
+    assert len(ring) == 3
+    assert ring.latest(5) == [4, 3, 2]
+
+
+def test_topk_is_bounded_and_keeps_heavy_hitters():
+    top = TopK(3)
+    for _ in range(50):
+        top.add("heavy")
+    for i in range(100):
+        top.add(f"user{i}")
+    assert len(top.top(10)) == 3
+    assert top.top(1)[0][0] == "heavy"
+
+
+def test_minute_rollup_separates_days_and_drops_old():
+    rollup = MinuteRollup()
+    day = 86400
+    now = 10 * day + 5 * 3600 + 90
+    rollup.add(now - day)          # 24時間前の同時刻: 集計対象外
+    rollup.add(now)
+    rollup.add(now - 60)
+    rollup.add(now - 3600)
+    hours = rollup.hourly(now)
+    assert hours == {10 * day + 5 * 3600: 2, 10 * day + 4 * 3600: 1}
+
+
+def test_telemetry_record():
+    telemetry = RateLimitTelemetry(recent_size=2)
+    for i in range(3):
+        telemetry.record(i, "insert", {"retry_after": 1}, now=1000.0 + i)
+    assert telemetry.total == 3
+    assert [e["user_id"] for e in telemetry.recent.latest(5)] == [2, 1]
+    assert telemetry.commands.top(1) == [("insert", 3)]
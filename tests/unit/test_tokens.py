@@ -0,0 +1,57 @@
+import pytest
+
+from common import tokens
+from common.tokens import TokenBudget, count_message_tokens, count_tokens, estimate_tokens, truncate_to_tokens
+
+
+@pytest.fixture(autouse=True)
+def offline_estimate(monkeypatch):
+    # エンコーディングの有無で結果が変わらないよう概算で固定
+    monkeypatch.setattr(tokens, "_encoding", lambda model: None)
+
+
+def test_japanese_counts_more_than_characters_per_four():
+    assert count_tokens("abcd" * 10) == 10
+    assert count_tokens("日本語") == 3
+    assert count_tokens("") == 0
+    assert estimate_tokens("日本語abcd") == 4
+
+
+def test_message_tokens_include_overhead():
+    messages = [{"role": "system", "content": "abcd"}, {"role": "user", "content": None}]
+    assert count_message_tokens(messages) == 1 + 4 + 0 + 4 + 3
+
+
+def test_truncate_to_tokens_is_longest_fitting_prefix():
+    text = "あいうえお" * 10
+    assert truncate_to_tokens(text, 7) == "あいうえおあい"
+    assert truncate_to_tokens("short", 10) == "short"
+    mixed = "abcdefgh日本"
+    assert truncate_to_tokens(mixed, 3) == "abcdefgh日"
+
+
+def test_fit_appends_marker_within_budget():
+    budget = TokenBudget(input_tokens=20)
+    text = "本文" * 50
+    fitted = budget.fit(text, marker="…省略")
+    assert fitted.endswith("…省略")
+    assert budget.count(fitted) <= 20
+    assert budget.fit("短い") == "短い"
+
+
+def test_max_tokens_respects_context_and_output_caps():
+    budget = TokenBudget(context_tokens=1000, max_output_tokens=500)
+    small = [{"role": "user", "content": "a" * 40}]
+    assert budget.max_tokens(small, 300) == 300
+    assert budget.max_tokens(small, 5000) == 500
+    big = [{"role": "user", "content": "あ" * 900}]
+    assert budget.max_tokens(big, 300) == 1000 - count_message_tokens(big)
+    huge = [{"role": "user", "content": "あ" * 2000}]
+    assert budget.max_tokens(huge, 300, floor=64) == 64
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_INPUT_TOKENS", "1234")
+    monkeypatch.setenv("LLM_CONTEXT_TOKENS", "8000")
+    budget = TokenBudget.from_env()
+    assert (budget.input_tokens, budget.context_tokens) == (1234, 8000)
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from common import transcription
+from common.transcription import TranscriptionEngine, merge_transcripts, parse_silences, plan_segments
+
+SILENCEDETECT_OUTPUT = """\
+[silencedetect @ 0x1] silence_start: -0.01
+[silencedetect @ 0x1] silence_end: 1.2 | silence_duration: 1.21
+size=N/A time=00:05:00.00 bitrate=N/A speed= 900x
+[silencedetect @ 0x1] silence_start: 290.5
+[silencedetect @ 0x1] silence_end: 291.5 | silence_duration: 1
+[silencedetect @ 0x1] silence_start: 598
+"""
+
+
+def test_parse_silences():
+    assert parse_silences(SILENCEDETECT_OUTPUT, duration=600) == [(0.0, 1.2), (290.5, 291.5), (598.0, 600)]
+    assert parse_silences(SILENCEDETECT_OUTPUT) == [(0.0, 1.2), (290.5, 291.5)]
+
+
+def test_plan_segments_cuts_at_silence_near_target():
+    segments = plan_segments(1000, [(10, 11), (290, 292), (640, 642), (900, 901)], target=300)
+    assert segments == [(0.0, 291.0), (291.0, 641.0), (641.0, 1000)]
+
+
+def test_plan_segments_overlaps_hard_cuts():
+    segments = plan_segments(1000, [], target=300, overlap=2)
+    assert segments == [(0.0, 450.0), (448.0, 898.0), (896.0, 1000)]
+    assert plan_segments(100, [], target=300) == [(0.0, 100)]
+
+
+def test_merge_transcripts_removes_overlap():
+    assert merge_transcripts(["今日は会議を始めます。議題は予算", "議題は予算についてです。", ""]) == "今日は会議を始めます。議題は予算についてです。"
+    assert merge_transcripts(["hello world", "and more"]) == "hello world and more"
+    assert merge_transcripts(["first part of the", "of the second"]) == "first part of the second"
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch, tmp_path):
+    cuts = []
+
+    async def probe(path):
+        return 1000.0
+
+    async def silences(path, duration=None):
+        return [(290, 292), (640, 642)]
+
+    async def cut(path, start, end, output_path, bitrate="32k"):
+        cuts.append((start, end))
+        with open(output_path, "w") as f:
+            f.write(f"{start}-{end}")
+
+    monkeypatch.setattr(transcription, "probe_duration", probe)
+    monkeypatch.setattr(transcription, "detect_silences", silences)
+    monkeypatch.setattr(transcription, "cut_segment", cut)
+    source = tmp_path / "meeting.wav"
+    source.write_bytes(b"0" * 100)
+    return str(source), cuts
+
+
+@pytest.mark.asyncio
+async def test_engine_transcribes_segments_concurrently_in_order(fake_ffmpeg):
+    path, cuts = fake_ffmpeg
+    running = peak = 0
+
+    async def whisper(segment_path):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        with open(segment_path) as f:
+            span = f.read()
+        # 後の区間ほど早く終わるようにしても順番どおりに連結される
+        await asyncio.sleep(0.05 if span.startswith("0") else 0.01)
+        running -= 1
+        return f"[{span}]"
+
+    progress = []
+    engine = TranscriptionEngine(whisper, max_workers=2, segment_seconds=300)
+    text = await engine.transcribe_file(path, on_progress=lambda done, total: progress.append((done, total)))
+    assert text == "[0.0-291.0] [291.0-641.0] [641.0-1000.0]"
+    assert len(cuts) == 3
+    assert peak == 2
+    assert progress[0] == (0, 3) and progress[-1] == (3, 3)
+
+
+@pytest.mark.asyncio
+async def test_engine_short_audio_is_sent_as_is(fake_ffmpeg, monkeypatch):
+    path, cuts = fake_ffmpeg
+
+    async def probe(p):
+        return 60.0
+
+    monkeypatch.setattr(transcription, "probe_duration", probe)
+    sent = []
+
+    async def whisper(p):
+        sent.append(p)
+        return "short"
+
+    assert await TranscriptionEngine(whisper).transcribe_file(path) == "short"
+    assert sent == [path] and cuts == []
+
+
+@pytest.mark.asyncio
+async def test_engine_failure_cancels_remaining_segments(fake_ffmpeg):
+    path, _ = fake_ffmpeg
+    finished = []
+
+    async def whisper(segment_path):
+        if segment_path.endswith("0000.mp3"):
+            raise RuntimeError("whisper failed")
+        await asyncio.sleep(0.2)
+        finished.append(segment_path)
+        return "ok"
+
+    with pytest.raises(RuntimeError):
+        await TranscriptionEngine(whisper, max_workers=3, segment_seconds=300).transcribe_file(path)
+    assert finished == []